@@ -0,0 +1,197 @@
+"""
+CLI de administración: corre trabajos de mantenimiento sobre la capa de servicios sin Streamlit.
+
+Uso:
+    python admin.py migrar
+    python admin.py totales [--marca VETA] [--desde 2025-01-01] [--hasta 2025-02-01] [--ids 10 11] [--dry-run]
+    python admin.py rollups [--marca VETA] [--desde 2024-01-01] [--hasta 2025-01-01] [--dry-run]
+    python admin.py reconciliar-stock [--corregir]
+    python admin.py exportar ventas ventas.csv
+    python admin.py importar stock stock.csv
+    python admin.py importar-sheets VETA [--spreadsheet-id ID] [--bloque 5000]
+    python admin.py sincronizar-ventas
+
+Usa la misma configuración de base de datos que la app (DB_URL_POSTGRES en
+.streamlit/secrets.toml o en el entorno).
+"""
+import argparse
+import sys
+import time
+from datetime import date
+
+def _log(msg: str):
+    print(msg, flush=True)
+
+def _progreso(etiqueta: str):
+    inicio = time.monotonic()
+    def informar(filas: int):
+        _log(f"  {etiqueta}: {filas:,} filas ({time.monotonic() - inicio:.1f}s)")
+    return informar
+
+def _fecha(valor: str) -> date:
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha inválida '{valor}' (formato AAAA-MM-DD)")
+
+def cmd_migrar(args):
+    from src.services.postgres_service import init_db
+    init_db()
+    _log("Esquema e índices al día.")
+
+def _imprimir_diferencias(diferencias, limite=20):
+    for d in diferencias[:limite]:
+        _log(f"    #{d['id']} {d['fecha'][:10]} {d['cliente']}: "
+             f"bruto {d['bruto_anterior']} -> {d['bruto_calc']}, neto {d['neto_anterior']} -> {d['neto_calc']}")
+    if len(diferencias) > limite:
+        _log(f"    ... y {len(diferencias) - limite} más")
+
+def cmd_totales(args):
+    from src.services.postgres_service import recalcular_totales_ventas
+    res = recalcular_totales_ventas(
+        marca=args.marca,
+        desde=args.desde.isoformat() if args.desde else None,
+        hasta=args.hasta.isoformat() if args.hasta else None,
+        ids=args.ids,
+        dry_run=args.dry_run,
+    )
+    _imprimir_diferencias(res['diferencias'])
+    if args.dry_run:
+        _log(f"{len(res['diferencias'])} ventas con diferencias (dry-run, sin cambios).")
+    else:
+        _log(f"{res['cambiadas']} ventas corregidas.")
+
+def cmd_rollups(args):
+    from src.services.mantenimiento_service import analizar_tablas, rango_ventas, recalcular_totales_por_mes
+    rango = rango_ventas()
+    if rango is None:
+        _log("No hay ventas.")
+        return
+    desde = args.desde or rango[0]
+    hasta = args.hasta or rango[1]
+
+    total = 0
+    for mes, res in recalcular_totales_por_mes(desde, hasta, marca=args.marca, dry_run=args.dry_run):
+        n = len(res['diferencias'])
+        total += n
+        _log(f"  {mes:%Y-%m}: {n} ventas {'con diferencias' if args.dry_run else 'corregidas'}")
+
+    if not args.dry_run:
+        analizar_tablas()
+        _log("Estadísticas actualizadas (ANALYZE).")
+    _log(f"Total: {total} ventas {'con diferencias' if args.dry_run else 'corregidas'}.")
+
+def cmd_reconciliar_stock(args):
+    from src.services.mantenimiento_service import reconciliar_stock
+    res = reconciliar_stock(corregir=args.corregir)
+
+    for p in res['stock_negativo']:
+        _log(f"  Stock negativo: #{p['id']} {p['codigo']} {p['nombre']} ({p['marca']}): {p['cantidad']}")
+    for d in res['concesion_duplicada']:
+        _log(f"  Concesión duplicada: {d['nombre_socio']} / producto {d['producto_id']}: "
+             f"{d['filas']} filas {d['ids']}, total {d['total']:g}")
+    for c in res['concesion_negativa']:
+        _log(f"  Concesión negativa: {c['nombre_socio']} / producto {c['producto_id']}: {c['cantidad_disponible']:g}")
+    _log(f"  Items con marca distinta a su venta: {len(res['marca_items'])}")
+
+    if args.corregir:
+        _log(f"Corregido: {len(res['concesion_duplicada'])} duplicados fusionados, "
+             f"{len(res['marca_items'])} items con marca alineada. Los negativos solo se informan.")
+    else:
+        _log("Sin cambios (use --corregir para fusionar duplicados y alinear marcas).")
+
+def cmd_exportar(args):
+    from src.services.mantenimiento_service import exportar_tabla
+    with open(args.archivo, "w", newline="", encoding="utf-8") as f:
+        filas = exportar_tabla(args.tabla, f, progreso=_progreso(args.tabla))
+    _log(f"{filas:,} filas de '{args.tabla}' exportadas a {args.archivo}.")
+
+def cmd_importar(args):
+    from src.services.mantenimiento_service import importar_tabla
+    with open(args.archivo, "r", newline="", encoding="utf-8") as f:
+        filas = importar_tabla(args.tabla, f, progreso=_progreso(args.tabla))
+    _log(f"{filas:,} filas importadas en '{args.tabla}'.")
+
+def cmd_importar_sheets(args):
+    from src.services.mantenimiento_service import importar_desde_sheets
+    progresos = {}
+    def informar(tabla, filas):
+        progresos.setdefault(tabla, _progreso(tabla))(filas)
+    res = importar_desde_sheets(args.marca, spreadsheet_id=args.spreadsheet_id,
+                                tamano_bloque=args.bloque, progreso=informar)
+    for tabla, filas in res.items():
+        _log(f"  {tabla}: {filas:,} filas")
+    _log(f"Planilla importada como marca {args.marca}; secuencias sincronizadas.")
+
+def cmd_sincronizar_ventas(args):
+    from src.services.diario_ventas import CONFLICTO, SincronizadorVentas, leer_ventas
+    sinc = SincronizadorVentas(iniciar=False)
+    while sinc.sincronizar():
+        pass
+    m = sinc.metricas()
+    for c in leer_ventas(CONFLICTO):
+        _log(f"  Conflicto P-{c['numero']} ({c['creada'][:16]}, {c['cliente']}): {c['error']}")
+    _log(f"{m['sincronizadas']} ventas sincronizadas, {m['conflictos']} en conflicto, {m['pendientes']} pendientes.")
+
+def build_parser() -> argparse.ArgumentParser:
+    from src.services.mantenimiento_service import TABLAS
+
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de Ventas Veta (sin Streamlit).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("migrar", help="Crea/actualiza tablas e índices (init_db).")
+    p.set_defaults(func=cmd_migrar)
+
+    p = sub.add_parser("totales", help="Recalcula total_bruto/total_neto desde los items.")
+    p.add_argument("--marca")
+    p.add_argument("--desde", type=_fecha, help="Fecha inicial (incluida), AAAA-MM-DD")
+    p.add_argument("--hasta", type=_fecha, help="Fecha final (excluida), AAAA-MM-DD")
+    p.add_argument("--ids", type=int, nargs="+", help="IDs de venta")
+    p.add_argument("--dry-run", action="store_true", help="Solo listar diferencias")
+    p.set_defaults(func=cmd_totales)
+
+    p = sub.add_parser("rollups", help="Recalcula los totales guardados mes a mes y actualiza estadísticas.")
+    p.add_argument("--marca")
+    p.add_argument("--desde", type=_fecha)
+    p.add_argument("--hasta", type=_fecha)
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_rollups)
+
+    p = sub.add_parser("reconciliar-stock", help="Detecta (y opcionalmente corrige) inconsistencias de stock.")
+    p.add_argument("--corregir", action="store_true")
+    p.set_defaults(func=cmd_reconciliar_stock)
+
+    p = sub.add_parser("exportar", help="Exporta una tabla a CSV (COPY en streaming).")
+    p.add_argument("tabla", choices=TABLAS)
+    p.add_argument("archivo")
+    p.set_defaults(func=cmd_exportar)
+
+    p = sub.add_parser("importar", help="Importa un CSV con encabezado a una tabla (COPY, conserva ids).")
+    p.add_argument("tabla", choices=TABLAS)
+    p.add_argument("archivo")
+    p.set_defaults(func=cmd_importar)
+
+    p = sub.add_parser("importar-sheets", help="Migra una planilla histórica de Google Sheets (STOCK/VENTAS/VENTAS_ITEMS).")
+    p.add_argument("marca", help="Marca con la que se etiquetan las filas")
+    p.add_argument("--spreadsheet-id", help="ID de la planilla (por defecto, 'VENTAS VETA' por nombre)")
+    p.add_argument("--bloque", type=int, default=5000, help="Filas leídas y cargadas por bloque")
+    p.set_defaults(func=cmd_importar_sheets)
+
+    p = sub.add_parser("sincronizar-ventas", help="Registra en la base las ventas pendientes del diario local del POS.")
+    p.set_defaults(func=cmd_sincronizar_ventas)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    inicio = time.monotonic()
+    try:
+        args.func(args)
+    except Exception as e:
+        _log(f"Error: {e}")
+        return 1
+    _log(f"Listo en {time.monotonic() - inicio:.1f}s.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
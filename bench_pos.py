@@ -0,0 +1,74 @@
+"""
+Benchmark de latencia por interacción del POS (Nueva Venta).
+
+Mide cuánto tarda agregar un producto (campo de escaneo) con un carrito de N líneas:
+  - pagina:    rerun de todo render_ventas_page (lo que costaba cada interacción sin fragments)
+  - fragmento: rerun solo de render_productos_carrito_section (lo que ejecuta Streamlit ahora)
+
+Uso:
+    python bench_pos.py                      # marca VETA, carrito de 30 líneas
+    python bench_pos.py --lineas 100 --codigo 02 --repeticiones 30
+
+Requiere la misma configuración de base de datos que la app (DB_URL_POSTGRES).
+"""
+import argparse
+import statistics
+import time
+from streamlit.testing.v1 import AppTest
+
+_SCRIPT_PAGINA = """
+from src.ui.ventas import render_ventas_page
+render_ventas_page()
+"""
+
+_SCRIPT_FRAGMENTO = """
+import streamlit as st
+from src.ui.ventas import init_venta_state, render_productos_carrito_section
+init_venta_state()
+render_productos_carrito_section(st.session_state.marca_seleccionada)
+"""
+
+def medir(script: str, marca: str, codigo: str, lineas: int, repeticiones: int) -> float:
+    """Mediana (ms) de agregar `codigo` por el campo de escaneo con un carrito de `lineas` líneas."""
+    at = AppTest.from_string(script, default_timeout=60)
+    at.session_state["marca_seleccionada"] = marca
+    at.session_state["cart"] = [{
+        "producto_id": 0, "nombre": f"Producto {i}", "cantidad": 1, "precio_unitario": 100.0,
+        "subtotal": 100.0, "stock_actual": 10, "aviso": "",
+    } for i in range(lineas)]
+    at.run()
+
+    tiempos = []
+    for _ in range(repeticiones):
+        at.text_input(key="pos_scan").input(codigo)
+        t0 = time.perf_counter()
+        at.run()
+        tiempos.append(time.perf_counter() - t0)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    return statistics.median(tiempos) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de agregar al carrito: página completa vs fragment")
+    parser.add_argument("--marca", default="VETA")
+    parser.add_argument("--codigo", help="Código a escanear (por defecto, el primer producto de la marca)")
+    parser.add_argument("--lineas", type=int, default=30, help="Líneas previas en el carrito")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    codigo = args.codigo
+    if not codigo:
+        from src.services.postgres_service import leer_stock_pagina
+        items, _ = leer_stock_pagina(args.marca, limite=1)
+        if not items:
+            raise SystemExit(f"No hay productos en {args.marca}; indique --codigo.")
+        codigo = items[0].codigo
+
+    print(f"Agregar '{codigo}' con {args.lineas} líneas en el carrito ({args.repeticiones} repeticiones)")
+    pagina = medir(_SCRIPT_PAGINA, args.marca, codigo, args.lineas, args.repeticiones)
+    fragmento = medir(_SCRIPT_FRAGMENTO, args.marca, codigo, args.lineas, args.repeticiones)
+    print(f"  página completa: {pagina:8.1f} ms")
+    print(f"  fragmento:       {fragmento:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
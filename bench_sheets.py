@@ -0,0 +1,126 @@
+"""
+Benchmark del backend de Google Sheets (src/services/sheets.py) contra un Sheets en memoria.
+
+Para cada operación informa cuántas llamadas a la API hace y cuánto tiempo de espera
+suman con la latencia indicada (tiempo simulado: no duerme ni usa la red). Incluye, como
+referencia, registrar una venta escribiendo celda por celda (find + update_cell) y la
+misma carga a través de la cola write-behind, y la carga de las tres hojas por separado
+frente a leer_todo (un solo values_batch_get).
+
+Uso:
+    python bench_sheets.py                       # 500 productos, carrito de 10 líneas, 150 ms por llamada
+    python bench_sheets.py --productos 5000 --lineas 30 --latencia 0.25 --cuota-escritura 60
+"""
+import argparse
+from datetime import datetime
+from src.config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
+from src.models import StockItem, Venta, VentaItem
+from src.services import sheets
+from src.services.sheets_fake import ServidorSheetsFake, usar_fake
+
+ENCABEZADO_STOCK = ['id', 'codigo', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'min_stock']
+
+def preparar(servidor: ServidorSheetsFake, productos: int):
+    planilla = servidor.crear_planilla("VENTAS VETA")
+    planilla.cargar(SHEET_STOCK, [ENCABEZADO_STOCK] + [
+        [i, f"{i:02d}", f"Producto {i}", "General", 1_000_000, 100.0, 5] for i in range(1, productos + 1)
+    ])
+    planilla.cargar(SHEET_VENTAS, [['id', 'fecha', 'cliente', 'total_bruto', 'descuento_porcentaje', 'total_neto', 'estado']])
+    planilla.cargar(SHEET_VENTAS_ITEMS, [['id', 'venta_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal']])
+
+def nueva_venta(lineas: int, productos: int):
+    venta_id = sheets.get_next_venta_id()
+    item_id = sheets.get_next_venta_item_id()
+    items = [VentaItem(id=item_id + k, venta_id=venta_id, producto_id=(k % productos) + 1, cantidad=1,
+                       precio_unitario=100.0, subtotal=100.0, marca=sheets.MARCA_SHEETS) for k in range(lineas)]
+    venta = Venta(id=venta_id, fecha=datetime.now(), cliente="Benchmark", total_bruto=100.0 * lineas,
+                  descuento_porcentaje=0, total_neto=100.0 * lineas, marca=sheets.MARCA_SHEETS)
+    return venta, items
+
+def registrar_venta_celda_por_celda(venta: Venta, items):
+    """Referencia: cómo escribía la venta sheets.py antes (find + 6 update_cell por línea)."""
+    ws = sheets._get_worksheet(SHEET_STOCK)
+    stock = {s.id: s for s in sheets.leer_stock()}
+    for v_item in items:
+        s_item = stock[v_item.producto_id]
+        s_item.cantidad -= v_item.cantidad
+        cell = ws.find(str(s_item.id), in_column=1)
+        for col, valor in enumerate(sheets._fila_producto(s_item)[1:], start=2):
+            ws.update_cell(cell.row, col, valor)
+    sheets._get_worksheet(SHEET_VENTAS).append_row(sheets._fila_venta(venta))
+    sheets._get_worksheet(SHEET_VENTAS_ITEMS).append_rows([sheets._fila_venta_item(i) for i in items])
+
+def medir(servidor: ServidorSheetsFake, nombre: str, fn, veces: int = 1):
+    servidor.reiniciar_contadores()
+    error = ""
+    try:
+        for _ in range(veces):
+            fn()
+    except Exception as e:
+        error = f"  ⚠️ {e}"
+    llamadas = servidor.total_llamadas / veces
+    tiempo = servidor.tiempo_simulado / veces
+    detalle = ", ".join(f"{m} {n}" for m, n in servidor.llamadas.most_common())
+    print(f"{nombre:<40} {llamadas:>9.1f} {tiempo:>11.2f} {servidor.rechazadas:>6}   {detalle}{error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Llamadas a la API y tiempo simulado por operación de sheets.py")
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--lineas", type=int, default=10, help="Líneas por venta")
+    parser.add_argument("--ventas", type=int, default=20, help="Ventas seguidas para la prueba de ráfaga")
+    parser.add_argument("--latencia", type=float, default=0.15, help="Segundos por llamada a la API")
+    parser.add_argument("--cuota-escritura", type=int, default=None, help="Escrituras por minuto (Google: 60 por usuario)")
+    args = parser.parse_args()
+
+    servidor = ServidorSheetsFake(latencia=args.latencia, cuota_escritura=args.cuota_escritura)
+    preparar(servidor, args.productos)
+    print(f"{args.productos} productos, ventas de {args.lineas} líneas, {args.latencia * 1000:.0f} ms por llamada")
+    print(f"{'Operación':<40} {'llamadas':>9} {'tiempo (s)':>11} {'429':>6}   detalle")
+
+    with usar_fake(servidor):
+        medir(servidor, "leer_stock (en frío)", sheets.leer_stock)
+        medir(servidor, "leer_stock", sheets.leer_stock)
+        sheets.invalidar_cache()
+        medir(servidor, "get_next_venta_id (en frío)", sheets.get_next_venta_id)
+        medir(servidor, "get_next_venta_id", sheets.get_next_venta_id)
+
+        producto = sheets.leer_stock()[args.productos // 2]
+        medir(servidor, "actualizar_producto", lambda: sheets.actualizar_producto(producto))
+        medir(servidor, "crear_producto", lambda: sheets.crear_producto(StockItem(
+            id=args.productos + 1, codigo="NUEVO", nombre="Nuevo", categoria="General",
+            cantidad=1, precio_unitario=1.0, marca=sheets.MARCA_SHEETS)))
+        medir(servidor, "eliminar_producto", lambda: sheets.eliminar_producto(args.productos + 1))
+
+        sheets.get_next_venta_item_id()  # warm the id index so only the sale itself is measured
+        medir(servidor, "registrar_venta celda por celda (previo)",
+              lambda: registrar_venta_celda_por_celda(*nueva_venta(args.lineas, args.productos)))
+        medir(servidor, "registrar_venta",
+              lambda: sheets.registrar_venta(*nueva_venta(args.lineas, args.productos)))
+
+        medir(servidor, f"registrar_venta x{args.ventas} (por venta)",
+              lambda: sheets.registrar_venta(*nueva_venta(args.lineas, args.productos)), veces=args.ventas)
+
+        sheets.invalidar_cache(SHEET_VENTAS)
+        medir(servidor, "leer_ventas (en frío)", sheets.leer_ventas)
+        sheets.registrar_venta(*nueva_venta(args.lineas, args.productos))
+        medir(servidor, "leer_ventas (solo filas nuevas)", sheets.leer_ventas)
+
+        from src.services.sheets_cola import ColaEscrituraSheets
+        cola = ColaEscrituraSheets(intervalo=3600)
+        def rafaga_con_cola():
+            # The queue numbers each sale itself (the sheet's max id only moves on flush)
+            for _ in range(args.ventas):
+                cola.registrar_venta(*nueva_venta(args.lineas, args.productos))
+            cola.flush()
+        medir(servidor, f"cola: {args.ventas} ventas + flush (total)", rafaga_con_cola)
+        cola.detener()
+
+        sheets.invalidar_cache()
+        medir(servidor, "3 hojas por separado (en frío)",
+              lambda: (sheets.leer_stock(), sheets.leer_ventas(), sheets.leer_ventas_items()))
+        sheets.invalidar_cache()
+        medir(servidor, "leer_todo (en frío)", sheets.leer_todo)
+        medir(servidor, "leer_todo", sheets.leer_todo)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark de arranque en frío de main.py.
+
+Para cada página lanza un proceso nuevo de Python, importa Streamlit y mide el
+tiempo hasta el primer render completo de main.py con esa página seleccionada
+(usa streamlit.testing, sin navegador). También indica si el render cargó pandas.
+
+Uso:
+    python bench_startup.py                 # todas las páginas, marca VETA
+    python bench_startup.py --marca VENETO --repeticiones 5
+    python bench_startup.py --pagina "Clientes"
+
+Requiere la misma configuración de base de datos que la app (DB_URL_POSTGRES).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PAGINAS = ["Dashboard", "Nueva Venta", "Productos", "Clientes", "Concesión", "Facturación"]
+
+# Runs inside the fresh process: Streamlit import is excluded, main.py imports and render are included
+_MEDICION = r"""
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+pagina, marca, main_path = sys.argv[1:4]
+at = AppTest.from_file(main_path, default_timeout=120)
+at.session_state["nav_page"] = pagina
+at.session_state["marca_seleccionada"] = marca
+t0 = time.perf_counter()
+at.run()
+primer_render = time.perf_counter() - t0
+t0 = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - t0
+print(json.dumps({
+    "primer_render": primer_render,
+    "rerun": rerun,
+    "pandas": "pandas" in sys.modules,
+    "errores": [str(e.value) for e in at.exception] + [str(e.value) for e in at.error],
+}))
+"""
+
+def medir_pagina(pagina: str, marca: str) -> dict:
+    """Un arranque en frío de main.py con `pagina` seleccionada, en un proceso nuevo."""
+    out = subprocess.run(
+        [sys.executable, "-c", _MEDICION, pagina, marca, os.path.join(ROOT, "main.py")],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    # The JSON result is the last line; Streamlit may log warnings before it
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo hasta el primer render de cada página de main.py")
+    parser.add_argument("--marca", default="VETA")
+    parser.add_argument("--pagina", choices=PAGINAS, help="Medir solo esta página")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Procesos por página (se informa la mediana)")
+    args = parser.parse_args()
+
+    paginas = [args.pagina] if args.pagina else PAGINAS
+    print(f"{'Página':<14} {'1er render (s)':>15} {'rerun (s)':>10} {'pandas':>7}")
+    for pagina in paginas:
+        resultados = [medir_pagina(pagina, args.marca) for _ in range(args.repeticiones)]
+        primer = statistics.median(r["primer_render"] for r in resultados)
+        rerun = statistics.median(r["rerun"] for r in resultados)
+        pandas = "sí" if resultados[-1]["pandas"] else "no"
+        print(f"{pagina:<14} {primer:>15.3f} {rerun:>10.3f} {pandas:>7}")
+        for error in resultados[-1]["errores"]:
+            print(f"    ⚠️ {error}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,34 @@
+import importlib
 import streamlit as st
-from src.services.postgres_service import init_db
-from src.ui.dashboard import render_dashboard_page
-from src.ui.products import render_products_page
-from src.ui.ventas import render_ventas_page
+
+# Page -> (module, render function). Modules are imported on first use only, so a run
+# pays the import cost (pandas, services) of the selected page and nothing else.
+PAGES = {
+    "Dashboard": ("src.ui.dashboard", "render_dashboard_page"),
+    "Nueva Venta": ("src.ui.ventas", "render_ventas_page"),
+    "Productos": ("src.ui.products", "render_products_page"),
+    "Clientes": ("src.ui.clientes", "render_clientes_page"),
+    "Concesión": ("src.ui.concesion", "render_concesion_page"),
+    "Facturación": ("src.ui.facturacion", "render_facturacion_page"),
+}
+
+# With STORAGE_BACKEND sqlite/sheets only pages that go through the storage backend are offered:
+# the bulk-edit grid, Clientes, Concesión and Facturación run their own Postgres SQL.
+PAGES_SIN_POSTGRES = {
+    "Dashboard": PAGES["Dashboard"],
+    "Nueva Venta": PAGES["Nueva Venta"],
+    "Productos": ("src.ui.stock", "render_stock_page"),
+}
+
+@st.cache_resource(show_spinner=False)
+def init_db_once():
+    """
+    Schema check once per server process instead of on every rerun. cache_resource does
+    not keep a raised exception, so a failed check (DB down at boot) runs again next time.
+    """
+    from src.services.almacenamiento import obtener_backend
+    obtener_backend().init_db()
+    return True
 
 # 1. Config Global
 st.set_page_config(page_title="VETA / VENETO", page_icon="assets/nuevo_logo_veta.png", layout="wide")
@@ -131,7 +157,15 @@ st.markdown("""
 
 
 # 2. Init DB
-init_db()
+try:
+    init_db_once()
+except Exception as e:
+    # Not fatal: the POS journal keeps taking sales, and the next rerun tries again
+    st.error(f"No se pudo inicializar la base de datos: {e}")
+
+from src.services.almacenamiento import backend_configurado
+backend = backend_configurado()
+paginas = PAGES if backend == "postgres" else PAGES_SIN_POSTGRES
 
 # 3. Sidebar Navigation
 # Logo Injection
@@ -145,8 +179,9 @@ except:
 
 page = st.sidebar.radio(
     "Navegación",
-    ["Dashboard", "Nueva Venta", "Productos", "Clientes", "Concesión", "Facturación"],
-    index=0
+    list(paginas.keys()),
+    index=0,
+    key="nav_page"
 )
 
 # --- 3.1 MOBILE SIDEBAR AUTO-CLOSE LOGIC ---
@@ -192,24 +227,21 @@ components.html("""
 from src.ui.state_manager import render_brand_reset_button_sidebar
 render_brand_reset_button_sidebar()
 
+# Offline-first POS: sync status of the local sales journal
+from src.services.diario_ventas import diario_habilitado
+if diario_habilitado():
+    from src.ui.estado_sync import render_estado_sincronizacion_sidebar
+    render_estado_sincronizacion_sidebar()
+
+# Sheets backend: depth and flush latency of the write-behind queue
+if backend == "sheets":
+    from src.ui.estado_sync import render_estado_cola_sidebar
+    render_estado_cola_sidebar()
+
 st.sidebar.divider()
 st.sidebar.caption("v2.5 - Mobile Optimized")
 
-from src.ui.clientes import render_clientes_page
-from src.ui.facturacion import render_facturacion_page
-from src.ui.concesion import render_concesion_page
-
 # 4. Routing
 # Note: Functions now handle their own state/context or use defaults
-if page == "Dashboard":
-    render_dashboard_page()
-elif page == "Nueva Venta":
-    render_ventas_page()
-elif page == "Productos":
-    render_products_page()
-elif page == "Clientes":
-    render_clientes_page()
-elif page == "Concesión":
-    render_concesion_page()
-elif page == "Facturación":
-    render_facturacion_page()
+module_name, render_name = paginas[page]
+getattr(importlib.import_module(module_name), render_name)()
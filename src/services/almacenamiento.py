@@ -0,0 +1,231 @@
+"""
+Backend de almacenamiento seleccionable por configuración.
+
+`STORAGE_BACKEND` (en `.streamlit/secrets.toml` o en el entorno) elige dónde viven stock y ventas:
+
+-   `postgres` (por defecto): `postgres_service` (Supabase / PostgreSQL, DB_URL_POSTGRES).
+-   `sqlite`: `sqlite_service`, archivo local en modo WAL (DB_PATH_SQLITE). Sin red.
+-   `sheets`: planilla de Google Sheets vía `sheets.py` (una sola marca, MARCA_SHEETS).
+
+Todos cumplen `BackendAlmacenamiento`, la API núcleo de stock y ventas que usan el POS,
+el Dashboard y Stock. Las funciones que dependen de SQL de Postgres (paginación/edición
+masiva de productos, facturación, concesiones, clientes, analytics) siguen usando
+postgres_service y sus servicios directamente; con otro backend main.py no muestra esas páginas.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Protocol, Tuple, runtime_checkable
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
+from ..models import StockItem, Venta, VentaItem
+
+BACKENDS = ("postgres", "sqlite", "sheets")
+
+@runtime_checkable
+class BackendAlmacenamiento(Protocol):
+    """API núcleo de stock y ventas. Los módulos postgres_service y sqlite_service la cumplen tal cual."""
+
+    def init_db(self) -> None: ...
+    def leer_stock(self, marca: Optional[str] = None) -> List[StockItem]: ...
+    def leer_productos_por_ids(self, ids: List[int]) -> List[StockItem]: ...
+    def leer_stock_critico(self, marca: Optional[str] = None) -> Dict[str, Any]: ...
+    def buscar_producto_por_codigo(self, marca: str, codigo: str) -> Optional[StockItem]: ...
+    def buscar_productos(self, marca: str, texto: str, limite: int = 20) -> List[StockItem]: ...
+    def crear_producto(self, item: StockItem) -> None: ...
+    def actualizar_producto(self, item: StockItem) -> None: ...
+    def eliminar_producto(self, item_id: int) -> None: ...
+    def leer_ventas(self, marca: Optional[str] = None) -> List[Venta]: ...
+    def leer_ventas_items(self, marca: Optional[str] = None) -> List[VentaItem]: ...
+    def leer_items_por_venta(self, venta_id: int) -> List[VentaItem]: ...
+    def get_next_venta_id(self) -> int: ...
+    def get_next_venta_item_id(self) -> int: ...
+    def registrar_venta(self, venta: Venta, items: List[VentaItem]) -> int: ...
+
+def _normalizar_codigo(codigo: str) -> str:
+    return codigo.zfill(2) if codigo.isdigit() else codigo
+
+class SheetsBackend:
+    """
+    Adaptador de sheets.py a BackendAlmacenamiento. La planilla no tiene columna marca:
+    todo es de MARCA_SHEETS, y las búsquedas/filtros se resuelven en memoria.
+
+    Las lecturas salen de una foto de las tres hojas (sheets.leer_todo, una sola llamada)
+    que dura `ttl_foto` segundos (o hasta el próximo flush de la cola): una página que pide
+    ventas, items y stock crítico hace un único viaje a la API. Encima de la foto va lo que
+    la cola todavía no envió, así una venta recién confirmada se ve enseguida.
+
+    Ventas y ediciones de productos pasan por la cola write-behind (sheets_cola, la del
+    proceso salvo que se indique otra); crear y borrar productos escriben directo.
+    """
+
+    def __init__(self, spreadsheet_id: Optional[str] = None, ttl_foto: float = 2.0, cola=None):
+        self.spreadsheet_id = spreadsheet_id
+        self.ttl_foto = ttl_foto
+        self._cola = cola
+        # (momento, lotes de la cola, datos)
+        self._foto: Optional[Tuple[float, int, Dict[str, list]]] = None
+
+    @property
+    def cola(self):
+        if self._cola is None:
+            from .sheets_cola import obtener_cola
+            self._cola = obtener_cola(self.spreadsheet_id)
+        return self._cola
+
+    def _datos(self) -> Dict[str, list]:
+        from . import sheets
+        cola = self.cola
+        foto = self._foto
+        if foto is None or time.monotonic() - foto[0] > self.ttl_foto or foto[1] != cola.lotes:
+            # Batches counted before reading: a flush that lands during the read forces the next one
+            lotes = cola.lotes
+            foto = (time.monotonic(), lotes, sheets.leer_todo(self.spreadsheet_id))
+            self._foto = foto
+        datos = foto[2]
+        pendientes = cola.pendientes()
+        if not (pendientes["stock"] or pendientes["ventas"] or pendientes["ventas_items"]):
+            return datos
+        # By id: a row may be both in the snapshot and still in flight
+        ventas = {v.id: v for v in datos["ventas"]}
+        ventas.update((v.id, v) for v in pendientes["ventas"])
+        items = {i.id: i for i in datos["ventas_items"]}
+        items.update((i.id, i) for i in pendientes["ventas_items"])
+        return {
+            "stock": [pendientes["stock"].get(i.id, i) for i in datos["stock"]],
+            "ventas": sorted(ventas.values(), key=lambda v: v.id),
+            "ventas_items": sorted(items.values(), key=lambda i: i.id),
+        }
+
+    def init_db(self) -> None:
+        from . import sheets
+        from ..config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
+        # Opens (and auto-creates with headers) the three worksheets
+        for hoja in (SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS):
+            sheets._get_worksheet(hoja, spreadsheet_id=self.spreadsheet_id)
+
+    def leer_stock(self, marca: Optional[str] = None) -> List[StockItem]:
+        return [i for i in self._datos()["stock"] if not marca or i.marca == marca]
+
+    def leer_productos_por_ids(self, ids: List[int]) -> List[StockItem]:
+        ids = set(ids)
+        return [i for i in self.leer_stock() if i.id in ids]
+
+    def leer_stock_critico(self, marca: Optional[str] = None) -> Dict[str, Any]:
+        items = sorted((i for i in self.leer_stock(marca) if i.cantidad <= i.min_stock),
+                       key=lambda i: (i.cantidad, i.nombre))
+        categorias: Dict[str, Dict[str, Any]] = {}
+        for i in items:
+            c = categorias.setdefault(i.categoria or "", {"categoria": i.categoria or "", "criticos": 0, "agotados": 0})
+            c["criticos"] += 1
+            c["agotados"] += 1 if i.cantidad <= 0 else 0
+        por_categoria = sorted(categorias.values(), key=lambda c: (-c["criticos"], c["categoria"]))
+        return {
+            "items": items,
+            "por_categoria": por_categoria,
+            "criticos": len(items),
+            "agotados": sum(c["agotados"] for c in por_categoria),
+        }
+
+    def buscar_producto_por_codigo(self, marca: str, codigo: str) -> Optional[StockItem]:
+        codigo = codigo.strip()
+        if not codigo:
+            return None
+        candidatos = [i for i in self.leer_stock(marca) if i.codigo in (codigo, _normalizar_codigo(codigo))]
+        candidatos.sort(key=lambda i: (i.codigo != codigo, i.id))
+        return candidatos[0] if candidatos else None
+
+    def buscar_productos(self, marca: str, texto: str, limite: int = 20) -> List[StockItem]:
+        codigo = texto.strip()
+        q = codigo.lower()
+        if not q:
+            return []
+        exactos = (codigo, _normalizar_codigo(codigo))
+        encontrados = [
+            i for i in self.leer_stock(marca)
+            if i.codigo in exactos or i.codigo.startswith(codigo) or q in i.nombre.lower()
+        ]
+        encontrados.sort(key=lambda i: (
+            i.codigo not in exactos, not i.codigo.startswith(codigo), not i.nombre.lower().startswith(q), i.nombre
+        ))
+        return encontrados[:limite]
+
+    def crear_producto(self, item: StockItem) -> None:
+        from . import sheets
+        from ..config import SHEET_STOCK
+        # Like SERIAL in the databases: the id is assigned here, whatever the caller passed.
+        # Not _get_next_id: its fallback to 1 on a read error would duplicate an id
+        nuevo_id = self.cola.siguiente_id(SHEET_STOCK)
+        self._foto = None
+        sheets.crear_producto(item.model_copy(update={"id": nuevo_id, "codigo": _normalizar_codigo(item.codigo)}),
+                              spreadsheet_id=self.spreadsheet_id)
+        self.cola.invalidar_stock()
+
+    def actualizar_producto(self, item: StockItem) -> None:
+        if not any(i.id == item.id for i in self.leer_stock()):
+            raise ValueError(f"Producto con ID {item.id} no encontrado.")
+        self.cola.encolar_producto(item.model_copy(update={"codigo": _normalizar_codigo(item.codigo)}))
+
+    def eliminar_producto(self, item_id: int) -> None:
+        from . import sheets
+        # Queued writes go first: a pending update must not bring the product back
+        self.cola.flush()
+        self._foto = None
+        sheets.eliminar_producto(item_id, spreadsheet_id=self.spreadsheet_id)
+        self.cola.invalidar_stock()
+
+    def leer_ventas(self, marca: Optional[str] = None) -> List[Venta]:
+        ventas = self._datos()["ventas"]
+        return sorted((v for v in ventas if not marca or v.marca == marca), key=lambda v: v.id, reverse=True)
+
+    def leer_ventas_items(self, marca: Optional[str] = None) -> List[VentaItem]:
+        return [i for i in self._datos()["ventas_items"] if not marca or i.marca == marca]
+
+    def leer_items_por_venta(self, venta_id: int) -> List[VentaItem]:
+        return [i for i in self.leer_ventas_items() if i.venta_id == venta_id]
+
+    def get_next_venta_id(self) -> int:
+        from ..config import SHEET_VENTAS
+        return self.cola.siguiente_id(SHEET_VENTAS)
+
+    def get_next_venta_item_id(self) -> int:
+        from ..config import SHEET_VENTAS_ITEMS
+        return self.cola.siguiente_id(SHEET_VENTAS_ITEMS)
+
+    def registrar_venta(self, venta: Venta, items: List[VentaItem]) -> int:
+        # The sheet has no SERIAL: the queue numbers the sale and its items when it takes them
+        items = [i.model_copy(update={"marca": venta.marca}) for i in items]
+        return self.cola.registrar_venta(venta, items)
+
+def backend_configurado() -> str:
+    """Nombre del backend según STORAGE_BACKEND (secrets, luego entorno); 'postgres' si no está."""
+    nombre = None
+    if st is not None:
+        try:
+            if hasattr(st, "secrets") and "STORAGE_BACKEND" in st.secrets:
+                nombre = st.secrets["STORAGE_BACKEND"]
+        except Exception:
+            pass
+    nombre = (nombre or os.getenv("STORAGE_BACKEND") or "postgres").strip().lower()
+    if nombre not in BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND '{nombre}' no soportado. Opciones: {', '.join(BACKENDS)}")
+    return nombre
+
+_backends: Dict[str, BackendAlmacenamiento] = {}
+
+def obtener_backend(nombre: Optional[str] = None) -> BackendAlmacenamiento:
+    """Backend configurado (o el indicado). Se importa solo el módulo del backend elegido."""
+    nombre = nombre or backend_configurado()
+    if nombre not in _backends:
+        if nombre == "postgres":
+            from . import postgres_service as backend
+        elif nombre == "sqlite":
+            from . import sqlite_service as backend
+        elif nombre == "sheets":
+            backend = SheetsBackend()
+        else:
+            raise ValueError(f"Backend '{nombre}' no soportado. Opciones: {', '.join(BACKENDS)}")
+        _backends[nombre] = backend
+    return _backends[nombre]
@@ -0,0 +1,148 @@
+import time
+import pandas as pd
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Tuple
+from src.services.postgres_service import get_connection
+
+# Cortes de participación acumulada para la clasificación ABC
+CORTE_A = 0.80
+CORTE_B = 0.95
+
+# Resultados cacheados por (consulta, marca, período) durante este tiempo
+CACHE_TTL_SEGUNDOS = 600
+_cache: Dict[Tuple, Tuple[float, pd.DataFrame]] = {}
+
+# Ingreso real por item: las ventas de concesión ya guardan precio mayorista en el item
+# (el 30% de descuento de la cabecera es informativo), el resto aplica el descuento de la venta.
+_INGRESO_ITEM = """vi.subtotal * CASE WHEN v.tipo_venta = 'Venta Concesión' THEN 1
+                                 ELSE 1 - v.descuento_porcentaje / 100 END"""
+
+def _cacheado(clave: Tuple, calcular: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    ahora = time.monotonic()
+    hit = _cache.get(clave)
+    if hit and ahora - hit[0] < CACHE_TTL_SEGUNDOS:
+        return hit[1].copy()
+    df = calcular()
+    _cache[clave] = (ahora, df)
+    return df.copy()
+
+def limpiar_cache_analytics():
+    """Invalida los resultados cacheados (ej. tras correcciones masivas de ventas)."""
+    _cache.clear()
+
+def _query_df(sql: str, params: Dict[str, Any]) -> pd.DataFrame:
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cols = [d[0] for d in cursor.description]
+    finally:
+        conn.close()
+    return pd.DataFrame([dict(r) for r in rows], columns=cols)
+
+def clasificar_productos_abc(marca: Optional[str], desde: date, hasta: date) -> pd.DataFrame:
+    """
+    Clasificación ABC de todos los productos por participación en los ingresos del período [desde, hasta).
+
+    - A: productos que acumulan el primer 80% de los ingresos.
+    - B: hasta el 95%.
+    - C: el resto, incluidos los productos sin ventas.
+    Las participaciones se calculan en SQL con funciones de ventana.
+    """
+    def calcular():
+        filtro_marca = "AND v.marca = %(marca)s" if marca else ""
+        filtro_stock = "WHERE s.marca = %(marca)s" if marca else ""
+        df = _query_df(f"""
+            WITH ventas_prod AS (
+                SELECT vi.producto_id,
+                       SUM(vi.cantidad) AS unidades,
+                       SUM({_INGRESO_ITEM}) AS ingresos
+                FROM ventas_items vi
+                JOIN ventas v ON v.id = vi.venta_id
+                WHERE v.fecha >= %(desde)s AND v.fecha < %(hasta)s {filtro_marca}
+                GROUP BY vi.producto_id
+            ), base AS (
+                SELECT s.id AS producto_id, s.codigo, s.nombre, s.categoria, s.marca,
+                       COALESCE(vp.unidades, 0) AS unidades,
+                       COALESCE(vp.ingresos, 0) AS ingresos
+                FROM stock s
+                LEFT JOIN ventas_prod vp ON vp.producto_id = s.id
+                {filtro_stock}
+            ), ranked AS (
+                SELECT *,
+                       ingresos / NULLIF(SUM(ingresos) OVER (), 0) AS participacion,
+                       SUM(ingresos) OVER (ORDER BY ingresos DESC, producto_id
+                                           ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+                           / NULLIF(SUM(ingresos) OVER (), 0) AS acumulado,
+                       ROW_NUMBER() OVER (ORDER BY ingresos DESC, producto_id) AS ranking
+                FROM base
+            )
+            SELECT producto_id, codigo, nombre, categoria, marca, unidades, ingresos,
+                   COALESCE(participacion, 0) AS participacion,
+                   COALESCE(acumulado, 0) AS acumulado,
+                   ranking,
+                   CASE
+                       WHEN ingresos <= 0 THEN 'C'
+                       WHEN acumulado - participacion < %(corte_a)s THEN 'A'
+                       WHEN acumulado - participacion < %(corte_b)s THEN 'B'
+                       ELSE 'C'
+                   END AS clase
+            FROM ranked
+            ORDER BY ranking
+        """, {"marca": marca, "desde": desde.isoformat(), "hasta": hasta.isoformat(),
+              "corte_a": CORTE_A, "corte_b": CORTE_B})
+        for col in ("ingresos", "participacion", "acumulado"):
+            df[col] = df[col].astype(float)
+        df['categoria'] = df['categoria'].fillna('')
+        return df
+
+    return _cacheado(("abc", marca, desde, hasta), calcular)
+
+def segmentar_clientes_rfm(marca: Optional[str], desde: date, hasta: date) -> pd.DataFrame:
+    """
+    Segmentación RFM de los clientes con compras en [desde, hasta).
+
+    - Recencia: días desde la última compra hasta `hasta`.
+    - Frecuencia: cantidad de ventas.
+    - Monto: total neto comprado.
+    Cada dimensión se puntúa 1-5 por quintiles (NTILE) y el segmento sale de R y F.
+    """
+    def calcular():
+        filtro_marca = "AND marca = %(marca)s" if marca else ""
+        df = _query_df(f"""
+            WITH por_cliente AS (
+                SELECT cliente,
+                       MAX(fecha) AS ultima_compra,
+                       COUNT(*) AS frecuencia,
+                       SUM(total_neto) AS monto
+                FROM ventas
+                WHERE fecha >= %(desde)s AND fecha < %(hasta)s {filtro_marca}
+                  AND cliente IS NOT NULL AND cliente <> ''
+                GROUP BY cliente
+            ), puntajes AS (
+                SELECT *,
+                       %(hasta)s::date - substring(ultima_compra, 1, 10)::date AS recencia_dias,
+                       NTILE(5) OVER (ORDER BY ultima_compra ASC) AS r,
+                       NTILE(5) OVER (ORDER BY frecuencia ASC, monto ASC) AS f,
+                       NTILE(5) OVER (ORDER BY monto ASC) AS m
+                FROM por_cliente
+            )
+            SELECT cliente, substring(ultima_compra, 1, 10) AS ultima_compra,
+                   recencia_dias, frecuencia, monto, r, f, m,
+                   CASE
+                       WHEN r >= 4 AND f >= 4 THEN 'Campeones'
+                       WHEN r >= 3 AND f >= 3 THEN 'Leales'
+                       WHEN r >= 4 THEN 'Nuevos'
+                       WHEN r = 3 THEN 'Potenciales'
+                       WHEN f >= 4 THEN 'En riesgo'
+                       WHEN r = 2 THEN 'Hibernando'
+                       ELSE 'Perdidos'
+                   END AS segmento
+            FROM puntajes
+            ORDER BY monto DESC
+        """, {"marca": marca, "desde": desde.isoformat(), "hasta": hasta.isoformat()})
+        df["monto"] = df["monto"].astype(float)
+        return df
+
+    return _cacheado(("rfm", marca, desde, hasta), calcular)
@@ -2,7 +2,22 @@ import psycopg2
 from datetime import datetime
 from typing import List, Optional
 from src.models import Cliente
-from src.services.postgres_service import get_connection
+from src.services.postgres_service import get_connection, escapar_like, pg_trgm_disponible
+
+def _row_to_cliente(row) -> Cliente:
+    fecha = None
+    if row['fecha_creacion']:
+        try:
+            fecha = datetime.fromisoformat(row['fecha_creacion'])
+        except:
+            pass
+    return Cliente(
+        id=row['id'],
+        razon_social=row['razon_social'],
+        cuit_cuil=row['cuit_cuil'],
+        fecha_creacion=fecha,
+        marca=row['marca']
+    )
 
 def leer_clientes(marca: Optional[str] = None) -> List[Cliente]:
     """Lee clientes. Si marca es None, lee todos. Ordenados por razón social."""
@@ -15,23 +30,55 @@ def leer_clientes(marca: Optional[str] = None) -> List[Cliente]:
     rows = cursor.fetchall()
     conn.close()
     
-    clientes = []
-    for row in rows:
-        fecha = None
-        if row['fecha_creacion']:
-            try:
-                fecha = datetime.fromisoformat(row['fecha_creacion'])
-            except:
-                pass
-                
-        clientes.append(Cliente(
-            id=row['id'],
-            razon_social=row['razon_social'],
-            cuit_cuil=row['cuit_cuil'],
-            fecha_creacion=fecha,
-            marca=row['marca']
-        ))
-    return clientes
+    return [_row_to_cliente(row) for row in rows]
+
+def buscar_clientes(marca: str, texto: str = "", limite: int = 20) -> List[Cliente]:
+    """
+    Mejores coincidencias para un texto tipeado (type-ahead), sin leer toda la tabla.
+
+    Busca por prefijo de la razón social normalizada (minúsculas, sin espacios extremos),
+    por prefijo del CUIT ignorando guiones/espacios y, si pg_trgm está instalado, por
+    fragmento o similitud del nombre. Orden: coincidencia exacta, prefijo, similitud.
+    Con texto vacío devuelve los primeros `limite` clientes por razón social.
+    """
+    q = texto.strip().lower()
+    digitos = "".join(ch for ch in q if ch.isdigit())
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if not q:
+            cursor.execute("""
+                SELECT * FROM clientes WHERE marca = %s
+                ORDER BY lower(trim(razon_social)) LIMIT %s
+            """, (marca, limite))
+            return [_row_to_cliente(row) for row in cursor.fetchall()]
+
+        q_like = escapar_like(q)
+        condiciones = ["lower(trim(razon_social)) LIKE %(prefijo)s"]
+        if digitos:
+            condiciones.append("regexp_replace(cuit_cuil, '[^0-9]', '', 'g') LIKE %(cuit)s")
+        similitud = ""
+        if pg_trgm_disponible(cursor):
+            condiciones.append("lower(trim(razon_social)) LIKE %(contiene)s")
+            condiciones.append("lower(trim(razon_social)) %% %(q)s")
+            similitud = "similarity(lower(trim(razon_social)), %(q)s) DESC,"
+
+        cursor.execute(f"""
+            SELECT * FROM clientes
+            WHERE marca = %(marca)s AND ({' OR '.join(condiciones)})
+            ORDER BY lower(trim(razon_social)) = %(q)s DESC,
+                     lower(trim(razon_social)) LIKE %(prefijo)s DESC,
+                     {similitud}
+                     lower(trim(razon_social))
+            LIMIT %(limite)s
+        """, {
+            "marca": marca, "q": q, "limite": limite,
+            "prefijo": q_like + "%", "contiene": "%" + q_like + "%", "cuit": digitos + "%",
+        })
+        return [_row_to_cliente(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
 
 def crear_cliente(cliente: Cliente):
     """Crea un nuevo cliente."""
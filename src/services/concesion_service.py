@@ -1,4 +1,6 @@
-from datetime import datetime
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from src.services.postgres_service import get_connection
 from ..models import Concesionario, Venta, VentaItem
@@ -6,6 +8,9 @@ from ..models import Concesionario, Venta, VentaItem
 # Wholesale Discount Rate (30% off)
 WHOLESALE_DISCOUNT = 0.30
 
+# Sell-through: mínimo de días de exposición para no inflar la velocidad de envíos recientes
+MIN_DIAS_EXPOSICION = 7
+
 def get_concesionarios(marca: str) -> List[Concesionario]:
     """Obtiene todos los concesionarios de una marca."""
     conn = get_connection()
@@ -312,3 +317,72 @@ def devolver_stock_concesion_masivo(concesionario_id: int, items: List[Dict]):
         raise e
     finally:
         conn.close()
+
+def analizar_sell_through(marca: str, dias: int = 90, cobertura_dias: int = 30) -> pd.DataFrame:
+    """
+    Sell-through por socio y producto para todos los concesionarios de la marca.
+
+    Una sola consulta trae el stock en consignación y lo vendido en los últimos `dias`
+    (ventas 'Venta Concesión' de confirmar_venta_concesion); el resto se calcula
+    vectorizado sobre el DataFrame:
+    - sell_through: vendido / (vendido + disponible).
+    - venta_diaria: vendido / días de exposición (desde el envío o la primera venta, tope `dias`).
+    - edad_dias: días desde la última salida de mercadería al socio.
+    - envio_sugerido: unidades para cubrir `cobertura_dias` de venta, descontando lo disponible.
+    """
+    desde = (datetime.now() - timedelta(days=dias)).date().isoformat()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            WITH vendido AS (
+                SELECT v.cliente, vi.producto_id,
+                       SUM(vi.cantidad) AS vendido,
+                       MIN(substring(v.fecha, 1, 10))::date AS primera_venta
+                FROM ventas v
+                JOIN ventas_items vi ON vi.venta_id = v.id
+                WHERE v.marca = %(marca)s AND v.tipo_venta = 'Venta Concesión' AND v.fecha >= %(desde)s
+                GROUP BY v.cliente, vi.producto_id
+            )
+            SELECT c.id AS concesionario_id, c.nombre_socio,
+                   cs.producto_id, s.codigo AS producto_codigo, s.nombre AS producto_nombre,
+                   cs.cantidad_disponible AS disponible,
+                   COALESCE(vd.vendido, 0) AS vendido,
+                   CURRENT_DATE - substring(cs.fecha_salida, 1, 10)::date AS edad_dias,
+                   CURRENT_DATE - vd.primera_venta AS dias_desde_primera_venta
+            FROM concesion_stock cs
+            JOIN concesionarios c ON c.id = cs.concesionario_id
+            JOIN stock s ON s.id = cs.producto_id
+            LEFT JOIN vendido vd ON vd.cliente = c.nombre_socio || ' (Concesión)'
+                                AND vd.producto_id = cs.producto_id
+            WHERE c.marca = %(marca)s
+            ORDER BY c.nombre_socio, s.nombre
+        ''', {"marca": marca, "desde": desde})
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    df = pd.DataFrame([dict(r) for r in rows], columns=[
+        'concesionario_id', 'nombre_socio', 'producto_id', 'producto_codigo', 'producto_nombre',
+        'disponible', 'vendido', 'edad_dias', 'dias_desde_primera_venta'
+    ])
+    if df.empty:
+        return df
+
+    disponible = df['disponible'].astype(float).to_numpy()
+    vendido = df['vendido'].astype(float).to_numpy()
+    edad = df['edad_dias'].astype(float).to_numpy()
+    primera = df['dias_desde_primera_venta'].astype(float).to_numpy()
+
+    exposicion = np.fmax(edad, primera)
+    exposicion = np.clip(np.nan_to_num(exposicion, nan=dias), MIN_DIAS_EXPOSICION, dias)
+    venta_diaria = vendido / exposicion
+    movido = vendido + disponible
+
+    df['disponible'] = disponible
+    df['vendido'] = vendido
+    df['sell_through'] = np.divide(vendido, movido, out=np.zeros_like(movido), where=movido > 0)
+    df['venta_diaria'] = venta_diaria.round(3)
+    df['envio_sugerido'] = np.ceil(np.maximum(venta_diaria * cobertura_dias - disponible, 0)).astype(int)
+    return df.drop(columns=['dias_desde_primera_venta'])
@@ -0,0 +1,389 @@
+"""
+Diario local de ventas del POS (offline-first).
+
+La venta se confirma escribiéndola en un archivo SQLite local (DB_PATH_DIARIO, WAL con
+synchronous=FULL: sobrevive a un corte de luz) y se le da un número provisorio. Un hilo
+de fondo (`SincronizadorVentas`) la reproduce en PostgreSQL en el orden en que se
+registró, con su clave de idempotencia: si se corta a mitad de camino, reintentar no
+duplica la venta.
+
+Estados de una venta en el diario:
+-   `pendiente`: todavía no llegó a Postgres.
+-   `sincronizada`: registrada en Postgres (`venta_id`).
+-   `conflicto`: Postgres la rechazó (stock insuficiente, producto inexistente); queda
+    con el error para que alguien la reintente o la descarte.
+-   `descartada`: conflicto resuelto descartándola.
+"""
+import atexit
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+import psycopg2
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
+from ..logger import get_logger
+from ..models import Venta, VentaItem
+from .postgres_service import VentaRechazadaError
+
+logger = get_logger(__name__)
+
+PENDIENTE = "pendiente"
+SINCRONIZADA = "sincronizada"
+CONFLICTO = "conflicto"
+DESCARTADA = "descartada"
+
+# Errores de datos: reintentar no cambia el resultado, la venta pasa a conflicto.
+# Not ValueError as a whole: a missing DB_URL_POSTGRES is a ValueError too, and must be retried
+ERRORES_DE_CONFLICTO = (VentaRechazadaError, psycopg2.IntegrityError, psycopg2.DataError)
+
+def _config(clave: str) -> Optional[str]:
+    if st is not None:
+        try:
+            if hasattr(st, "secrets") and clave in st.secrets:
+                return str(st.secrets[clave])
+        except Exception:
+            pass
+    return os.getenv(clave)
+
+def diario_habilitado() -> bool:
+    """
+    Si el POS confirma las ventas en el diario local: solo con el backend Postgres (la
+    reproducción usa la clave de idempotencia de postgres_service), salvo POS_OFFLINE
+    desactivado en secrets o entorno. SQLite ya es local y Sheets tiene su cola.
+    """
+    from .almacenamiento import backend_configurado
+    if backend_configurado() != "postgres":
+        return False
+    valor = _config("POS_OFFLINE")
+    if valor is not None:
+        return valor.strip().lower() in ("1", "true", "si", "sí", "yes")
+    return True
+
+def _db_path() -> str:
+    return _config("DB_PATH_DIARIO") or "diario_ventas.db"
+
+def get_connection():
+    conn = sqlite3.connect(_db_path(), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    # FULL: the commit is on disk before the cashier sees the sale as confirmed
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+_inicializadas = set()
+
+def init_db():
+    """Crea la tabla del diario si no existe."""
+    conn = get_connection()
+    try:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS diario_ventas (
+                numero INTEGER PRIMARY KEY AUTOINCREMENT,
+                clave TEXT NOT NULL UNIQUE,
+                marca TEXT NOT NULL,
+                creada TEXT NOT NULL,
+                venta TEXT NOT NULL,
+                items TEXT NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                venta_id INTEGER,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                sincronizada TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_diario_estado ON diario_ventas (estado, numero);
+        """)
+        _inicializadas.add(_db_path())
+    finally:
+        conn.close()
+
+def _asegurar_tabla():
+    if _db_path() not in _inicializadas:
+        init_db()
+
+def _ahora() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def registrar_venta(venta: Venta, items: List[VentaItem]) -> int:
+    """
+    Guarda la venta en el diario y retorna su número provisorio. No valida stock (eso
+    pasa al sincronizar); solo toca el disco local.
+    """
+    if not items:
+        raise ValueError("La venta no tiene items.")
+    _asegurar_tabla()
+    conn = get_connection()
+    try:
+        cursor = conn.execute("""
+            INSERT INTO diario_ventas (clave, marca, creada, venta, items)
+            VALUES (?, ?, ?, ?, ?)
+        """, (uuid.uuid4().hex, venta.marca, _ahora(), venta.model_dump_json(),
+              json.dumps([i.model_dump(mode="json") for i in items])))
+        conn.commit()
+        numero = cursor.lastrowid
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+    sincronizador = _sincronizador
+    if sincronizador is not None:
+        sincronizador.avisar()
+    return numero
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    d = dict(row)
+    venta, items = d.pop("venta"), d.pop("items")
+    try:
+        venta = json.loads(venta)
+        d["cliente"] = venta["cliente"]
+        d["total_neto"] = venta["total_neto"]
+        d["items"] = len(json.loads(items))
+    except (ValueError, TypeError, KeyError):
+        # An unreadable row ends up in conflicto: it still has to be listed so it can be discarded
+        d.update(cliente="(ilegible)", total_neto=0.0, items=0)
+    return d
+
+def leer_ventas(estado: Optional[str] = None, limite: int = 100) -> List[Dict[str, Any]]:
+    """Ventas del diario (más nuevas primero), con cliente, total y cantidad de items."""
+    filtro = "WHERE estado = ?" if estado else ""
+    params = (estado,) if estado else ()
+    _asegurar_tabla()
+    conn = get_connection()
+    try:
+        rows = conn.execute(f"""
+            SELECT * FROM diario_ventas {filtro} ORDER BY numero DESC LIMIT ?
+        """, params + (limite,)).fetchall()
+    finally:
+        conn.close()
+    return [_row_to_dict(r) for r in rows]
+
+def estado() -> Dict[str, Any]:
+    """Pendientes, conflictos y atraso de la sincronización (antigüedad de la pendiente más vieja)."""
+    _asegurar_tabla()
+    conn = get_connection()
+    try:
+        row = conn.execute("""
+            SELECT COUNT(*) FILTER (WHERE estado = 'pendiente') AS pendientes,
+                   COUNT(*) FILTER (WHERE estado = 'conflicto') AS conflictos,
+                   MIN(creada) FILTER (WHERE estado = 'pendiente') AS pendiente_desde,
+                   MAX(sincronizada) AS ultima_sincronizada
+            FROM diario_ventas
+        """).fetchone()
+    finally:
+        conn.close()
+    res = dict(row)
+    atraso = 0.0
+    if res["pendiente_desde"]:
+        atraso = (datetime.now(timezone.utc) - datetime.fromisoformat(res["pendiente_desde"])).total_seconds()
+    res["atraso_s"] = round(max(atraso, 0.0), 1)
+    return res
+
+def _cambiar_estado(numero: int, desde: str, hacia: str):
+    conn = get_connection()
+    try:
+        cursor = conn.execute("""
+            UPDATE diario_ventas SET estado = ?, error = CASE WHEN ? = 'pendiente' THEN NULL ELSE error END
+            WHERE numero = ? AND estado = ?
+        """, (hacia, hacia, numero, desde))
+        if cursor.rowcount == 0:
+            raise ValueError(f"La venta provisoria #{numero} no está en estado '{desde}'.")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def reintentar_conflicto(numero: int):
+    """Vuelve a poner en cola una venta en conflicto (p. ej. después de reponer stock)."""
+    _cambiar_estado(numero, CONFLICTO, PENDIENTE)
+    if _sincronizador is not None:
+        _sincronizador.avisar()
+
+def descartar_conflicto(numero: int):
+    """Descarta una venta en conflicto: no se registra en Postgres."""
+    _cambiar_estado(numero, CONFLICTO, DESCARTADA)
+
+Destino = Callable[[Venta, List[VentaItem], str], int]
+
+def _registrar_en_postgres(venta: Venta, items: List[VentaItem], clave: str) -> int:
+    from .postgres_service import registrar_venta as registrar
+    return registrar(venta, items, idempotency_key=clave)
+
+class SincronizadorVentas:
+    """
+    Hilo que reproduce las ventas pendientes del diario en Postgres, en orden de número.
+
+    -   Error de datos (stock insuficiente, producto inexistente) o fila ilegible del
+        diario: la venta pasa a `conflicto` y se sigue con la próxima.
+    -   Cualquier otro error (sin conexión, timeout): se corta la pasada para no
+        alterar el orden y se reintenta con backoff exponencial (con jitter).
+    """
+
+    def __init__(
+        self,
+        destino: Optional[Destino] = None,
+        intervalo: float = 5.0,
+        tamano_lote: int = 50,
+        backoff_inicial: float = 1.0,
+        backoff_max: float = 60.0,
+        iniciar: bool = True,
+    ):
+        self.destino = destino or _registrar_en_postgres
+        self.intervalo = intervalo
+        self.tamano_lote = tamano_lote
+        self.backoff_inicial = backoff_inicial
+        self.backoff_max = backoff_max
+
+        self._cond = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._aviso = False
+        self._detener = False
+        self._intentos = 0
+
+        self._sincronizadas = 0
+        self._conflictos = 0
+        self._reintentos = 0
+        self._ultimo_error: Optional[str] = None
+        self._ultima_pasada: Optional[float] = None
+
+        init_db()
+        self._hilo = None
+        if iniciar:
+            self.iniciar()
+
+    def avisar(self):
+        """Despierta al hilo para sincronizar ya (se llama al registrar una venta)."""
+        with self._cond:
+            self._aviso = True
+            self._cond.notify_all()
+
+    def _marcar(self, numero: int, estado: str, venta_id: Optional[int] = None, error: Optional[str] = None):
+        conn = get_connection()
+        try:
+            conn.execute("""
+                UPDATE diario_ventas
+                SET estado = ?, venta_id = ?, error = ?, intentos = intentos + 1,
+                    sincronizada = CASE WHEN ? = 'sincronizada' THEN ? ELSE sincronizada END
+                WHERE numero = ?
+            """, (estado, venta_id, error, estado, _ahora(), numero))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _conflicto(self, numero: int, error: str):
+        logger.warning(f"Diario: venta provisoria #{numero} en conflicto: {error}")
+        self._marcar(numero, CONFLICTO, error=error)
+        with self._cond:
+            self._conflictos += 1
+
+    def sincronizar(self) -> int:
+        """
+        Una pasada sobre las pendientes (hasta tamano_lote). Retorna cuántas se procesaron
+        (registradas o en conflicto). Lanza el error transitorio que cortó la pasada, si lo hubo.
+        """
+        with self._sync_lock:
+            conn = get_connection()
+            try:
+                rows = conn.execute("""
+                    SELECT numero, clave, venta, items FROM diario_ventas
+                    WHERE estado = 'pendiente' ORDER BY numero LIMIT ?
+                """, (self.tamano_lote,)).fetchall()
+            finally:
+                conn.close()
+
+            procesadas = 0
+            for row in rows:
+                try:
+                    venta = Venta.model_validate_json(row["venta"])
+                    items = [VentaItem.model_validate(i) for i in json.loads(row["items"])]
+                except (ValueError, TypeError) as e:
+                    # Parsing again on the next pass gives the same error: it must not hold back the rest
+                    self._conflicto(row["numero"], f"Venta ilegible en el diario: {e}")
+                    procesadas += 1
+                    continue
+                try:
+                    venta_id = self.destino(venta, items, row["clave"])
+                except ERRORES_DE_CONFLICTO as e:
+                    self._conflicto(row["numero"], str(e))
+                else:
+                    self._marcar(row["numero"], SINCRONIZADA, venta_id=venta_id)
+                    with self._cond:
+                        self._sincronizadas += 1
+                procesadas += 1
+            return procesadas
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._detener:
+                    return
+                self._aviso = False
+            espera = self.intervalo
+            try:
+                procesadas = self.sincronizar()
+                with self._cond:
+                    self._intentos = 0
+                    self._ultima_pasada = time.time()
+                if procesadas == self.tamano_lote:
+                    espera = 0  # there may be more pending
+            except Exception as e:
+                with self._cond:
+                    self._ultimo_error = str(e)
+                    self._reintentos += 1
+                    self._intentos += 1
+                    espera = min(self.backoff_max, self.backoff_inicial * 2 ** (self._intentos - 1))
+                espera += random.uniform(0, espera / 2)
+                logger.warning(f"Diario: sin sincronizar ({e}); reintento en {espera:.1f}s")
+            with self._cond:
+                # While backing off, a new sale does not cut the wait short
+                self._cond.wait_for(lambda: self._detener or (self._aviso and not self._intentos), timeout=espera)
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener = False
+            self._hilo = threading.Thread(target=self._loop, name="pos-diario-sync", daemon=True)
+            self._hilo.start()
+
+    def detener(self, timeout: Optional[float] = 10.0):
+        """Detiene el hilo. Lo pendiente queda en el diario para la próxima ejecución."""
+        with self._cond:
+            self._detener = True
+            self._cond.notify_all()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def metricas(self) -> Dict[str, Any]:
+        """estado() del diario más los contadores del hilo en este proceso."""
+        res = estado()
+        with self._cond:
+            res.update({
+                "sincronizadas": self._sincronizadas,
+                "conflictos_nuevos": self._conflictos,
+                "reintentos": self._reintentos,
+                "reintentando": self._intentos > 0,
+                "ultimo_error": self._ultimo_error,
+                "ultima_pasada": self._ultima_pasada,
+            })
+        return res
+
+_sincronizador: Optional[SincronizadorVentas] = None
+_sincronizador_lock = threading.Lock()
+
+def obtener_sincronizador() -> SincronizadorVentas:
+    """Sincronizador compartido por el proceso (se inicia la primera vez que se pide)."""
+    global _sincronizador
+    with _sincronizador_lock:
+        if _sincronizador is None:
+            _sincronizador = SincronizadorVentas()
+            atexit.register(_sincronizador.detener)
+        return _sincronizador
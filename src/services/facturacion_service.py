@@ -0,0 +1,267 @@
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from src.services.postgres_service import get_connection, escapar_like, recalcular_totales_ventas
+from ..config import IVA_RATE
+
+def _rango_mes(anio: int, mes: int) -> Tuple[str, str]:
+    """Límites [desde, hasta) en texto ISO; `ventas.fecha` es TEXT ISO y compara lexicográficamente."""
+    desde = date(anio, mes, 1)
+    hasta = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+    return desde.isoformat(), hasta.isoformat()
+
+def _to_float(row: Dict[str, Any], keys) -> Dict[str, Any]:
+    for k in keys:
+        if row.get(k) is not None:
+            row[k] = float(row[k])
+    return row
+
+_MONTOS = ('bruto', 'descuento', 'neto_sin_iva', 'iva', 'final')
+
+# CUIT of a sale (alias `cu`): client by normalized name, or dealer for 'Nombre (Concesión)' sales
+_CUIT_LATERAL = """LEFT JOIN LATERAL (
+                SELECT COALESCE(
+                    (SELECT c.cuit_cuil FROM clientes c
+                     WHERE lower(trim(c.razon_social)) = lower(trim(v.cliente))
+                       AND c.cuit_cuil IS NOT NULL AND c.cuit_cuil <> ''
+                     LIMIT 1),
+                    (SELECT cs.cuit_cuil FROM concesionarios cs
+                     WHERE v.cliente LIKE '%%(Concesión)'
+                       AND lower(cs.nombre_socio) = lower(trim(replace(v.cliente, ' (Concesión)', '')))
+                     LIMIT 1)
+                ) AS cuit_cuil
+            ) cu ON TRUE"""
+
+def resumen_facturacion_mensual(anio: int, mes: int, marca: Optional[str] = None) -> Dict[str, List[Dict]]:
+    """
+    Totales del mes calculados en SQL (una sola consulta con GROUPING SETS).
+
+    Cada fila trae: ventas, bruto, descuento, neto_sin_iva, iva, final.
+    Retorna dict con 'por_marca', 'por_estado', 'por_tipo' (listas) y 'total' (dict).
+    """
+    desde, hasta = _rango_mes(anio, mes)
+    filtro_marca = "AND marca = %(marca)s" if marca else ""
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            WITH base AS (
+                SELECT marca,
+                       COALESCE(estado_facturacion, 'No Facturado') AS estado_facturacion,
+                       COALESCE(tipo_venta, 'Venta Directa') AS tipo_venta,
+                       total_bruto,
+                       total_neto,
+                       ROUND(total_neto / (1 + %(iva)s::numeric), 2) AS neto_sin_iva
+                FROM ventas
+                WHERE fecha >= %(desde)s AND fecha < %(hasta)s {filtro_marca}
+            )
+            SELECT marca, estado_facturacion, tipo_venta,
+                   GROUPING(marca) AS g_marca,
+                   GROUPING(estado_facturacion) AS g_estado,
+                   GROUPING(tipo_venta) AS g_tipo,
+                   COUNT(*) AS ventas,
+                   SUM(total_bruto) AS bruto,
+                   SUM(total_bruto - total_neto) AS descuento,
+                   SUM(neto_sin_iva) AS neto_sin_iva,
+                   SUM(total_neto - neto_sin_iva) AS iva,
+                   SUM(total_neto) AS final
+            FROM base
+            GROUP BY GROUPING SETS ((marca), (estado_facturacion), (tipo_venta), ())
+            ORDER BY marca, estado_facturacion, tipo_venta
+        """, {"iva": IVA_RATE, "desde": desde, "hasta": hasta, "marca": marca})
+        rows = [_to_float(dict(r), _MONTOS) for r in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    resumen = {"por_marca": [], "por_estado": [], "por_tipo": [],
+               "total": {"ventas": 0, **{k: 0.0 for k in _MONTOS}}}
+    for r in rows:
+        montos = {k: r[k] for k in ('ventas',) + _MONTOS}
+        if not r['g_marca']:
+            resumen['por_marca'].append({"marca": r['marca'], **montos})
+        elif not r['g_estado']:
+            resumen['por_estado'].append({"estado_facturacion": r['estado_facturacion'], **montos})
+        elif not r['g_tipo']:
+            resumen['por_tipo'].append({"tipo_venta": r['tipo_venta'], **montos})
+        else:
+            resumen['total'] = montos
+    return resumen
+
+def leer_ventas_facturacion(
+    anio: int,
+    mes: int,
+    marca: Optional[str] = None,
+    estado: Optional[str] = None,
+    texto: Optional[str] = None,
+    limite: Optional[int] = None,
+    despues_de: Optional[Tuple[str, int]] = None,
+) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+    """
+    Ventas del mes con neto sin IVA, IVA y CUIT ya resueltos en SQL, más recientes primero.
+
+    Paginación por keyset sobre (fecha, id): `despues_de` es el cursor devuelto por la
+    página anterior, así cada página cuesta lo mismo sin importar el volumen del mes.
+    `texto` filtra por cliente o CUIT (sin distinguir mayúsculas).
+
+    Retorna (ventas, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    desde, hasta = _rango_mes(anio, mes)
+    filtros = []
+    if marca:
+        filtros.append("v.marca = %(marca)s")
+    if estado:
+        filtros.append("COALESCE(v.estado_facturacion, 'No Facturado') = %(estado)s")
+    if texto:
+        filtros.append("(v.cliente ILIKE %(texto)s ESCAPE '\\' OR cu.cuit_cuil ILIKE %(texto)s ESCAPE '\\')")
+    if despues_de:
+        filtros.append("(v.fecha, v.id) < (%(cur_fecha)s, %(cur_id)s)")
+    filtro_sql = "".join(f" AND {f}" for f in filtros)
+    limite_sql = "LIMIT %(limite)s" if limite else ""
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT v.id, v.fecha, v.cliente, v.marca, v.total_bruto, v.descuento_porcentaje, v.total_neto,
+                   COALESCE(v.estado_facturacion, 'No Facturado') AS estado_facturacion,
+                   COALESCE(v.tipo_venta, 'Venta Directa') AS tipo_venta,
+                   ROUND(v.total_neto / (1 + %(iva)s::numeric), 2) AS neto_sin_iva,
+                   v.total_neto - ROUND(v.total_neto / (1 + %(iva)s::numeric), 2) AS iva,
+                   cu.cuit_cuil
+            FROM ventas v
+            {_CUIT_LATERAL}
+            WHERE v.fecha >= %(desde)s AND v.fecha < %(hasta)s{filtro_sql}
+            ORDER BY v.fecha DESC, v.id DESC
+            {limite_sql}
+        """, {
+            "iva": IVA_RATE, "desde": desde, "hasta": hasta, "marca": marca, "estado": estado,
+            "texto": f"%{escapar_like(texto.strip())}%" if texto else None,
+            "cur_fecha": despues_de[0] if despues_de else None,
+            "cur_id": despues_de[1] if despues_de else None,
+            # One extra row tells whether there is a next page
+            "limite": limite + 1 if limite else None,
+        })
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    siguiente = None
+    if limite and len(rows) > limite:
+        rows = rows[:limite]
+        siguiente = (rows[-1]['fecha'], rows[-1]['id'])
+
+    ventas = []
+    for r in rows:
+        v = _to_float(dict(r), ('total_bruto', 'descuento_porcentaje', 'total_neto', 'neto_sin_iva', 'iva'))
+        try:
+            v['fecha'] = datetime.fromisoformat(v['fecha'])
+        except ValueError:
+            v['fecha'] = datetime.now()
+        ventas.append(v)
+    return ventas, siguiente
+
+def actualizar_estado_facturacion_filtro(
+    estado_nuevo: str,
+    anio: int,
+    mes: int,
+    marca: Optional[str] = None,
+    cuit: Optional[str] = None,
+    estado_actual: Optional[str] = None,
+    texto: Optional[str] = None,
+    dry_run: bool = False,
+) -> int:
+    """
+    Cambia estado_facturacion de todas las ventas del mes que cumplan el filtro,
+    en un único UPDATE (ej. "todas las ventas VETA del mes para el CUIT X").
+
+    `cuit` compara contra el CUIT resuelto del cliente/socio ignorando guiones y espacios.
+    Retorna la cantidad de ventas modificadas (con dry_run, las que se modificarían, sin cambiar nada).
+    """
+    desde, hasta = _rango_mes(anio, mes)
+    filtros = []
+    if marca:
+        filtros.append("v.marca = %(marca)s")
+    if estado_actual:
+        filtros.append("COALESCE(v.estado_facturacion, 'No Facturado') = %(estado_actual)s")
+    if cuit:
+        filtros.append("regexp_replace(cu.cuit_cuil, '[^0-9]', '', 'g') = %(cuit)s")
+    if texto:
+        filtros.append("(v.cliente ILIKE %(texto)s ESCAPE '\\' OR cu.cuit_cuil ILIKE %(texto)s ESCAPE '\\')")
+    filtro_sql = "".join(f" AND {f}" for f in filtros)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        # Same predicate for the count and the UPDATE, so the confirmation shows what will change
+        condicion = f"""
+            id IN (
+                SELECT v.id
+                FROM ventas v
+                {_CUIT_LATERAL}
+                WHERE v.fecha >= %(desde)s AND v.fecha < %(hasta)s{filtro_sql}
+            )
+            AND COALESCE(estado_facturacion, 'No Facturado') <> %(estado_nuevo)s
+        """
+        params = {
+            "estado_nuevo": estado_nuevo, "desde": desde, "hasta": hasta, "marca": marca,
+            "estado_actual": estado_actual,
+            "cuit": "".join(ch for ch in cuit if ch.isdigit()) if cuit else None,
+            "texto": f"%{escapar_like(texto.strip())}%" if texto else None,
+        }
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*) AS n FROM ventas WHERE {condicion}", params)
+            return cursor.fetchone()['n']
+        cursor.execute(f"UPDATE ventas SET estado_facturacion = %(estado_nuevo)s WHERE {condicion}", params)
+        modificadas = cursor.rowcount
+        conn.commit()
+        return modificadas
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def leer_detalle_iva(venta_ids: List[int]) -> Dict[int, List[Dict]]:
+    """
+    Detalle por item con precios con y sin IVA (descuento de la venta aplicado), en SQL.
+    Retorna {venta_id: [filas]} para todas las ventas pedidas en una sola consulta.
+    """
+    if not venta_ids:
+        return {}
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            WITH det AS (
+                SELECT vi.id, vi.venta_id, vi.producto_id, vi.cantidad,
+                       COALESCE(s.codigo, '-') AS codigo,
+                       COALESCE(s.nombre, 'ID ' || vi.producto_id) AS producto,
+                       vi.precio_unitario * (1 - v.descuento_porcentaje / 100) AS unit_final
+                FROM ventas_items vi
+                JOIN ventas v ON v.id = vi.venta_id
+                LEFT JOIN stock s ON s.id = vi.producto_id
+                WHERE vi.venta_id = ANY(%(ids)s)
+            )
+            SELECT id, venta_id, producto_id, codigo, producto, cantidad,
+                   ROUND(unit_final / (1 + %(iva)s::numeric), 2) AS unit_neto,
+                   ROUND(unit_final, 2) AS unit_final,
+                   ROUND(unit_final * cantidad / (1 + %(iva)s::numeric), 2) AS subtotal_neto,
+                   ROUND(unit_final * cantidad, 2) AS subtotal_final
+            FROM det
+            ORDER BY venta_id, id
+        """, {"ids": list(venta_ids), "iva": IVA_RATE})
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    detalle: Dict[int, List[Dict]] = {}
+    for r in rows:
+        d = _to_float(dict(r), ('unit_neto', 'unit_final', 'subtotal_neto', 'subtotal_final'))
+        detalle.setdefault(d['venta_id'], []).append(d)
+    return detalle
+
+def recalcular_totales_mes(anio: int, mes: int, marca: Optional[str] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """Recálculo set-based de totales (ver recalcular_totales_ventas) para las ventas del mes."""
+    desde, hasta = _rango_mes(anio, mes)
+    return recalcular_totales_ventas(marca=marca, desde=desde, hasta=hasta, dry_run=dry_run)
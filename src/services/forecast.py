@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from src.services.postgres_service import get_connection
+from ..config import TIMEZONE
+
+# Ventanas de velocidad (días) y su peso en la mezcla
+VENTANA_CORTA = 28
+VENTANA_LARGA = 91
+PESO_CORTA = 0.6
+
+# Parámetros de reposición por defecto
+LEAD_TIME_DIAS = 30          # Demora del proveedor
+COBERTURA_OBJETIVO_DIAS = 60 # Días de venta que debe cubrir un pedido
+Z_SERVICIO = 1.65            # ~95% de nivel de servicio
+
+# Unidades necesarias para confiar plenamente en el factor estacional
+PRIOR_ESTACIONAL = 60.0
+
+
+def leer_matriz_ventas(marca: str, dias_historia: int = 3 * 365, hasta: Optional[datetime] = None):
+    """
+    Carga las unidades vendidas por producto y día (agregadas en SQL) y el stock
+    disponible (depósito + consignado) de todos los productos de la marca.
+
+    Retorna (productos_df, matriz, dias):
+        productos_df: una fila por producto (orden = filas de la matriz).
+        matriz: np.ndarray float32 de forma (productos, días).
+        dias: pd.DatetimeIndex con las columnas de la matriz.
+    """
+    hasta = (hasta or datetime.now(TIMEZONE)).date()
+    desde = hasta - timedelta(days=dias_historia - 1)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT s.id AS producto_id, s.codigo, s.nombre, s.categoria,
+                   s.cantidad AS stock,
+                   COALESCE(cs.consignado, 0) AS consignado
+            FROM stock s
+            LEFT JOIN (
+                SELECT producto_id, SUM(cantidad_disponible) AS consignado
+                FROM concesion_stock
+                WHERE marca = %s
+                GROUP BY producto_id
+            ) cs ON cs.producto_id = s.id
+            WHERE s.marca = %s
+            ORDER BY s.id
+        """, (marca, marca))
+        productos = pd.DataFrame([dict(r) for r in cursor.fetchall()],
+                                 columns=['producto_id', 'codigo', 'nombre', 'categoria', 'stock', 'consignado'])
+
+        # fecha is ISO text in local time, so its first 10 chars are the local day
+        cursor.execute("""
+            SELECT vi.producto_id, substring(v.fecha, 1, 10) AS dia, SUM(vi.cantidad) AS unidades
+            FROM ventas_items vi
+            JOIN ventas v ON v.id = vi.venta_id
+            WHERE vi.marca = %s AND v.fecha >= %s AND v.fecha < %s
+            GROUP BY vi.producto_id, substring(v.fecha, 1, 10)
+        """, (marca, desde.isoformat(), (hasta + timedelta(days=1)).isoformat()))
+        ventas = pd.DataFrame([dict(r) for r in cursor.fetchall()], columns=['producto_id', 'dia', 'unidades'])
+    finally:
+        conn.close()
+
+    productos['stock'] = productos['stock'].fillna(0).astype(float)
+    productos['consignado'] = productos['consignado'].astype(float)
+    productos['categoria'] = productos['categoria'].fillna('')
+
+    dias = pd.date_range(desde, hasta, freq='D')
+    matriz = np.zeros((len(productos), len(dias)), dtype=np.float32)
+
+    if not ventas.empty and not productos.empty:
+        fila = pd.Index(productos['producto_id']).get_indexer(ventas['producto_id'])
+        columna = dias.get_indexer(pd.to_datetime(ventas['dia']))
+        ok = (fila >= 0) & (columna >= 0)
+        # (producto, día) is unique after the GROUP BY, so plain assignment is enough
+        matriz[fila[ok], columna[ok]] = ventas['unidades'].to_numpy(dtype=np.float32)[ok]
+
+    return productos, matriz, dias
+
+
+def calcular_pronostico(
+    matriz: np.ndarray,
+    dias: pd.DatetimeIndex,
+    disponible: np.ndarray,
+    lead_time_dias: int = LEAD_TIME_DIAS,
+    cobertura_objetivo_dias: int = COBERTURA_OBJETIVO_DIAS,
+    z_servicio: float = Z_SERVICIO,
+) -> Dict[str, np.ndarray]:
+    """
+    Pronóstico vectorizado sobre la matriz producto x día (sin bucles por producto).
+
+    - Velocidad: mezcla de promedios móviles de VENTANA_CORTA y VENTANA_LARGA días
+      (sumas acumuladas sobre el eje de días).
+    - Estacionalidad: índice mensual por producto (tasa diaria del mes / tasa media),
+      contraído hacia 1 cuando hay pocas unidades o menos de un año de historia.
+      La velocidad reciente se desestacionaliza y se re-estacionaliza para el horizonte.
+    - Cobertura: disponible / velocidad pronosticada.
+    - Reposición: velocidad * (lead time + cobertura objetivo) + stock de seguridad - disponible.
+
+    Retorna dict de arrays (una posición por producto).
+    """
+    n_productos, n_dias = matriz.shape
+    matriz = matriz.astype(np.float64, copy=False)
+    disponible = np.asarray(disponible, dtype=np.float64)
+
+    if n_dias == 0:
+        ceros = np.zeros(n_productos)
+        return {
+            "venta_diaria": ceros, "factor_estacional": np.ones(n_productos),
+            "desvio_diario": ceros, "dias_cobertura": np.full(n_productos, np.inf),
+            "reorden_sugerido": np.zeros(n_productos, dtype=np.int64),
+        }
+
+    # --- Rolling velocity (windows clipped to the available history) ---
+    acumulado = np.concatenate([np.zeros((n_productos, 1)), np.cumsum(matriz, axis=1)], axis=1)
+    corta = min(VENTANA_CORTA, n_dias)
+    larga = min(VENTANA_LARGA, n_dias)
+    vel_corta = (acumulado[:, -1] - acumulado[:, -1 - corta]) / corta
+    vel_larga = (acumulado[:, -1] - acumulado[:, -1 - larga]) / larga
+    vel_reciente = PESO_CORTA * vel_corta + (1 - PESO_CORTA) * vel_larga
+
+    desvio = matriz[:, -larga:].std(axis=1)
+
+    # --- Monthly seasonality index ---
+    meses = dias.month.to_numpy() - 1
+    one_hot = np.zeros((n_dias, 12))
+    one_hot[np.arange(n_dias), meses] = 1.0
+    dias_por_mes = one_hot.sum(axis=0)
+    unidades_mes = matriz @ one_hot
+
+    total = acumulado[:, -1]
+    tasa_media = total / n_dias
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tasa_mes = np.where(dias_por_mes > 0, unidades_mes / np.maximum(dias_por_mes, 1), np.nan)
+        indice = tasa_mes / tasa_media[:, None]
+    indice = np.where(np.isfinite(indice), indice, 1.0)
+    indice = np.clip(indice, 0.25, 4.0)
+
+    # Shrink toward 1: little volume or less than a year since the first sale means noise
+    vendio = matriz > 0
+    primera_venta = np.where(vendio.any(axis=1), vendio.argmax(axis=1), n_dias)
+    historia = np.minimum(1.0, (n_dias - primera_venta) / 365.0)
+    confianza = (total / (total + PRIOR_ESTACIONAL)) * historia
+    indice = 1.0 + (indice - 1.0) * confianza[:, None]
+
+    # Factor of the recent window vs. the coming horizon (averaged by day)
+    meses_recientes = meses[-larga:]
+    inicio = dias[-1] + pd.Timedelta(days=1)
+    horizonte = pd.date_range(inicio, periods=lead_time_dias + cobertura_objetivo_dias, freq='D')
+    meses_horizonte = horizonte.month.to_numpy() - 1
+    f_reciente = indice[:, meses_recientes].mean(axis=1)
+    f_horizonte = indice[:, meses_horizonte].mean(axis=1)
+    factor = f_horizonte / f_reciente
+
+    venta_diaria = vel_reciente * factor
+
+    # --- Cover and reorder ---
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dias_cobertura = np.where(venta_diaria > 0, np.maximum(disponible, 0) / venta_diaria, np.inf)
+
+    seguridad = z_servicio * desvio * np.sqrt(lead_time_dias)
+    objetivo = venta_diaria * (lead_time_dias + cobertura_objetivo_dias) + seguridad
+    reorden = np.ceil(np.maximum(objetivo - disponible, 0)).astype(np.int64)
+
+    return {
+        "venta_diaria": venta_diaria,
+        "factor_estacional": factor,
+        "desvio_diario": desvio,
+        "dias_cobertura": dias_cobertura,
+        "reorden_sugerido": reorden,
+    }
+
+
+def pronosticar_reposicion(
+    marca: str,
+    dias_historia: int = 3 * 365,
+    lead_time_dias: int = LEAD_TIME_DIAS,
+    cobertura_objetivo_dias: int = COBERTURA_OBJETIVO_DIAS,
+) -> pd.DataFrame:
+    """
+    Días de cobertura y reposición sugerida para todos los productos de una marca.
+    El stock disponible es depósito + consignado, ya que las ventas de concesión
+    también forman parte de la historia.
+    """
+    productos, matriz, dias = leer_matriz_ventas(marca, dias_historia)
+    if productos.empty:
+        return pd.DataFrame()
+
+    productos['disponible'] = productos['stock'] + productos['consignado']
+    res = calcular_pronostico(
+        matriz, dias, productos['disponible'].to_numpy(),
+        lead_time_dias=lead_time_dias, cobertura_objetivo_dias=cobertura_objetivo_dias,
+    )
+
+    df = productos.assign(
+        venta_diaria=res['venta_diaria'].round(2),
+        factor_estacional=res['factor_estacional'].round(2),
+        dias_cobertura=np.where(np.isfinite(res['dias_cobertura']), res['dias_cobertura'].round(0), np.nan),
+        reorden_sugerido=res['reorden_sugerido'],
+    )
+    return df.sort_values(['dias_cobertura', 'reorden_sugerido'], ascending=[True, False], na_position='last')
@@ -0,0 +1,354 @@
+import csv
+import io
+from datetime import date, datetime
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+from src.services.postgres_service import get_connection, recalcular_totales_ventas
+
+# Tablas que se pueden exportar/importar (orden seguro para importar por las FK)
+TABLAS = ("stock", "clientes", "concesionarios", "concesion_stock", "ventas", "ventas_items")
+
+# Cada cuántas filas se informa el progreso de COPY
+PROGRESO_CADA = 5000
+
+Progreso = Optional[Callable[[int], None]]
+
+def _validar_tabla(tabla: str) -> str:
+    if tabla not in TABLAS:
+        raise ValueError(f"Tabla '{tabla}' no soportada. Opciones: {', '.join(TABLAS)}")
+    return tabla
+
+class _ContadorEscritura:
+    """File wrapper for COPY TO: counts rows as psycopg2 writes them."""
+    def __init__(self, destino: IO, progreso: Progreso):
+        self.destino, self.progreso, self.filas = destino, progreso, 0
+
+    def write(self, data):
+        # psycopg2 only decodes for real text files; do it here for wrapped ones
+        if isinstance(data, bytes) and isinstance(self.destino, io.TextIOBase):
+            data = data.decode("utf-8")
+        self.destino.write(data)
+        antes = self.filas
+        self.filas += data.count("\n") if isinstance(data, str) else data.count(b"\n")
+        if self.progreso and self.filas // PROGRESO_CADA > antes // PROGRESO_CADA:
+            self.progreso(self.filas)
+
+class _ContadorLectura:
+    """File wrapper for COPY FROM: counts rows as psycopg2 reads them."""
+    def __init__(self, origen: IO, progreso: Progreso):
+        self.origen, self.progreso, self.filas = origen, progreso, 0
+
+    def read(self, size=-1):
+        data = self.origen.read(size)
+        antes = self.filas
+        self.filas += data.count("\n") if isinstance(data, str) else data.count(b"\n")
+        if self.progreso and self.filas // PROGRESO_CADA > antes // PROGRESO_CADA:
+            self.progreso(self.filas)
+        return data
+
+    def readline(self, size=-1):
+        line = self.origen.readline(size)
+        self.filas += 1 if line else 0
+        return line
+
+def exportar_tabla(tabla: str, destino: IO, progreso: Progreso = None) -> int:
+    """
+    Vuelca una tabla completa a CSV (con encabezado) usando COPY ... TO STDOUT,
+    en streaming: no se materializa en memoria. Retorna la cantidad de filas.
+    """
+    _validar_tabla(tabla)
+    salida = _ContadorEscritura(destino, progreso)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.copy_expert(f"COPY (SELECT * FROM {tabla} ORDER BY id) TO STDOUT WITH CSV HEADER", salida)
+    finally:
+        conn.close()
+    return max(salida.filas - 1, 0)
+
+def _sincronizar_secuencia(cursor, tabla: str):
+    """Deja la secuencia SERIAL de `tabla` después del mayor id (tras insertar ids explícitos)."""
+    cursor.execute(f"""
+        SELECT setval(pg_get_serial_sequence('{tabla}', 'id'),
+                      COALESCE((SELECT MAX(id) FROM {tabla}), 0) + 1, false)
+    """)
+
+def importar_tabla(tabla: str, origen: IO, progreso: Progreso = None) -> int:
+    """
+    Carga un CSV con encabezado (columnas de la tabla, incluido id) con COPY ... FROM STDIN
+    en una sola transacción, conservando los ids; al final sincroniza la secuencia.
+    Retorna la cantidad de filas importadas.
+    """
+    _validar_tabla(tabla)
+    encabezado = origen.readline()
+    columnas = [c.strip().strip('"') for c in encabezado.strip().split(",")]
+    if not columnas or not all(c.replace("_", "").isalnum() for c in columnas):
+        raise ValueError(f"Encabezado CSV inválido: {encabezado!r}")
+
+    entrada = _ContadorLectura(origen, progreso)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH CSV", entrada)
+        filas = cursor.rowcount
+        if "id" in columnas:
+            _sincronizar_secuencia(cursor, tabla)
+        conn.commit()
+        return filas
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+# Hoja de Sheets -> (tabla, columnas) en orden de carga (por las FK)
+_COLUMNAS_SHEETS = {
+    "stock": ("id", "codigo", "nombre", "categoria", "cantidad", "precio_unitario", "min_stock", "marca"),
+    "ventas": ("id", "fecha", "cliente", "total_bruto", "descuento_porcentaje", "total_neto", "estado", "marca"),
+    "ventas_items": ("id", "venta_id", "producto_id", "cantidad", "precio_unitario", "subtotal", "marca"),
+}
+
+def _valor(r: Dict[str, Any], campo: str, convertir: Callable[[Any], Any], defecto: Any = None) -> Any:
+    """`campo` convertido; si está vacío devuelve `defecto` (None = obligatorio, error)."""
+    v = r.get(campo, "")
+    if v is None or str(v).strip() == "":
+        if defecto is None:
+            raise ValueError(f"'{campo}' vacío")
+        return defecto
+    try:
+        return convertir(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{campo}' inválido: {v!r}") from None
+
+def _entero(v: Any) -> int:
+    # int(2.5) would silently truncate
+    n = float(v)
+    if not n.is_integer():
+        raise ValueError(v)
+    return int(n)
+
+def _texto(v: Any) -> str:
+    texto = str(v).strip()
+    if not texto:
+        raise ValueError(v)
+    return texto
+
+def _fecha(v: Any) -> str:
+    """Fecha de VENTAS ('%Y-%m-%d %H:%M:%S', como la escribe sheets.py, o ISO) en texto ISO."""
+    texto = str(v).strip()
+    try:
+        return datetime.strptime(texto, "%Y-%m-%d %H:%M:%S").isoformat()
+    except ValueError:
+        return datetime.fromisoformat(texto).isoformat()
+
+def _fila_sheets(tabla: str, r: Dict[str, Any], marca: str) -> tuple:
+    """
+    Fila de la tabla a partir de un registro de Sheets. A diferencia de los parsers de
+    sheets.py (que toleran datos sucios para mostrar), acá todo se valida: una fecha que no
+    se entiende o un campo obligatorio vacío es un error, no un valor inventado.
+    """
+    from src.services.postgres_service import _normalizar_codigo
+    if tabla == "stock":
+        return (_valor(r, "id", _entero), _normalizar_codigo(str(r.get("codigo", "")).strip()),
+                _valor(r, "nombre", _texto), str(r.get("categoria", "")).strip(),
+                _valor(r, "cantidad", _entero, 0), _valor(r, "precio_unitario", float, 0.0),
+                _valor(r, "min_stock", _entero, 5), marca)
+    if tabla == "ventas":
+        return (_valor(r, "id", _entero), _valor(r, "fecha", _fecha), str(r.get("cliente", "")).strip(),
+                _valor(r, "total_bruto", float, 0.0), _valor(r, "descuento_porcentaje", float, 0.0),
+                _valor(r, "total_neto", float, 0.0), _valor(r, "estado", _texto, "confirmada"), marca)
+    return (_valor(r, "id", _entero), _valor(r, "venta_id", _entero), _valor(r, "producto_id", _entero),
+            _valor(r, "cantidad", _entero), _valor(r, "precio_unitario", float),
+            _valor(r, "subtotal", float), marca)
+
+def _filas_desde_sheets(tabla: str, registros: List[Tuple[int, Dict[str, Any]]], marca: str) -> Iterator[tuple]:
+    """
+    Arma las filas de la tabla a partir de (número de fila, registro) de leer_registros_por_bloques.
+    Un registro inválido corta la importación con un ValueError que indica la fila de la hoja.
+    """
+    from src.services.sheets import _limpiar_registro
+    for fila_num, record in registros:
+        try:
+            fila = _fila_sheets(tabla, _limpiar_registro(record), marca)
+        except ValueError as e:
+            raise ValueError(f"Hoja {tabla}, fila {fila_num}: {e}") from None
+        yield fila
+
+def importar_desde_sheets(
+    marca: str,
+    spreadsheet_id: Optional[str] = None,
+    tamano_bloque: int = 5000,
+    progreso: Optional[Callable[[str, int], None]] = None,
+) -> Dict[str, int]:
+    """
+    Migra una planilla histórica (hojas STOCK / VENTAS / VENTAS_ITEMS) a Postgres.
+
+    Lee cada hoja en bloques de `tamano_bloque` filas, valida cada registro (ver _fila_sheets:
+    un dato inválido aborta con el número de fila), los etiqueta con `marca` y carga cada
+    bloque con COPY: la memoria queda acotada a un bloque sin importar el tamaño de la hoja.
+    Conserva los ids originales (un id repetido aborta todo) y al final sincroniza las secuencias.
+    Todo en una sola transacción. Retorna las filas importadas por tabla.
+    """
+    from src.config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
+    from src.services.sheets import leer_registros_por_bloques
+    hojas = {"stock": SHEET_STOCK, "ventas": SHEET_VENTAS, "ventas_items": SHEET_VENTAS_ITEMS}
+
+    resultado = {}
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        for tabla, columnas in _COLUMNAS_SHEETS.items():
+            filas = 0
+            for registros in leer_registros_por_bloques(hojas[tabla], spreadsheet_id, tamano_bloque):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(_filas_desde_sheets(tabla, registros, marca))
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH CSV", buffer)
+                filas += cursor.rowcount
+                if progreso:
+                    progreso(tabla, filas)
+            _sincronizar_secuencia(cursor, tabla)
+            resultado[tabla] = filas
+        conn.commit()
+        return resultado
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def _meses(desde: date, hasta: date) -> Iterator[Tuple[date, date]]:
+    """Intervalos [inicio, fin) mes a mes que cubren [desde, hasta)."""
+    inicio = date(desde.year, desde.month, 1)
+    while inicio < hasta:
+        fin = date(inicio.year + 1, 1, 1) if inicio.month == 12 else date(inicio.year, inicio.month + 1, 1)
+        yield max(inicio, desde), min(fin, hasta)
+        inicio = fin
+
+def recalcular_totales_por_mes(
+    desde: date,
+    hasta: date,
+    marca: Optional[str] = None,
+    dry_run: bool = False,
+) -> Iterator[Tuple[date, Dict[str, Any]]]:
+    """
+    Recalcula los totales de ventas mes a mes (una transacción corta por mes, para no
+    bloquear la tabla entera durante un trabajo largo). Va devolviendo (mes, resultado).
+    """
+    for inicio, fin in _meses(desde, hasta):
+        yield inicio, recalcular_totales_ventas(
+            marca=marca, desde=inicio.isoformat(), hasta=fin.isoformat(), dry_run=dry_run
+        )
+
+def rango_ventas() -> Optional[Tuple[date, date]]:
+    """Primer día y día siguiente al último con ventas, o None si no hay ventas."""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(substring(fecha, 1, 10)) AS desde, MAX(substring(fecha, 1, 10)) AS hasta FROM ventas")
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    if not row or not row['desde']:
+        return None
+    hasta = date.fromisoformat(row['hasta'])
+    return date.fromisoformat(row['desde']), date.fromordinal(hasta.toordinal() + 1)
+
+def analizar_tablas():
+    """ANALYZE de las tablas principales (estadísticas del planificador tras cargas masivas)."""
+    conn = get_connection()
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        for tabla in TABLAS:
+            cursor.execute(f"ANALYZE {tabla}")
+    finally:
+        conn.close()
+
+def reconciliar_stock(corregir: bool = False) -> Dict[str, List[Dict]]:
+    """
+    Busca inconsistencias de stock con consultas set-based:
+
+    - 'stock_negativo': productos con cantidad < 0 (solo se informan).
+    - 'concesion_duplicada': más de una fila de concesion_stock para el mismo
+      concesionario y producto (el resto del código asume una sola).
+    - 'marca_items': items cuya marca no coincide con la de su venta.
+    - 'concesion_negativa': stock en concesión < 0 (solo se informan).
+
+    Con corregir=True, en una sola transacción se fusionan los duplicados de
+    concesión (sumando cantidades en la fila más antigua) y se alinea la marca de
+    los items con la de su venta.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id, codigo, nombre, marca, cantidad FROM stock WHERE cantidad < 0 ORDER BY id")
+        stock_negativo = [dict(r) for r in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT cs.concesionario_id, c.nombre_socio, cs.producto_id,
+                   COUNT(*) AS filas, SUM(cs.cantidad_disponible) AS total, array_agg(cs.id ORDER BY cs.id) AS ids
+            FROM concesion_stock cs
+            LEFT JOIN concesionarios c ON c.id = cs.concesionario_id
+            GROUP BY cs.concesionario_id, c.nombre_socio, cs.producto_id
+            HAVING COUNT(*) > 1
+            ORDER BY cs.concesionario_id, cs.producto_id
+        """)
+        duplicados = [dict(r, total=float(r['total'])) for r in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT cs.id, c.nombre_socio, cs.producto_id, cs.cantidad_disponible
+            FROM concesion_stock cs
+            LEFT JOIN concesionarios c ON c.id = cs.concesionario_id
+            WHERE cs.cantidad_disponible < 0
+            ORDER BY cs.id
+        """)
+        concesion_negativa = [dict(r, cantidad_disponible=float(r['cantidad_disponible'])) for r in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT vi.id, vi.venta_id, vi.marca AS marca_item, v.marca AS marca_venta
+            FROM ventas_items vi
+            JOIN ventas v ON v.id = vi.venta_id
+            WHERE vi.marca IS DISTINCT FROM v.marca
+            ORDER BY vi.id
+        """)
+        marca_items = [dict(r) for r in cursor.fetchall()]
+
+        if corregir:
+            if duplicados:
+                # Keep the oldest row with the summed quantity, delete the rest
+                cursor.execute("""
+                    WITH grupos AS (
+                        SELECT MIN(id) AS conservar, array_agg(id) AS ids, SUM(cantidad_disponible) AS total
+                        FROM concesion_stock
+                        GROUP BY concesionario_id, producto_id
+                        HAVING COUNT(*) > 1
+                    ), actualizadas AS (
+                        UPDATE concesion_stock cs SET cantidad_disponible = g.total
+                        FROM grupos g WHERE cs.id = g.conservar
+                        RETURNING cs.id
+                    )
+                    DELETE FROM concesion_stock cs
+                    USING grupos g
+                    WHERE cs.id = ANY(g.ids) AND cs.id <> g.conservar
+                """)
+            if marca_items:
+                cursor.execute("""
+                    UPDATE ventas_items vi SET marca = v.marca
+                    FROM ventas v
+                    WHERE v.id = vi.venta_id AND vi.marca IS DISTINCT FROM v.marca
+                """)
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+    return {
+        "stock_negativo": stock_negativo,
+        "concesion_duplicada": duplicados,
+        "concesion_negativa": concesion_negativa,
+        "marca_items": marca_items,
+    }
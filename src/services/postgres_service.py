@@ -16,9 +16,9 @@ INSTRUCCIONES DE CONFIGURACIÓN (SUPABASE / POSTGRESQL):
 
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 try:
     import streamlit as st
 except ImportError:
@@ -26,6 +26,15 @@ except ImportError:
 
 from ..models import StockItem, Venta, VentaItem
 
+class ConflictoEdicionError(ValueError):
+    """Filas modificadas por otro usuario/proceso desde que se cargaron para editar."""
+    def __init__(self, ids: List[int]):
+        self.ids = ids
+        super().__init__(f"Los productos {', '.join(map(str, ids))} cambiaron desde que se cargaron. Recarga y vuelve a editar.")
+
+class VentaRechazadaError(ValueError):
+    """La base rechaza la venta por sus datos (producto inexistente, stock insuficiente): reintentar no cambia nada."""
+
 def get_connection():
     """Establishes a connection to the PostgreSQL database."""
     db_url = None
@@ -51,7 +60,7 @@ def get_connection():
     return conn
 
 def init_db():
-    """Initializes the database schema if it doesn't exist."""
+    """Initializes the database schema if it doesn't exist. Connection or DDL errors are raised."""
     try:
         conn = get_connection()
         cursor = conn.cursor()
@@ -136,15 +145,86 @@ def init_db():
             )
         """)
         
+        # Índice parcial: solo contiene filas en o bajo el mínimo, así las alertas
+        # de stock crítico no recorren todo el catálogo.
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stock_critico
+            ON stock (marca, categoria)
+            WHERE cantidad <= min_stock
+        """)
+
+        # Consultas por mes y paginación keyset (fecha es TEXT ISO, ordena cronológicamente)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_fecha_id ON ventas (fecha, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_marca_fecha_id ON ventas (marca, fecha, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_clientes_razon_norm ON clientes (lower(trim(razon_social)))")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_items_venta ON ventas_items (venta_id)")
+
+        # Clave de idempotencia de las ventas que llegan desde el diario local del POS
+        cursor.execute("ALTER TABLE ventas ADD COLUMN IF NOT EXISTS idempotency_key TEXT")
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_ventas_idempotency_key
+            ON ventas (idempotency_key) WHERE idempotency_key IS NOT NULL
+        """)
+
+        # Búsqueda de clientes: prefijo sobre razón social normalizada y CUIT solo dígitos
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_clientes_razon_prefijo
+            ON clientes (marca, lower(trim(razon_social)) text_pattern_ops)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_clientes_cuit_digitos
+            ON clientes (marca, regexp_replace(cuit_cuil, '[^0-9]', '', 'g') text_pattern_ops)
+        """)
+        # Búsqueda de productos (POS): código exacto/prefijo y prefijo del nombre
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_codigo ON stock (marca, codigo text_pattern_ops)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_nombre_prefijo ON stock (marca, lower(nombre) text_pattern_ops)")
+
+        # Trigram indexes for "contains"/fuzzy search; pg_trgm may not be installable on every server
+        cursor.execute("SAVEPOINT trgm")
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_clientes_razon_trgm
+                ON clientes USING gin (lower(trim(razon_social)) gin_trgm_ops)
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_nombre_trgm ON stock USING gin (lower(nombre) gin_trgm_ops)")
+            cursor.execute("RELEASE SAVEPOINT trgm")
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT trgm")
+
         conn.commit()
-    except Exception as e:
-        print(f"Error initializing DB: {e}")
-        # Consider re-raising if critical
+    # No except: errors reach the caller (admin.py migrar exits non-zero, the app retries on the next run)
     finally:
         if 'conn' in locals(): conn.close()
 
+_PG_TRGM: Optional[bool] = None
+
+def pg_trgm_disponible(cursor) -> bool:
+    """Si la extensión pg_trgm está instalada (se consulta una vez por proceso)."""
+    global _PG_TRGM
+    if _PG_TRGM is None:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        _PG_TRGM = cursor.fetchone() is not None
+    return _PG_TRGM
+
+def escapar_like(texto: str) -> str:
+    """Escapa los comodines de LIKE (%, _) tipeados por el usuario."""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
 # --- STOCK CRUD ---
 
+def _row_to_stock_item(row) -> StockItem:
+    return StockItem(
+        id=row['id'],
+        codigo=row['codigo'] if row['codigo'] else "",
+        nombre=row['nombre'],
+        categoria=row['categoria'] if row['categoria'] else "",
+        cantidad=row['cantidad'],
+        precio_unitario=float(row['precio_unitario']),
+        min_stock=row['min_stock'],
+        marca=row['marca']
+    )
+
 def leer_stock(marca: Optional[str] = None) -> List[StockItem]:
     conn = get_connection()
     cursor = conn.cursor()
@@ -154,20 +234,229 @@ def leer_stock(marca: Optional[str] = None) -> List[StockItem]:
         else:
             cursor.execute("SELECT * FROM stock")
         rows = cursor.fetchall()
-        
-        items = []
-        for row in rows:
-            items.append(StockItem(
-                id=row['id'],
-                codigo=row['codigo'] if row['codigo'] else "",
-                nombre=row['nombre'],
-                categoria=row['categoria'] if row['categoria'] else "",
-                cantidad=row['cantidad'],
-                precio_unitario=float(row['precio_unitario']),
-                min_stock=row['min_stock'],
-                marca=row['marca']
-            ))
-        return items
+        return [_row_to_stock_item(row) for row in rows]
+    finally:
+        conn.close()
+
+def leer_productos_por_ids(ids: List[int]) -> List[StockItem]:
+    """Lee solo los productos indicados (ej. para nombrar un ranking sin cargar el catálogo)."""
+    if not ids:
+        return []
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT * FROM stock WHERE id = ANY(%s)", (list(ids),))
+        return [_row_to_stock_item(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def leer_stock_critico(marca: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Productos en o bajo su stock mínimo (incluye agotados), resueltos con idx_stock_critico.
+
+    Retorna:
+        items: List[StockItem] ordenados por cantidad ascendente.
+        por_categoria: List[dict] con {categoria, criticos, agotados}.
+        criticos / agotados: totales.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        filtro_marca = "AND marca = %s" if marca else ""
+        params = (marca,) if marca else ()
+
+        cursor.execute(f"""
+            SELECT * FROM stock
+            WHERE cantidad <= min_stock {filtro_marca}
+            ORDER BY cantidad ASC, nombre ASC
+        """, params)
+        items = [_row_to_stock_item(row) for row in cursor.fetchall()]
+
+        cursor.execute(f"""
+            SELECT COALESCE(categoria, '') AS categoria,
+                   COUNT(*) AS criticos,
+                   COUNT(*) FILTER (WHERE cantidad <= 0) AS agotados
+            FROM stock
+            WHERE cantidad <= min_stock {filtro_marca}
+            GROUP BY COALESCE(categoria, '')
+            ORDER BY criticos DESC, categoria ASC
+        """, params)
+        por_categoria = [dict(row) for row in cursor.fetchall()]
+
+        return {
+            "items": items,
+            "por_categoria": por_categoria,
+            "criticos": sum(c['criticos'] for c in por_categoria),
+            "agotados": sum(c['agotados'] for c in por_categoria),
+        }
+    finally:
+        conn.close()
+
+def _normalizar_codigo(codigo: str) -> str:
+    return codigo.zfill(2) if codigo.isdigit() else codigo
+
+def buscar_producto_por_codigo(marca: str, codigo: str) -> Optional[StockItem]:
+    """
+    Producto con ese código exacto (lectora de código de barras / tipeo en el POS).
+    Acepta el código sin el cero inicial ("2" encuentra "02").
+    """
+    codigo = codigo.strip()
+    if not codigo:
+        return None
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT * FROM stock
+            WHERE marca = %s AND codigo IN (%s, %s)
+            ORDER BY codigo = %s DESC, id
+            LIMIT 1
+        """, (marca, codigo, _normalizar_codigo(codigo), codigo))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    return _row_to_stock_item(row) if row else None
+
+def buscar_productos(marca: str, texto: str, limite: int = 20) -> List[StockItem]:
+    """
+    Mejores coincidencias de productos para un texto (con stock y precio), sin leer el catálogo.
+
+    Orden: código exacto, prefijo de código, prefijo del nombre y, si pg_trgm está
+    instalado, fragmento o similitud del nombre.
+    """
+    q = texto.strip().lower()
+    if not q:
+        return []
+    q_like = escapar_like(q)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        condiciones = ["codigo IN (%(codigo)s, %(codigo_norm)s)", "codigo LIKE %(codigo_prefijo)s", "lower(nombre) LIKE %(prefijo)s"]
+        similitud = ""
+        if pg_trgm_disponible(cursor):
+            condiciones.append("lower(nombre) LIKE %(contiene)s")
+            condiciones.append("lower(nombre) %% %(q)s")
+            similitud = "similarity(lower(nombre), %(q)s) DESC,"
+
+        cursor.execute(f"""
+            SELECT * FROM stock
+            WHERE marca = %(marca)s AND ({' OR '.join(condiciones)})
+            ORDER BY codigo IN (%(codigo)s, %(codigo_norm)s) DESC,
+                     codigo LIKE %(codigo_prefijo)s DESC,
+                     lower(nombre) LIKE %(prefijo)s DESC,
+                     {similitud}
+                     nombre
+            LIMIT %(limite)s
+        """, {
+            "marca": marca, "q": q, "limite": limite,
+            "codigo": texto.strip(), "codigo_norm": _normalizar_codigo(texto.strip()),
+            "codigo_prefijo": escapar_like(texto.strip()) + "%",
+            "prefijo": q_like + "%", "contiene": "%" + q_like + "%",
+        })
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    return [_row_to_stock_item(row) for row in rows]
+
+def leer_stock_pagina(
+    marca: str,
+    limite: int = 50,
+    despues_de_id: Optional[int] = None,
+    solo_criticos: bool = False,
+) -> Tuple[List[StockItem], Optional[int]]:
+    """
+    Página del catálogo ordenada por id (keyset: `despues_de_id` es el último id de la página anterior).
+    Retorna (items, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    filtros = ["marca = %(marca)s"]
+    if despues_de_id is not None:
+        filtros.append("id > %(despues_de)s")
+    if solo_criticos:
+        filtros.append("cantidad <= min_stock")
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT * FROM stock
+            WHERE {' AND '.join(filtros)}
+            ORDER BY id
+            LIMIT %(limite)s
+        """, {"marca": marca, "despues_de": despues_de_id, "limite": limite + 1})
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    siguiente = rows[limite - 1]['id'] if len(rows) > limite else None
+    return [_row_to_stock_item(row) for row in rows[:limite]], siguiente
+
+
+_CAMPOS_EDITABLES = ('codigo', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'min_stock')
+
+def calcular_cambios_productos(originales: List[StockItem], editados: List[StockItem]) -> List[Tuple[StockItem, StockItem]]:
+    """Pares (original, editado) de los productos que realmente cambiaron, comparando por id."""
+    por_id = {o.id: o for o in originales}
+    cambios = []
+    for nuevo in editados:
+        original = por_id.get(nuevo.id)
+        if original is None:
+            raise ValueError(f"Producto ID {nuevo.id} no pertenece a la versión cargada.")
+        nuevo = nuevo.model_copy(update={"codigo": _normalizar_codigo(nuevo.codigo)})
+        if any(getattr(original, c) != getattr(nuevo, c) for c in _CAMPOS_EDITABLES):
+            cambios.append((original, nuevo))
+    return cambios
+
+def actualizar_productos_bulk(originales: List[StockItem], editados: List[StockItem]) -> int:
+    """
+    Aplica en una transacción (un solo UPDATE) los cambios de `editados` respecto de `originales`.
+
+    Control optimista: cada fila solo se actualiza si en la base sigue igual a la versión
+    cargada. Si alguna cambió (ej. una venta descontó stock), no se aplica nada y se lanza
+    ConflictoEdicionError con los ids en conflicto.
+    Retorna la cantidad de productos actualizados.
+    """
+    cambios = calcular_cambios_productos(originales, editados)
+    if not cambios:
+        return 0
+
+    filas = [
+        (n.id, n.codigo, n.nombre, n.categoria, n.cantidad, n.precio_unitario, n.min_stock,
+         o.codigo, o.nombre, o.categoria, o.cantidad, o.precio_unitario, o.min_stock)
+        for o, n in cambios
+    ]
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        actualizados = execute_values(cursor, """
+            UPDATE stock AS s
+            SET codigo = v.codigo, nombre = v.nombre, categoria = v.categoria,
+                cantidad = v.cantidad, precio_unitario = v.precio_unitario, min_stock = v.min_stock
+            FROM (VALUES %s) AS v(id, codigo, nombre, categoria, cantidad, precio_unitario, min_stock,
+                                  o_codigo, o_nombre, o_categoria, o_cantidad, o_precio, o_min_stock)
+            WHERE s.id = v.id
+              AND COALESCE(s.codigo, '') = v.o_codigo
+              AND s.nombre = v.o_nombre
+              AND COALESCE(s.categoria, '') = v.o_categoria
+              AND s.cantidad = v.o_cantidad
+              AND s.precio_unitario = v.o_precio
+              AND s.min_stock = v.o_min_stock
+            RETURNING s.id
+        """, filas,
+            template="(%s::int, %s, %s, %s, %s::int, %s::numeric, %s::int, %s, %s, %s, %s::int, %s::numeric, %s::int)",
+            page_size=len(filas), fetch=True)
+
+        conflictos = sorted({f[0] for f in filas} - {r['id'] for r in actualizados})
+        if conflictos:
+            raise ConflictoEdicionError(conflictos)
+
+        conn.commit()
+        return len(actualizados)
+    except Exception as e:
+        conn.rollback()
+        raise e
     finally:
         conn.close()
 
@@ -297,6 +586,32 @@ def actualizar_estado_facturacion(venta_id: int, estado: str):
     finally:
         conn.close()
 
+def actualizar_estados_facturacion(cambios: Dict[int, str]) -> int:
+    """
+    Aplica varios cambios de estado_facturacion ({venta_id: estado}) en un único UPDATE.
+    Retorna la cantidad de ventas modificadas.
+    """
+    if not cambios:
+        return 0
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        ids = list(cambios.keys())
+        cursor.execute("""
+            UPDATE ventas v
+            SET estado_facturacion = c.estado
+            FROM unnest(%s::int[], %s::text[]) AS c(id, estado)
+            WHERE v.id = c.id
+        """, (ids, [cambios[i] for i in ids]))
+        modificadas = cursor.rowcount
+        conn.commit()
+        return modificadas
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
 def leer_ventas_items(marca: Optional[str] = None) -> List[VentaItem]:
     conn = get_connection()
     cursor = conn.cursor()
@@ -346,22 +661,32 @@ def get_next_venta_item_id() -> int:
     finally:
         conn.close()
 
-def registrar_venta(venta: Venta, items: List[VentaItem]):
+def registrar_venta(venta: Venta, items: List[VentaItem], idempotency_key: Optional[str] = None):
+    """
+    Registra la venta (stock, cabecera e items) en una transacción y retorna su id.
+    Con `idempotency_key`, repetir la misma venta no la duplica: retorna el id ya registrado.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
     try:
+        if idempotency_key:
+            cursor.execute("SELECT id FROM ventas WHERE idempotency_key = %s", (idempotency_key,))
+            existente = cursor.fetchone()
+            if existente:
+                return existente['id']
+
         # 1. Validation & Stock Update
         for item in items:
             cursor.execute("SELECT cantidad, nombre FROM stock WHERE id = %s", (item.producto_id,))
             res = cursor.fetchone()
             if not res:
-                raise ValueError(f"Producto ID {item.producto_id} no existe.")
+                raise VentaRechazadaError(f"Producto ID {item.producto_id} no existe.")
             
             stock_actual, nombre_prod = res['cantidad'], res['nombre']
             
             if stock_actual < item.cantidad:
-                raise ValueError(f"Stock insuficiente para {nombre_prod}. Hay {stock_actual}, pides {item.cantidad}.")
+                raise VentaRechazadaError(f"Stock insuficiente para {nombre_prod}. Hay {stock_actual}, pides {item.cantidad}.")
             
             # Update
             new_stock = stock_actual - item.cantidad
@@ -369,10 +694,10 @@ def registrar_venta(venta: Venta, items: List[VentaItem]):
 
         # 2. Insert Header with RETURNING id
         cursor.execute("""
-            INSERT INTO ventas (fecha, cliente, total_bruto, descuento_porcentaje, total_neto, estado, estado_facturacion, marca, tipo_venta)
-            VALUES (%s, %s, %s, %s, %s, %s, 'No Facturado', %s, %s)
+            INSERT INTO ventas (fecha, cliente, total_bruto, descuento_porcentaje, total_neto, estado, estado_facturacion, marca, tipo_venta, idempotency_key)
+            VALUES (%s, %s, %s, %s, %s, %s, 'No Facturado', %s, %s, %s)
             RETURNING id
-        """, (venta.fecha.isoformat(), venta.cliente, venta.total_bruto, venta.descuento_porcentaje, venta.total_neto, venta.estado, venta.marca, venta.tipo_venta))
+        """, (venta.fecha.isoformat(), venta.cliente, venta.total_bruto, venta.descuento_porcentaje, venta.total_neto, venta.estado, venta.marca, venta.tipo_venta, idempotency_key))
         
         venta_inserted_id = cursor.fetchone()['id']
         
@@ -386,36 +711,131 @@ def registrar_venta(venta: Venta, items: List[VentaItem]):
         conn.commit()
         return venta_inserted_id
 
+    except psycopg2.errors.UniqueViolation as e:
+        conn.rollback()
+        if idempotency_key:
+            # Same key committed concurrently by another replay: that one wins
+            cursor.execute("SELECT id FROM ventas WHERE idempotency_key = %s", (idempotency_key,))
+            existente = cursor.fetchone()
+            if existente:
+                return existente['id']
+        raise e
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
 
-def actualizar_venta_totales(venta_id: int):
+def _recalcular_totales(
+    cursor,
+    marca: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    ids: Optional[List[int]] = None,
+    dry_run: bool = False,
+) -> List[Dict]:
+    """
+    Núcleo set-based del recálculo: compara los totales guardados con los que surgen
+    de ventas_items y, salvo en dry_run, corrige las diferencias en un único UPDATE.
+
+    - Venta directa: bruto = suma de subtotales, neto = bruto con el descuento de la venta.
+    - Venta Concesión: los items ya están a precio mayorista, así que neto = suma de
+      subtotales y bruto = precio de lista (neto / (1 - descuento)), como al registrarla.
+    Retorna las ventas con diferencias (valores anteriores y recalculados).
+    """
+    filtros = []
+    if marca:
+        filtros.append("v.marca = %(marca)s")
+    if desde:
+        filtros.append("v.fecha >= %(desde)s")
+    if hasta:
+        filtros.append("v.fecha < %(hasta)s")
+    if ids is not None:
+        filtros.append("v.id = ANY(%(ids)s)")
+    where = ("WHERE " + " AND ".join(filtros)) if filtros else ""
+
+    calculo = f"""
+        WITH calc AS (
+            SELECT v.id, v.fecha, v.cliente, v.marca,
+                   v.total_bruto AS bruto_anterior, v.total_neto AS neto_anterior,
+                   CASE WHEN v.tipo_venta = 'Venta Concesión'
+                        THEN ROUND(i.suma / COALESCE(NULLIF(1 - v.descuento_porcentaje / 100, 0), 1), 2)
+                        ELSE ROUND(i.suma, 2)
+                   END AS bruto_calc,
+                   CASE WHEN v.tipo_venta = 'Venta Concesión'
+                        THEN ROUND(i.suma, 2)
+                        ELSE ROUND(i.suma * (1 - v.descuento_porcentaje / 100), 2)
+                   END AS neto_calc
+            FROM ventas v
+            -- Per-sale lookup through idx_ventas_items_venta: cheap for one id, linear for a whole marca
+            CROSS JOIN LATERAL (
+                SELECT COALESCE(SUM(subtotal), 0) AS suma FROM ventas_items WHERE venta_id = v.id
+            ) i
+            {where}
+        ), diferencias AS (
+            SELECT * FROM calc
+            WHERE bruto_anterior IS DISTINCT FROM bruto_calc
+               OR neto_anterior IS DISTINCT FROM neto_calc
+        )
+    """
+    params = {"marca": marca, "desde": desde, "hasta": hasta, "ids": list(ids) if ids is not None else None}
+
+    if dry_run:
+        cursor.execute(calculo + """
+            SELECT id, fecha, cliente, marca, bruto_anterior, bruto_calc, neto_anterior, neto_calc
+            FROM diferencias ORDER BY id
+        """, params)
+    else:
+        cursor.execute(calculo + """
+            UPDATE ventas v
+            SET total_bruto = d.bruto_calc, total_neto = d.neto_calc
+            FROM diferencias d
+            WHERE v.id = d.id
+            RETURNING d.id, d.fecha, d.cliente, d.marca, d.bruto_anterior, d.bruto_calc, d.neto_anterior, d.neto_calc
+        """, params)
+
+    filas = []
+    for r in cursor.fetchall():
+        fila = dict(r)
+        for k in ('bruto_anterior', 'bruto_calc', 'neto_anterior', 'neto_calc'):
+            fila[k] = float(fila[k]) if fila[k] is not None else None
+        filas.append(fila)
+    return sorted(filas, key=lambda f: f['id'])
+
+def recalcular_totales_ventas(
+    marca: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    ids: Optional[List[int]] = None,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """
+    Recalcula total_bruto/total_neto desde ventas_items para muchas ventas a la vez
+    (ej. tras corregir datos o cambiar la política de descuentos).
+
+    Filtros combinables: marca, rango de fechas [desde, hasta) en texto ISO y lista de ids;
+    sin filtros abarca todas las ventas. Con dry_run=True no modifica nada y solo lista
+    las diferencias.
+    Retorna {'cambiadas': int, 'diferencias': [dict]}.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        # Sum subtotals
-        cursor.execute("SELECT SUM(subtotal) FROM ventas_items WHERE venta_id = %s", (venta_id,))
-        res = cursor.fetchone()
-        # In Postgres SUM can return Decimal
-        new_bruto = float(res['sum']) if res and res['sum'] is not None else 0.0
-        
-        # Get discount
-        cursor.execute("SELECT descuento_porcentaje FROM ventas WHERE id = %s", (venta_id,))
-        disc = float(cursor.fetchone()['descuento_porcentaje'])
-        
-        new_neto = new_bruto * (1 - disc/100)
-        
-        cursor.execute("UPDATE ventas SET total_bruto = %s, total_neto = %s WHERE id = %s", (new_bruto, new_neto, venta_id))
-        conn.commit()
+        diferencias = _recalcular_totales(cursor, marca, desde, hasta, ids, dry_run)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        return {"cambiadas": 0 if dry_run else len(diferencias), "diferencias": diferencias}
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
 
+def actualizar_venta_totales(venta_id: int):
+    recalcular_totales_ventas(ids=[venta_id])
+
 def eliminar_venta(venta_id: int):
     conn = get_connection()
     cursor = conn.cursor()
@@ -469,83 +889,110 @@ def eliminar_venta(venta_id: int):
     finally:
         conn.close()
 
-def actualizar_cantidad_item_venta(venta_id: int, item_id: int, new_qty: int):
+def guardar_edicion_venta(venta_id: int, cantidades: Dict[int, int], descuento: Optional[float] = None):
+    """
+    Guarda en una sola transacción una sesión de edición de una venta pasada:
+    nuevas cantidades por item ({item_id: cantidad}) y, opcionalmente, el descuento.
+
+    El stock (depósito o concesión, según el tipo de venta) se valida para todos los
+    cambios juntos, sumando las diferencias por producto; si alguno no alcanza no se
+    aplica nada y el error lista todos los faltantes. Los totales se recalculan al final.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        # Get Item Info
-        cursor.execute("SELECT * FROM ventas_items WHERE id = %s", (item_id,))
-        item = cursor.fetchone()
-        if not item: raise ValueError("Item no encontrado")
-        
-        old_qty = item['cantidad']
-        prod_id = item['producto_id']
-        delta = new_qty - old_qty
-        
-        if delta == 0: return
-
-        # Get Sale Info
-        cursor.execute("SELECT * FROM ventas WHERE id = %s", (venta_id,))
+        # Lock the sale and its items so two edit sessions can't interleave
+        cursor.execute("SELECT * FROM ventas WHERE id = %s FOR UPDATE", (venta_id,))
         venta = cursor.fetchone()
-        tipo = venta['tipo_venta']
-        
-        # STOCK CHECK & UPDATE
-        if tipo == 'Venta Concesión':
-            cliente = venta['cliente']
-            name_clean = cliente.replace(" (Concesión)", "").strip()
-            cursor.execute("SELECT id FROM concesionarios WHERE nombre_socio = %s", (name_clean,))
-            conc_row = cursor.fetchone()
-            if not conc_row: raise ValueError(f"Concesionario {name_clean} no encontrado")
-            conc_id = conc_row['id']
-            
-            cursor.execute("SELECT id, cantidad_disponible FROM concesion_stock WHERE concesionario_id = %s AND producto_id = %s", (conc_id, prod_id))
-            cs_row = cursor.fetchone()
-            if not cs_row: raise ValueError("Stock de concesión no encontrado")
-            
-            current_disp = float(cs_row['cantidad_disponible'])
-            if delta > 0 and current_disp < delta:
-                 raise ValueError(f"Stock insuficiente en concesión. Disp: {current_disp}")
-            
-            # Update Stock
-            new_stock = current_disp - delta
-            cursor.execute("UPDATE concesion_stock SET cantidad_disponible = %s WHERE id = %s", (new_stock, cs_row['id']))
-            
-        else:
-            # Main Stock
-            cursor.execute("SELECT cantidad FROM stock WHERE id = %s", (prod_id,))
-            stk_row = cursor.fetchone()
-            if not stk_row: raise ValueError("Producto no encontrado")
-            
-            current_disp = stk_row['cantidad']
-            if delta > 0 and current_disp < delta:
-                raise ValueError(f"Stock insuficiente. Disp: {current_disp}")
-                
-            new_stock = current_disp - delta
-            cursor.execute("UPDATE stock SET cantidad = %s WHERE id = %s", (new_stock, prod_id))
-            
-        # UPDATE ITEM
-        # Recalculate Subtotal
-        new_subtotal = float(item['precio_unitario']) * new_qty
-        cursor.execute("UPDATE ventas_items SET cantidad = %s, subtotal = %s WHERE id = %s", (new_qty, new_subtotal, item_id))
+        if not venta:
+            raise ValueError("Venta no encontrada")
+
+        cursor.execute("SELECT * FROM ventas_items WHERE venta_id = %s FOR UPDATE", (venta_id,))
+        items = {row['id']: row for row in cursor.fetchall()}
+
+        cambios = {}
+        deltas: Dict[int, int] = {}
+        for item_id, new_qty in cantidades.items():
+            item = items.get(item_id)
+            if not item:
+                raise ValueError(f"Item {item_id} no encontrado en la venta #{venta_id}")
+            if new_qty < 1:
+                raise ValueError(f"Cantidad inválida ({new_qty}) para el item {item_id}")
+            delta = new_qty - item['cantidad']
+            if delta != 0:
+                cambios[item_id] = new_qty
+                deltas[item['producto_id']] = deltas.get(item['producto_id'], 0) + delta
+
+        if deltas:
+            prod_ids = list(deltas.keys())
+            faltantes = []
+
+            # STOCK CHECK (all products together)
+            if venta['tipo_venta'] == 'Venta Concesión':
+                name_clean = venta['cliente'].replace(" (Concesión)", "").strip()
+                cursor.execute("SELECT id FROM concesionarios WHERE nombre_socio = %s", (name_clean,))
+                conc_row = cursor.fetchone()
+                if not conc_row: raise ValueError(f"Concesionario {name_clean} no encontrado")
+
+                cursor.execute("""
+                    SELECT cs.id, cs.producto_id, cs.cantidad_disponible AS disponible, s.nombre
+                    FROM concesion_stock cs
+                    LEFT JOIN stock s ON s.id = cs.producto_id
+                    WHERE cs.concesionario_id = %s AND cs.producto_id = ANY(%s)
+                    FOR UPDATE OF cs
+                """, (conc_row['id'], prod_ids))
+                tabla = "concesion_stock"
+                columna = "cantidad_disponible"
+            else:
+                cursor.execute("""
+                    SELECT id, id AS producto_id, cantidad AS disponible, nombre
+                    FROM stock WHERE id = ANY(%s)
+                    FOR UPDATE
+                """, (prod_ids,))
+                tabla = "stock"
+                columna = "cantidad"
+
+            filas = {row['producto_id']: row for row in cursor.fetchall()}
+            for prod_id, delta in deltas.items():
+                fila = filas.get(prod_id)
+                if not fila:
+                    raise ValueError(f"Stock no encontrado para el producto ID {prod_id}")
+                if delta > 0 and float(fila['disponible']) < delta:
+                    faltantes.append(f"{fila['nombre'] or prod_id} (disp: {float(fila['disponible']):g}, faltan: {delta - float(fila['disponible']):g})")
+            if faltantes:
+                raise ValueError("Stock insuficiente: " + "; ".join(faltantes))
+
+            # STOCK UPDATE (one statement for every product)
+            cursor.execute(f"""
+                UPDATE {tabla} t
+                SET {columna} = t.{columna} - d.delta
+                FROM unnest(%s::int[], %s::int[]) AS d(id, delta)
+                WHERE t.id = d.id
+            """, ([filas[p]['id'] for p in prod_ids], [deltas[p] for p in prod_ids]))
+
+            # ITEMS UPDATE (subtotal recalculated from the stored unit price)
+            cursor.execute("""
+                UPDATE ventas_items vi
+                SET cantidad = c.cantidad, subtotal = vi.precio_unitario * c.cantidad
+                FROM unnest(%s::int[], %s::int[]) AS c(id, cantidad)
+                WHERE vi.id = c.id
+            """, (list(cambios.keys()), list(cambios.values())))
+
+        if descuento is not None:
+            cursor.execute("UPDATE ventas SET descuento_porcentaje = %s WHERE id = %s", (descuento, venta_id))
+
+        if cambios or descuento is not None:
+            _recalcular_totales(cursor, ids=[venta_id])
+
         conn.commit()
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
-        
-    actualizar_venta_totales(venta_id)
+
+def actualizar_cantidad_item_venta(venta_id: int, item_id: int, new_qty: int):
+    guardar_edicion_venta(venta_id, {item_id: new_qty})
 
 def actualizar_descuento_venta(venta_id: int, new_discount: float):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE ventas SET descuento_porcentaje = %s WHERE id = %s", (new_discount, venta_id))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-    
-    actualizar_venta_totales(venta_id)
+    guardar_edicion_venta(venta_id, {}, descuento=new_discount)
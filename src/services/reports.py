@@ -1,10 +1,10 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from ..models import StockItem, Venta, VentaItem
 from ..config import TIMEZONE
 
-def get_kpis(stock: List[StockItem], ventas: List[Venta], reference_date: datetime = None) -> Dict[str, Any]:
+def get_kpis(stock: Optional[List[StockItem]], ventas: List[Venta], reference_date: datetime = None, stock_critico: Optional[int] = None) -> Dict[str, Any]:
     """
     Calcula KPIs principales:
     - MTD (Month to Date) Venta Neta: Ventas del mes/año de reference_date
@@ -14,11 +14,16 @@ def get_kpis(stock: List[StockItem], ventas: List[Venta], reference_date: dateti
       If filtering by month, usually we want "Transactions in this month".
       Let's assume the 'ventas' passed here is the FULL history to allow YTD calc.
       So we return transactions for the MONTH.
-    - Stock Crítico (items < min_stock)
+    - Stock Crítico (items <= min_stock)
+      Si se pasa `stock_critico` (ej. desde leer_stock_critico) se usa tal cual
+      y `stock` puede ser None.
     """
     if reference_date is None:
         reference_date = datetime.now()
 
+    if stock_critico is None:
+        stock_critico = sum(1 for i in (stock or []) if i.cantidad <= i.min_stock)
+
     current_month = reference_date.month
     current_year = reference_date.year
 
@@ -27,7 +32,7 @@ def get_kpis(stock: List[StockItem], ventas: List[Venta], reference_date: dateti
             "mtd_neto": 0.0,
             "ytd_neto": 0.0,
             "total_transacciones": 0,
-            "stock_critico": sum(1 for i in stock if i.cantidad <= i.min_stock)
+            "stock_critico": stock_critico
         }
 
     df_ventas = pd.DataFrame([v.dict() for v in ventas])
@@ -43,9 +48,6 @@ def get_kpis(stock: List[StockItem], ventas: List[Venta], reference_date: dateti
     mask_ytd = (df_ventas['fecha'].dt.year == current_year)
     ytd_neto = df_ventas.loc[mask_ytd, 'total_neto'].sum()
 
-    # Stock Critical
-    stock_critico = sum(1 for i in stock if i.cantidad <= i.min_stock)
-
     return {
         "mtd_neto": mtd_neto,
         "ytd_neto": ytd_neto,
@@ -1,11 +1,48 @@
 import gspread
-from typing import List, Optional
+from gspread.utils import ValueInputOption, numericise_all, rowcol_to_a1
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import functools
 import os
+import threading
+import time
+import zlib
 from datetime import datetime
 from ..models import StockItem, Venta, VentaItem
 from ..config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
 
-def get_client():
+# Process-level cache: one authorized client and the opened spreadsheets/worksheets.
+# The client's AuthorizedSession refreshes the access token by itself when it expires;
+# we only rebuild it when Google rejects the credentials (401).
+_cache_lock = threading.Lock()
+_client = None
+_spreadsheets = {}
+_worksheets = {}
+# (spreadsheet, hoja) -> _IndiceFilas
+_indices = {}
+# (spreadsheet, hoja) -> _HistorialHoja
+_historiales = {}
+
+# Las planillas históricas son de una sola marca (no tienen columna marca)
+MARCA_SHEETS = "VETA"
+
+# Segundos tras los que el índice id -> fila se reconstruye (por si otro proceso editó la hoja)
+INDICE_TTL = 300
+
+# Segundos tras los que el historial de ventas se relee completo (SHEETS_HISTORIAL_TTL en el entorno)
+HISTORIAL_TTL = float(os.getenv("SHEETS_HISTORIAL_TTL", "60"))
+
+# Filas ya leídas que cada lectura incremental vuelve a comparar (ventana rotativa): una edición
+# en el medio se ve en cuanto la ventana pasa por ella, sin esperar a HISTORIAL_TTL
+HISTORIAL_MUESTRA = 500
+
+# Encabezados de las hojas conocidas (se usan al auto-crearlas)
+ENCABEZADOS = {
+    SHEET_STOCK: ['id', 'codigo', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'min_stock'],
+    SHEET_VENTAS: ['id', 'fecha', 'cliente', 'total_bruto', 'descuento_porcentaje', 'total_neto', 'estado'],
+    SHEET_VENTAS_ITEMS: ['id', 'venta_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal'],
+}
+
+def _crear_cliente():
     """Autentica y retorna cliente de gspread usando credentials.json o st.secrets."""
     credentials_path = "credentials.json"
     
@@ -32,189 +69,628 @@ def get_client():
 
     raise ValueError("No se encontraron credenciales válidas (credentials.json o st.secrets).")
 
+def get_client():
+    """Retorna el cliente de gspread autorizado, creándolo una sola vez por proceso."""
+    global _client
+    with _cache_lock:
+        if _client is None:
+            _client = _crear_cliente()
+        return _client
+
+def invalidar_cache(sheet_name: str = None, spreadsheet_name: str = "VENTAS VETA", spreadsheet_id: str = None,
+                    cliente: bool = False):
+    """
+    Descarta handles cacheados: la hoja indicada, o todas si no se indica ninguna.
+    Con cliente=True también descarta el cliente (se vuelve a autenticar en el próximo uso).
+    """
+    global _client
+    with _cache_lock:
+        if cliente:
+            _client = None
+        if cliente or sheet_name is None:
+            _spreadsheets.clear()
+            _worksheets.clear()
+            _indices.clear()
+            _historiales.clear()
+        else:
+            _worksheets.pop((spreadsheet_id or spreadsheet_name, sheet_name), None)
+            _indices.pop((spreadsheet_id or spreadsheet_name, sheet_name), None)
+            _historiales.pop((spreadsheet_id or spreadsheet_name, sheet_name), None)
+
+def _es_error_de_credenciales(e: Exception) -> bool:
+    return isinstance(e, gspread.exceptions.APIError) and e.code == 401
+
+def _es_hoja_faltante(e: Exception) -> bool:
+    # A deleted/renamed worksheet shows up as 404 or as 400 "Unable to parse range"
+    if isinstance(e, gspread.WorksheetNotFound):
+        return True
+    return isinstance(e, gspread.exceptions.APIError) and (
+        e.code == 404 or (e.code == 400 and "Unable to parse range" in str(e.error.get("message", "")))
+    )
+
+def _invalidar_por_error(e: Exception) -> bool:
+    """Descarta lo cacheado si el error lo justifica. Retorna True si se invalidó algo."""
+    if _es_error_de_credenciales(e):
+        invalidar_cache(cliente=True)
+        return True
+    if _es_hoja_faltante(e):
+        invalidar_cache()
+        return True
+    return False
+
+def _con_cache_renovable(func):
+    """
+    Si la llamada falla por credenciales rechazadas o por una hoja que ya no existe,
+    descarta lo cacheado y reintenta una vez. Solo para operaciones que no dejan
+    escrituras a medias (una única llamada de escritura a la API).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not _invalidar_por_error(e):
+                raise
+            return func(*args, **kwargs)
+    return wrapper
+
 
 def _ensure_sheet_exists(spreadsheet, sheet_name):
     """Creates the sheet if it doesn't exist, with default headers."""
     try:
         return spreadsheet.worksheet(sheet_name)
     except gspread.WorksheetNotFound:
-        # Define headers for known sheets
-        headers = {
-            SHEET_STOCK: ['id', 'codigo', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'min_stock'],
-            SHEET_VENTAS: ['id', 'fecha', 'cliente', 'total_bruto', 'descuento_porcentaje', 'total_neto', 'estado'],
-            SHEET_VENTAS_ITEMS: ['id', 'venta_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal']
-        }
-        
-        if sheet_name in headers:
+        if sheet_name in ENCABEZADOS:
             print(f"Creando hoja faltante: {sheet_name}")
             ws = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=10)
-            ws.append_row(headers[sheet_name])
+            ws.append_row(ENCABEZADOS[sheet_name])
             return ws
         else:
             raise ValueError(f"Hoja desconocida '{sheet_name}' y no se puede auto-crear.")
 
-def _get_worksheet(sheet_name=SHEET_STOCK, spreadsheet_name="VENTAS VETA", spreadsheet_id=None):
-    """Helper to get a worksheet. Uses ID if provided, else Name. Auto-creates if missing."""
-    gc = get_client()
-    try:
+def _get_spreadsheet(spreadsheet_name="VENTAS VETA", spreadsheet_id=None):
+    """Planilla por ID o por nombre; el handle queda cacheado por proceso."""
+    clave = spreadsheet_id or spreadsheet_name
+    sh = _spreadsheets.get(clave)
+    if sh is None:
+        gc = get_client()
         if spreadsheet_id:
             sh = gc.open_by_key(spreadsheet_id)
         else:
             sh = gc.open(spreadsheet_name)
-            
-        return _ensure_sheet_exists(sh, sheet_name)
+        with _cache_lock:
+            _spreadsheets[clave] = sh
+    return sh
+
+def _get_worksheet(sheet_name=SHEET_STOCK, spreadsheet_name="VENTAS VETA", spreadsheet_id=None):
+    """
+    Helper to get a worksheet. Uses ID if provided, else Name. Auto-creates if missing.
+    Los handles quedan cacheados por proceso (ver invalidar_cache).
+    """
+    clave = spreadsheet_id or spreadsheet_name
+    ws = _worksheets.get((clave, sheet_name))
+    if ws is not None:
+        return ws
+
+    try:
+        sh = _get_spreadsheet(spreadsheet_name, spreadsheet_id)
+        ws = _ensure_sheet_exists(sh, sheet_name)
+        with _cache_lock:
+            _worksheets[(clave, sheet_name)] = ws
+        return ws
     except Exception as e:
         print(f"Error accediendo a hoja {sheet_name}: {e}")
         raise e
 
-def _get_next_id(sheet_name: str, spreadsheet_id: str = None) -> int:
-    """Calcula el siguiente ID basado en la columna 'id' (columna 1)."""
-    try:
+class _IndiceFilas:
+    """
+    Índice en memoria id -> número de fila de una hoja (encabezado en la fila 1).
+    Evita un worksheet.find (búsqueda en el servidor) por cada actualización/borrado
+    y una descarga de la columna de ids por cada próximo id.
+    """
+    def __init__(self, filas: Dict[int, int], ultima_fila: int):
+        self.filas = filas
+        self.ultima_fila = ultima_fila
+        self.max_id = max(filas, default=0)
+        self.creado = time.monotonic()
+
+    @classmethod
+    def desde_columna(cls, col_values: list) -> "_IndiceFilas":
+        # Filter non-numeric values (header, blanks)
+        filas = {int(v): n for n, v in enumerate(col_values, start=1) if n > 1 and str(v).isdigit()}
+        return cls(filas, max(len(col_values), 1))
+
+    def vencido(self) -> bool:
+        return time.monotonic() - self.creado > INDICE_TTL
+
+    def agregar(self, ids: Iterable[int]):
+        """Registra filas agregadas al final (append_row/append_rows)."""
+        for item_id in ids:
+            self.ultima_fila += 1
+            self.filas[item_id] = self.ultima_fila
+            self.max_id = max(self.max_id, item_id)
+
+    def quitar(self, item_id: int):
+        """Registra un delete_rows: las filas de abajo suben una posición."""
+        fila = self.filas.pop(item_id)
+        for k, v in self.filas.items():
+            if v > fila:
+                self.filas[k] = v - 1
+        self.ultima_fila -= 1
+
+def _indice(sheet_name: str, spreadsheet_id: str = None, reconstruir: bool = False) -> _IndiceFilas:
+    """Índice id -> fila de la hoja; se arma con una sola lectura de la columna 1 y queda cacheado."""
+    clave = (spreadsheet_id or "VENTAS VETA", sheet_name)
+    indice = _indices.get(clave)
+    if indice is None or reconstruir or indice.vencido():
         ws = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
         # Assuming ID is always in column 1
-        col_values = ws.col_values(1)
-        if len(col_values) <= 1: # Only header
-            return 1
-        
-        # Filter non-numeric headers if any, convert to int
-        ids = []
-        for v in col_values[1:]:
-            if str(v).isdigit():
-                ids.append(int(v))
-        
-        return max(ids) + 1 if ids else 1
+        indice = _IndiceFilas.desde_columna(ws.col_values(1))
+        with _cache_lock:
+            _indices[clave] = indice
+    return indice
+
+def _fila_de(sheet_name: str, spreadsheet_id: str, item_id: int) -> Optional[int]:
+    """Fila del id según el índice; si no está, reconstruye una vez (pudo agregarlo otro proceso)."""
+    fila = _indice(sheet_name, spreadsheet_id).filas.get(item_id)
+    if fila is None:
+        fila = _indice(sheet_name, spreadsheet_id, reconstruir=True).filas.get(item_id)
+    return fila
+
+def _registrar_agregados(sheet_name: str, spreadsheet_id: str, ids: Iterable[int]):
+    """Mantiene al día el índice (si ya existe) tras agregar filas al final."""
+    indice = _indices.get((spreadsheet_id or "VENTAS VETA", sheet_name))
+    if indice is not None:
+        with _cache_lock:
+            indice.agregar(ids)
+
+def _registrar_borrado(sheet_name: str, spreadsheet_id: str, item_id: int):
+    """Mantiene al día el índice (si ya existe) tras borrar la fila de `item_id`."""
+    indice = _indices.get((spreadsheet_id or "VENTAS VETA", sheet_name))
+    if indice is not None and item_id in indice.filas:
+        with _cache_lock:
+            indice.quitar(item_id)
+
+def _get_next_id(sheet_name: str, spreadsheet_id: str = None) -> int:
+    """Calcula el siguiente ID a partir del mayor id del índice de la hoja (columna 1)."""
+    try:
+        return _indice(sheet_name, spreadsheet_id).max_id + 1
     except Exception as e:
+        _invalidar_por_error(e)
         # Fallback if sheet is empty or error
         return 1
 
+def _formatear_codigo(codigo: str) -> str:
+    """Códigos numéricos a 2 dígitos; con cero inicial se antepone ' para que Sheets no lo pierda."""
+    code_val = codigo
+    if code_val.isdigit():
+        code_val = code_val.zfill(2)
+        if code_val.startswith('0'):
+            code_val = f"'{code_val}"
+    return code_val
+
+def _fila_producto(item: StockItem) -> list:
+    # Order must match columns: id, codigo, nombre, categoria, cantidad, precio_unitario, min_stock
+    return [item.id, _formatear_codigo(item.codigo), item.nombre, item.categoria,
+            item.cantidad, item.precio_unitario, item.min_stock]
+
+def _rango_fila(row_num: int) -> str:
+    """Rango A1 de una fila de producto completa (columnas A..G)."""
+    return f"A{row_num}:G{row_num}"
+
+def _rango_datos(row_num: int) -> str:
+    """Rango A1 de los datos de un producto sin el id (columnas B..G): las escrituras no pisan la columna de ids."""
+    return f"B{row_num}:G{row_num}"
+
+def _limpiar_registro(record: Dict[str, Any]) -> Dict[str, Any]:
+    # Normalize keys to remove potential leading/trailing whitespace from Sheet headers
+    return {k.strip(): v for k, v in record.items()}
+
+def _stock_desde_registro(clean_record: Dict[str, Any], marca: str = MARCA_SHEETS) -> StockItem:
+    # Ensure proper type conversion. Numeric codes come back as numbers ("07" -> 7): restore the 2 digits
+    codigo = str(clean_record.get('codigo', ''))
+    if codigo.isdigit():
+        codigo = codigo.zfill(2)
+    return StockItem(
+        id=int(clean_record.get('id', 0)),
+        codigo=codigo,
+        nombre=str(clean_record.get('nombre', '')),
+        categoria=str(clean_record.get('categoria', '')),
+        cantidad=int(clean_record.get('cantidad', 0)),
+        precio_unitario=float(clean_record.get('precio_unitario', 0.0)),
+        min_stock=int(clean_record.get('min_stock', 5)),
+        marca=marca
+    )
+
+def _venta_desde_registro(clean_record: Dict[str, Any], marca: str = MARCA_SHEETS) -> Venta:
+    # Handle date parsing safely
+    fecha_val = clean_record.get('fecha')
+    if isinstance(fecha_val, str):
+        try:
+            fecha_obj = datetime.strptime(fecha_val, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            fecha_obj = datetime.now() # Fallback
+    else:
+        fecha_obj = fecha_val
+
+    return Venta(
+        id=int(clean_record.get('id', 0)),
+        fecha=fecha_obj,
+        cliente=str(clean_record.get('cliente', '')),
+        total_bruto=float(clean_record.get('total_bruto', 0.0)),
+        descuento_porcentaje=float(clean_record.get('descuento_porcentaje', 0.0)),
+        total_neto=float(clean_record.get('total_neto', 0.0)),
+        estado=str(clean_record.get('estado', 'confirmada')),
+        marca=marca
+    )
+
+def _venta_item_desde_registro(clean_record: Dict[str, Any], marca: str = MARCA_SHEETS) -> VentaItem:
+    return VentaItem(
+        id=int(clean_record.get('id', 0)),
+        venta_id=int(clean_record.get('venta_id', 0)),
+        producto_id=int(clean_record.get('producto_id', 0)),
+        cantidad=int(clean_record.get('cantidad', 0)),
+        precio_unitario=float(clean_record.get('precio_unitario', 0.0)),
+        subtotal=float(clean_record.get('subtotal', 0.0)),
+        marca=marca
+    )
+
+def leer_registros_por_bloques(sheet_name: str, spreadsheet_id: str = None,
+                               tamano_bloque: int = 5000) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """
+    Recorre una hoja en bloques de `tamano_bloque` filas (un rango A1 por pedido) y va
+    devolviendo listas de (número de fila, registro limpio), con los mismos valores que
+    get_all_records (encabezado de la fila 1, números convertidos). Las filas vacías se omiten.
+    Permite procesar hojas de cientos de miles de filas con memoria acotada.
+    """
+    ws = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
+    encabezado = [str(h).strip() for h in ws.row_values(1)]
+    if not encabezado:
+        return
+    ultima_col = rowcol_to_a1(1, len(encabezado)).rstrip("0123456789")
+
+    inicio = 2
+    while inicio <= ws.row_count:
+        fin = min(inicio + tamano_bloque - 1, ws.row_count)
+        filas = ws.get_values(f"A{inicio}:{ultima_col}{fin}")
+        registros = []
+        for fila_num, fila in enumerate(filas, start=inicio):
+            if not any(str(v).strip() for v in fila):
+                continue
+            valores = numericise_all(fila) + [''] * (len(encabezado) - len(fila))
+            registros.append((fila_num, dict(zip(encabezado, valores))))
+        if registros:
+            yield registros
+        inicio = fin + 1
+
+def _huella(fila: list) -> int:
+    """Checksum barato de una fila (CRC32 de sus valores; las celdas vacías del final no cuentan)."""
+    valores = [str(v) for v in fila]
+    while valores and valores[-1] == "":
+        valores.pop()
+    return zlib.crc32("\x1f".join(valores).encode("utf-8"))
+
+class _HistorialHoja:
+    """
+    Filas ya leídas y parseadas de una hoja de solo-agregado (VENTAS, VENTAS_ITEMS).
+
+    `huellas` tiene un checksum por fila de la hoja (la 0 es el encabezado) y `registros`
+    el objeto parseado de cada fila de datos (None si la fila está vacía). Así una lectura
+    solo pide desde la última fila conocida: si esa fila ya no coincide, se borraron o
+    insertaron filas y se relee todo (reusando lo parseado de las filas sin cambios).
+    Cada lectura pide además HISTORIAL_MUESTRA filas ya conocidas, empezando en `muestra`
+    y avanzando en cada lectura: si alguna cambió, también se relee todo.
+    """
+    def __init__(self, encabezado: List[str], huellas: List[int], registros: list, verificado: float = None,
+                 muestra: int = 0):
+        self.encabezado = encabezado
+        self.huellas = huellas
+        self.registros = registros
+        self.verificado = verificado or time.monotonic()
+        self.muestra = muestra
+
+    def vencido(self) -> bool:
+        return time.monotonic() - self.verificado > HISTORIAL_TTL
+
+    def _ultima_col(self) -> str:
+        return rowcol_to_a1(1, max(len(self.encabezado), 1)).rstrip("0123456789")
+
+    def rango_nuevo(self) -> str:
+        """Desde la última fila conocida (para comparar su huella) hasta el final de la hoja."""
+        return f"A{len(self.huellas)}:{self._ultima_col()}"
+
+    def rango_muestra(self) -> Optional[Tuple[int, int, str]]:
+        """(desde, hasta, rango A1) de la ventana de filas conocidas a verificar; None si no hay."""
+        # Data rows before the last known one (that one is checked by rango_nuevo)
+        conocidas = len(self.huellas) - 2
+        if conocidas <= 0 or HISTORIAL_MUESTRA <= 0:
+            return None
+        desde = 2 + self.muestra % conocidas
+        hasta = min(desde + HISTORIAL_MUESTRA - 1, len(self.huellas) - 1)
+        return desde, hasta, f"A{desde}:{self._ultima_col()}{hasta}"
+
+    def items(self) -> list:
+        return [r for r in self.registros if r is not None]
+
+def _parsear_filas(encabezado: List[str], filas: List[list], parser, previos: Dict[int, Any]) -> Tuple[List[int], list]:
+    """Huella y objeto de cada fila; las filas cuya huella ya estaba en `previos` no se vuelven a parsear."""
+    huellas, registros = [], []
+    for fila in filas:
+        huella = _huella(fila)
+        huellas.append(huella)
+        if huella in previos:
+            registros.append(previos[huella])
+        elif not any(str(v).strip() for v in fila):
+            registros.append(None)
+        else:
+            valores = numericise_all(fila) + [''] * (len(encabezado) - len(fila))
+            registros.append(parser(dict(zip(encabezado, valores))))
+    return huellas, registros
+
+def _historial_completo(filas: List[list], parser, anterior: Optional[_HistorialHoja] = None) -> _HistorialHoja:
+    """Historial a partir de todos los valores de la hoja (fila 1 = encabezado)."""
+    if not filas or not filas[0]:
+        return _HistorialHoja([], [], [])
+    encabezado = [str(h).strip() for h in filas[0]]
+    previos = {}
+    if anterior is not None and anterior.encabezado == encabezado:
+        previos = {h: r for h, r in zip(anterior.huellas[1:], anterior.registros) if r is not None}
+    huellas, registros = _parsear_filas(encabezado, filas[1:], parser, previos)
+    return _HistorialHoja(encabezado, [_huella(filas[0])] + huellas, registros)
+
+def _historial_actualizado(anterior: _HistorialHoja, filas: List[list], parser,
+                           muestra: Optional[Tuple[int, int, List[list]]] = None) -> Optional[_HistorialHoja]:
+    """
+    Agrega al historial las filas nuevas (`filas` empieza en la última fila conocida).
+    `muestra` es (desde, hasta, valores) de la ventana de rango_muestra(). None si la última
+    fila o alguna de la muestra cambió: hubo ediciones, borrados o inserciones y hay que releer todo.
+    """
+    if not filas or _huella(filas[0]) != anterior.huellas[-1]:
+        return None
+    siguiente = 0
+    if muestra is not None:
+        desde, hasta, valores = muestra
+        # The API leaves out trailing empty rows
+        valores = valores + [[]] * (hasta - desde + 1 - len(valores))
+        if [_huella(f) for f in valores] != anterior.huellas[desde - 1:hasta]:
+            return None
+        siguiente = hasta - 1
+    huellas, registros = _parsear_filas(anterior.encabezado, filas[1:], parser, {})
+    return _HistorialHoja(anterior.encabezado, anterior.huellas + huellas, anterior.registros + registros,
+                          anterior.verificado, siguiente)
+
+def _leer_historial(sheet_name: str, spreadsheet_id: str, parser) -> list:
+    """
+    Registros parseados de una hoja de solo-agregado, pidiendo solo las filas nuevas
+    desde la lectura anterior más una ventana rotativa de filas ya leídas (en la misma
+    llamada) para detectar ediciones; cada HISTORIAL_TTL segundos se relee la hoja completa.
+    Los objetos se comparten entre lecturas: no modificarlos.
+    """
+    clave = (spreadsheet_id or "VENTAS VETA", sheet_name)
+    worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
+    anterior = _historiales.get(clave)
+    historial = None
+    if anterior is not None and anterior.huellas and not anterior.vencido():
+        ventana = anterior.rango_muestra()
+        rangos = [_rango_hoja(sheet_name, anterior.rango_nuevo())]
+        if ventana is not None:
+            rangos.append(_rango_hoja(sheet_name, ventana[2]))
+        try:
+            respuesta = _get_spreadsheet(spreadsheet_id=spreadsheet_id).values_batch_get(rangos)
+            valores = [rango.get("values", []) for rango in respuesta["valueRanges"]]
+            muestra = (ventana[0], ventana[1], valores[1]) if ventana is not None else None
+            historial = _historial_actualizado(anterior, valores[0], parser, muestra)
+        except gspread.exceptions.APIError as e:
+            # e.g. the range now starts past the end of the grid (rows were deleted)
+            if _es_hoja_faltante(e) or _es_error_de_credenciales(e):
+                raise
+    if historial is None:
+        historial = _historial_completo(worksheet.get_values(), parser, anterior)
+    with _cache_lock:
+        _historiales[clave] = historial
+    return historial.items()
+
+def _rango_hoja(sheet_name: str, a1: str = None) -> str:
+    """Rango para values_batch_get: la hoja entera o un rango A1 dentro de ella."""
+    hoja = "'" + sheet_name.replace("'", "''") + "'"
+    return f"{hoja}!{a1}" if a1 else hoja
+
+def _stock_desde_valores(filas: List[list], sheet_name: str = SHEET_STOCK, spreadsheet_id: str = None) -> List[StockItem]:
+    """Stock a partir de los valores crudos de la hoja (fila 1 = encabezado); rearma el índice id -> fila."""
+    if not filas:
+        return []
+    encabezado = [str(h).strip() for h in filas[0]]
+    items = []
+    for fila_num, fila in enumerate(filas[1:], start=2):
+        if not any(str(v).strip() for v in fila):
+            continue
+        valores = numericise_all(fila) + [''] * (len(encabezado) - len(fila))
+        items.append((fila_num, _stock_desde_registro(dict(zip(encabezado, valores)))))
+    with _cache_lock:
+        _indices[(spreadsheet_id or "VENTAS VETA", sheet_name)] = _IndiceFilas(
+            {item.id: fila_num for fila_num, item in items}, len(filas)
+        )
+    return [item for _, item in items]
+
+def leer_todo(spreadsheet_id: str = None) -> Dict[str, list]:
+    """
+    Stock, ventas e items en una sola llamada (values_batch_get) en lugar de una lectura
+    por hoja. Para VENTAS y VENTAS_ITEMS pide solo las filas nuevas si ya hay historial
+    (ver _leer_historial). Retorna {"stock": [...], "ventas": [...], "ventas_items": [...]}.
+    """
+    clave = spreadsheet_id or "VENTAS VETA"
+    historiales = {SHEET_VENTAS: _venta_desde_registro, SHEET_VENTAS_ITEMS: _venta_item_desde_registro}
+    completo = False
+    for intento in range(3):
+        anteriores = {hoja: _historiales.get((clave, hoja)) for hoja in historiales}
+        incrementales = {
+            hoja: anterior for hoja, anterior in anteriores.items()
+            if not completo and anterior is not None and anterior.huellas and not anterior.vencido()
+        }
+        rangos = [_rango_hoja(SHEET_STOCK)] + [
+            _rango_hoja(hoja, incrementales[hoja].rango_nuevo() if hoja in incrementales else None)
+            for hoja in historiales
+        ]
+        # Sample windows go after the three sheets, in the same call
+        ventanas = {hoja: v for hoja, h in incrementales.items() if (v := h.rango_muestra()) is not None}
+        rangos += [_rango_hoja(hoja, v[2]) for hoja, v in ventanas.items()]
+        try:
+            respuesta = _get_spreadsheet(spreadsheet_id=spreadsheet_id).values_batch_get(rangos)
+            break
+        except Exception as e:
+            if intento == 2:
+                raise
+            if _invalidar_por_error(e):
+                if _es_hoja_faltante(e):
+                    # Same auto-creation as the single-sheet readers
+                    for hoja in (SHEET_STOCK, *historiales):
+                        _get_worksheet(hoja, spreadsheet_id=spreadsheet_id)
+                continue
+            if isinstance(e, gspread.exceptions.APIError) and e.code == 400 and incrementales:
+                # An incremental range past the end of the grid (rows deleted): ask for whole sheets
+                completo = True
+                continue
+            raise
+
+    valores = [rango.get("values", []) for rango in respuesta["valueRanges"]]
+    muestras = {hoja: (v[0], v[1], filas) for (hoja, v), filas in zip(ventanas.items(), valores[3:])}
+    datos = {"stock": _stock_desde_valores(valores[0], SHEET_STOCK, spreadsheet_id)}
+    for (hoja, parser), filas, tabla in zip(historiales.items(), valores[1:3], ("ventas", "ventas_items")):
+        historial = None
+        if hoja in incrementales:
+            historial = _historial_actualizado(incrementales[hoja], filas, parser, muestras.get(hoja))
+            if historial is None:
+                # The last known row or a sampled one changed: this sheet alone is re-read in full
+                filas = _get_worksheet(hoja, spreadsheet_id=spreadsheet_id).get_values()
+        if historial is None:
+            historial = _historial_completo(filas, parser, anteriores[hoja])
+        with _cache_lock:
+            _historiales[(clave, hoja)] = historial
+        datos[tabla] = historial.items()
+    return datos
+
+def _fila_venta(venta: Venta) -> list:
+    return [venta.id, venta.fecha.strftime("%Y-%m-%d %H:%M:%S"), venta.cliente, venta.total_bruto,
+            venta.descuento_porcentaje, venta.total_neto, venta.estado]
+
+def _fila_venta_item(i: VentaItem) -> list:
+    return [i.id, i.venta_id, i.producto_id, i.cantidad, i.precio_unitario, i.subtotal]
+
+def _filas_verificadas(sheet_name: str, spreadsheet_id: str, ids: Iterable[int]) -> Dict[int, Optional[int]]:
+    """
+    Fila de cada id según el índice, confirmada contra la hoja antes de escribir: se lee la
+    columna 1 de esas filas (un solo values_batch_get). El índice puede tener hasta INDICE_TTL
+    segundos; si otro proceso insertó o borró filas y alguna ya no tiene su id, se rearma.
+    """
+    filas = {item_id: _fila_de(sheet_name, spreadsheet_id, item_id) for item_id in ids}
+    a_verificar = [(item_id, fila) for item_id, fila in filas.items() if fila]
+    if not a_verificar:
+        return filas
+    respuesta = _get_spreadsheet(spreadsheet_id=spreadsheet_id).values_batch_get(
+        [_rango_hoja(sheet_name, f"A{fila}") for _, fila in a_verificar]
+    )
+    for (item_id, _), rango in zip(a_verificar, respuesta["valueRanges"]):
+        valores = rango.get("values") or [[]]
+        if not valores[0] or str(valores[0][0]).strip() != str(item_id):
+            indice = _indice(sheet_name, spreadsheet_id, reconstruir=True)
+            return {item_id: indice.filas.get(item_id) for item_id in filas}
+    return filas
+
+def actualizar_productos(items: List[StockItem], sheet_name: str = SHEET_STOCK, spreadsheet_id: str = None) -> List[int]:
+    """
+    Escribe varias filas de producto con un solo batch_update (la fila de cada id sale
+    del índice id -> fila, verificada con _filas_verificadas). Solo se escriben las columnas
+    B..G. Retorna los ids que no están en la hoja (no se escriben).
+    """
+    if not items:
+        return []
+    worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
+    filas = _filas_verificadas(sheet_name, spreadsheet_id, [item.id for item in items])
+    encontrados = [item for item in items if filas[item.id]]
+    if encontrados:
+        worksheet.batch_update(
+            [{'range': _rango_datos(filas[item.id]), 'values': [_fila_producto(item)[1:]]} for item in encontrados],
+            value_input_option=ValueInputOption.user_entered,
+        )
+    return [item_id for item_id, fila in filas.items() if not fila]
+
+def agregar_filas(sheet_name: str, filas: List[list], spreadsheet_id: str = None):
+    """Agrega filas al final de la hoja con un solo append_rows (columna 1 = id) y actualiza el índice."""
+    if not filas:
+        return
+    worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
+    worksheet.append_rows(filas)
+    _registrar_agregados(sheet_name, spreadsheet_id, [fila[0] for fila in filas])
+
+def _leer_stock_con_filas(worksheet, sheet_name: str = SHEET_STOCK, spreadsheet_id: str = None) -> List[Tuple[int, StockItem]]:
+    """
+    Lee el stock junto con el número de fila de cada producto (encabezado en la fila 1).
+    De paso rearma el índice id -> fila de la hoja, sin llamadas extra.
+    """
+    records = worksheet.get_all_records()
+
+    items = [(idx + 2, _stock_desde_registro(_limpiar_registro(record)))
+             for idx, record in enumerate(records)]
+
+    with _cache_lock:
+        _indices[(spreadsheet_id or "VENTAS VETA", sheet_name)] = _IndiceFilas(
+            {item.id: fila for fila, item in items}, len(records) + 1
+        )
+    return items
+
+@_con_cache_renovable
 def leer_stock(sheet_name: str = SHEET_STOCK, spreadsheet_id: str = None) -> List[StockItem]:
     """
     Lee el stock desde la hoja especificada y retorna una lista de StockItem.
     """
     try:
         worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
-        records = worksheet.get_all_records()
-        
-        items = []
-        for record in records:
-            # Normalize keys to remove potential leading/trailing whitespace from Sheet headers
-            clean_record = {k.strip(): v for k, v in record.items()}
-            
-            # Ensure proper type conversion
-            item = StockItem(
-                id=int(clean_record.get('id', 0)),
-                codigo=str(clean_record.get('codigo', '')),
-                nombre=str(clean_record.get('nombre', '')),
-                categoria=str(clean_record.get('categoria', '')),
-                cantidad=int(clean_record.get('cantidad', 0)),
-                precio_unitario=float(clean_record.get('precio_unitario', 0.0)),
-                min_stock=int(clean_record.get('min_stock', 5))
-            )
-            items.append(item)
-            
-        return items
+        return [item for _, item in _leer_stock_con_filas(worksheet, sheet_name, spreadsheet_id)]
     except Exception as e:
         print(f"Error leyendo stock: {e}")
         raise e
 
 def leer_ventas(sheet_name: str = SHEET_VENTAS, spreadsheet_id: str = None) -> List[Venta]:
-    """Lee el historial de ventas."""
+    """Lee el historial de ventas (solo las filas nuevas desde la última lectura, ver _leer_historial)."""
     try:
-        worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
-        records = worksheet.get_all_records()
-        ventas = []
-        for record in records:
-            clean_record = {k.strip(): v for k, v in record.items()}
-            # Handle date parsing safely
-            fecha_val = clean_record.get('fecha')
-            if isinstance(fecha_val, str):
-                try:
-                    fecha_obj = datetime.strptime(fecha_val, "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    fecha_obj = datetime.now() # Fallback
-            else:
-                fecha_obj = fecha_val
-
-            v = Venta(
-                id=int(clean_record.get('id', 0)),
-                fecha=fecha_obj,
-                cliente=str(clean_record.get('cliente', '')),
-                total_bruto=float(clean_record.get('total_bruto', 0.0)),
-                descuento_porcentaje=float(clean_record.get('descuento_porcentaje', 0.0)),
-                total_neto=float(clean_record.get('total_neto', 0.0)),
-                estado=str(clean_record.get('estado', 'confirmada'))
-            )
-            ventas.append(v)
-        return ventas
+        return _leer_historial(sheet_name, spreadsheet_id, _venta_desde_registro)
     except Exception as e:
+        _invalidar_por_error(e)
         print(f"Error leyendo ventas: {e}")
         return []
 
 def leer_ventas_items(sheet_name: str = SHEET_VENTAS_ITEMS, spreadsheet_id: str = None) -> List[VentaItem]:
-    """Lee los items vendidos."""
+    """Lee los items vendidos (solo las filas nuevas desde la última lectura, ver _leer_historial)."""
     try:
-        worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
-        records = worksheet.get_all_records()
-        items = []
-        for record in records:
-            clean_record = {k.strip(): v for k, v in record.items()}
-            i = VentaItem(
-                id=int(clean_record.get('id', 0)),
-                venta_id=int(clean_record.get('venta_id', 0)),
-                producto_id=int(clean_record.get('producto_id', 0)),
-                cantidad=int(clean_record.get('cantidad', 0)),
-                precio_unitario=float(clean_record.get('precio_unitario', 0.0)),
-                subtotal=float(clean_record.get('subtotal', 0.0))
-            )
-            items.append(i)
-        return items
+        return _leer_historial(sheet_name, spreadsheet_id, _venta_item_desde_registro)
     except Exception as e:
+        _invalidar_por_error(e)
         print(f"Error leyendo ventas items: {e}")
         return []
 
+@_con_cache_renovable
 def crear_producto(item: StockItem, sheet_name: str = SHEET_STOCK, spreadsheet_id: str = None):
     """Agrega un nuevo producto al final de la hoja."""
     try:
         worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
         
-        # Helper to preserve leading zeros in codes logic: prepend ' if needed
-        # Helper to preserve leading zeros in codes logic: prepend ' if needed
-        code_val = item.codigo
-        if code_val.isdigit():
-             code_val = code_val.zfill(2)
-             if code_val.startswith('0'):
-                  code_val = f"'{code_val}"
-                
-        # Append row. Order must match columns: id, codigo, nombre, categoria, cantidad, precio_unitario, min_stock
-        row = [item.id, code_val, item.nombre, item.categoria, item.cantidad, item.precio_unitario, item.min_stock]
-        worksheet.append_row(row)
+        # USER_ENTERED so the ' prefix keeps leading zeros instead of being stored literally
+        worksheet.append_row(_fila_producto(item), value_input_option=ValueInputOption.user_entered)
+        _registrar_agregados(sheet_name, spreadsheet_id, [item.id])
     except Exception as e:
         print(f"Error creando producto: {e}")
         raise e
 
+@_con_cache_renovable
 def actualizar_producto(item: StockItem, sheet_name: str = SHEET_STOCK, spreadsheet_id: str = None):
-    """Actualiza un producto existente buscando por ID."""
+    """Actualiza un producto existente; la fila sale del índice id -> fila (verificado contra la hoja)."""
     try:
         worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
-        cell = worksheet.find(str(item.id), in_column=1) # Find cell with the ID ONLY in Col 1
-        if cell:
-            row_num = cell.row
-            
-            # Helper to preserve leading zeros in codes logic: prepend ' if needed
-            code_val = item.codigo
-            if code_val.isdigit():
-                 code_val = code_val.zfill(2)
-                 if code_val.startswith('0'):
-                      code_val = f"'{code_val}"
-
-            # Updating individually to be safe, assuming columns generic.
-            # 1:id, 2:codigo, 3:nombre, 4:categoria, 5:cantidad, 6:precio, 7:min_stock
-            worksheet.update_cell(row_num, 2, code_val)
-            worksheet.update_cell(row_num, 3, item.nombre)
-            worksheet.update_cell(row_num, 4, item.categoria)
-            worksheet.update_cell(row_num, 5, item.cantidad)
-            worksheet.update_cell(row_num, 6, item.precio_unitario)
-            worksheet.update_cell(row_num, 7, item.min_stock)
+        row_num = _filas_verificadas(sheet_name, spreadsheet_id, [item.id])[item.id]
+        if row_num:
+            # Whole row but the id in one ranged write (USER_ENTERED, like update_cell, so ' keeps leading zeros)
+            worksheet.update([_fila_producto(item)[1:]], _rango_datos(row_num),
+                             value_input_option=ValueInputOption.user_entered)
         else:
             raise ValueError(f"Producto con ID {item.id} no encontrado.")
             
@@ -222,13 +698,15 @@ def actualizar_producto(item: StockItem, sheet_name: str = SHEET_STOCK, spreadsh
         print(f"Error actualizando producto: {e}")
         raise e
 
+@_con_cache_renovable
 def eliminar_producto(item_id: int, sheet_name: str = SHEET_STOCK, spreadsheet_id: str = None):
-    """Elimina fisica un producto buscando por ID."""
+    """Elimina fisica un producto; la fila sale del índice id -> fila."""
     try:
         worksheet = _get_worksheet(sheet_name, spreadsheet_id=spreadsheet_id)
-        cell = worksheet.find(str(item_id), in_column=1)
-        if cell:
-            worksheet.delete_rows(cell.row)
+        row_num = _fila_de(sheet_name, spreadsheet_id, item_id)
+        if row_num:
+            worksheet.delete_rows(row_num)
+            _registrar_borrado(sheet_name, spreadsheet_id, item_id)
         else:
              raise ValueError(f"Producto con ID {item_id} no encontrado.")
     except Exception as e:
@@ -244,56 +722,42 @@ def registrar_venta(venta: Venta, items: List[VentaItem], spreadsheet_id: str =
     """
     try:
         # 1. Update Stock
-        # We fetch current stock again to ensure validity
-        current_stock = leer_stock(SHEET_STOCK, spreadsheet_id)
-        stock_map = {item.id: item for item in current_stock}
-        
-        # Client for batch updates if possible, but stepping one by one for simplicity and safety
+        # We fetch current stock again to ensure validity (the read also gives us each row number)
         ws_stock = _get_worksheet(SHEET_STOCK, spreadsheet_id=spreadsheet_id)
-        
+        stock_map = {item.id: (row_num, item) for row_num, item in _leer_stock_con_filas(ws_stock, SHEET_STOCK, spreadsheet_id)}
+
+        # Validate everything first, then send all stock rows in a single batch_update
+        modificados = {}
         for v_item in items:
-            s_item = stock_map.get(v_item.producto_id)
+            row_num, s_item = stock_map.get(v_item.producto_id, (None, None))
             if not s_item:
                 raise ValueError(f"Producto ID {v_item.producto_id} no encontrado en stock.")
             
             if s_item.cantidad < v_item.cantidad:
                 raise ValueError(f"Stock insuficiente para {s_item.nombre}. Stock: {s_item.cantidad}, Solicitado: {v_item.cantidad}")
             
-            # Decrement local object
+            # Decrement local object (repeated lines of the same product accumulate)
             s_item.cantidad -= v_item.cantidad
-            # Update Remote
-            actualizar_producto(s_item, SHEET_STOCK, spreadsheet_id)
+            modificados[row_num] = s_item
+
+        if modificados:
+            ws_stock.batch_update(
+                [{'range': _rango_fila(row_num), 'values': [_fila_producto(s_item)]}
+                 for row_num, s_item in modificados.items()],
+                value_input_option=ValueInputOption.user_entered,
+            )
 
         # 2. Save Venta Header
-        ws_ventas = _get_worksheet(SHEET_VENTAS, spreadsheet_id=spreadsheet_id)
-        venta_row = [
-            venta.id,
-            venta.fecha.strftime("%Y-%m-%d %H:%M:%S"),
-            venta.cliente,
-            venta.total_bruto,
-            venta.descuento_porcentaje,
-            venta.total_neto,
-            venta.estado
-        ]
-        ws_ventas.append_row(venta_row)
-        
+        agregar_filas(SHEET_VENTAS, [_fila_venta(venta)], spreadsheet_id)
+
         # 3. Save Venta Items
-        ws_items = _get_worksheet(SHEET_VENTAS_ITEMS, spreadsheet_id=spreadsheet_id)
-        items_rows = []
-        for i in items:
-            items_rows.append([
-                i.id,
-                i.venta_id,
-                i.producto_id,
-                i.cantidad,
-                i.precio_unitario,
-                i.subtotal
-            ])
-        ws_items.append_rows(items_rows)
+        agregar_filas(SHEET_VENTAS_ITEMS, [_fila_venta_item(i) for i in items], spreadsheet_id)
         
         return True
 
     except Exception as e:
+        # No se reintenta (podría descontar stock dos veces); solo se limpia la cache para la próxima
+        _invalidar_por_error(e)
         print(f"Error registrando venta: {e}")
         raise e
 
@@ -0,0 +1,414 @@
+import atexit
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+import gspread
+import requests
+from ..config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
+from ..logger import get_logger
+from ..models import StockItem, Venta, VentaItem
+from . import sheets
+
+logger = get_logger(__name__)
+
+# Códigos de la API que conviene reintentar (cuota por minuto y errores transitorios)
+CODIGOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+def _es_reintentable(e: Exception) -> bool:
+    if isinstance(e, gspread.exceptions.APIError):
+        return e.code in CODIGOS_REINTENTABLES
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+class ColaEscrituraSheets:
+    """
+    Cola write-behind delante del backend de Sheets.
+
+    Las escrituras se encolan y vuelven enseguida; un hilo de fondo las envía en lotes:
+    un batch_update por hoja para las filas de producto y un append_rows por hoja para
+    las filas nuevas. Las actualizaciones pendientes de un mismo producto se combinan
+    (solo viaja la última). Ante errores de cuota (429) o transitorios, el lote vuelve
+    a la cola y se reintenta con backoff exponencial (con jitter). Ante cualquier otro
+    error (400, 403 por permisos, ...) el lote también vuelve a la cola, pero el envío
+    queda bloqueado hasta que alguien llame a reanudar(): nunca se tira una venta que ya
+    se confirmó con su número.
+
+    Las ventas se validan contra una copia del stock que se lee cada `ttl_stock` segundos
+    y que la propia cola mantiene al día con lo que encola; encima van las escrituras
+    pendientes y las que están en vuelo. Los ids de VENTAS/VENTAS_ITEMS los reserva la
+    cola al encolar (la hoja recién los ve en el próximo flush).
+
+    metricas() expone profundidad de la cola, latencia de los flush, reintentos, etc.
+    """
+
+    def __init__(
+        self,
+        spreadsheet_id: Optional[str] = None,
+        tamano_lote: int = 200,
+        intervalo: float = 2.0,
+        backoff_inicial: float = 1.0,
+        backoff_max: float = 64.0,
+        ttl_stock: float = 30.0,
+        iniciar: bool = True,
+    ):
+        self.spreadsheet_id = spreadsheet_id
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.backoff_inicial = backoff_inicial
+        self.backoff_max = backoff_max
+        self.ttl_stock = ttl_stock
+
+        self._cond = threading.Condition()
+        self._venta_lock = threading.Lock()
+        # (hoja, id) -> StockItem; OrderedDict para enviar en orden de llegada
+        self._productos: "OrderedDict[Tuple[str, int], StockItem]" = OrderedDict()
+        # (hoja, fila) en orden de llegada; las filas nuevas no se combinan
+        self._agregados: List[Tuple[str, list]] = []
+        # The batch being sent: still part of what readers and sales must see
+        self._productos_en_vuelo: Dict[Tuple[str, int], StockItem] = {}
+        self._agregados_en_vuelo: List[Tuple[str, list]] = []
+        # Stock as the queue last left it (id -> StockItem) and when it was read from the sheet
+        self._stock: Optional[Dict[int, StockItem]] = None
+        self._stock_leido = 0.0
+        # hoja -> mayor id reservado (survives index rebuilds until the rows reach the sheet)
+        self._max_ids: Dict[str, int] = {}
+        self._primera_pendiente: Optional[float] = None
+        self._en_vuelo = 0
+        self._detener = False
+        self._forzar = False
+        self._intentos = 0
+        # Error that stopped sending (not worth retrying on its own); None = sending normally
+        self._bloqueo: Optional[str] = None
+
+        self._encoladas = 0
+        self._coalescidas = 0
+        self._escritas = 0
+        self._descartadas = 0
+        self._lotes = 0
+        self._reintentos = 0
+        self._ultimo_error: Optional[str] = None
+        self._latencias = deque(maxlen=200)
+
+        self._hilo = None
+        if iniciar:
+            self.iniciar()
+
+    # --- Encolado -----------------------------------------------------------------
+
+    def _marcar_pendiente(self):
+        if self._primera_pendiente is None:
+            self._primera_pendiente = time.monotonic()
+        self._cond.notify_all()
+
+    def encolar_producto(self, item: StockItem, sheet_name: str = SHEET_STOCK):
+        """Encola la fila completa de un producto existente (reemplaza una pendiente del mismo id)."""
+        with self._cond:
+            clave = (sheet_name, item.id)
+            if clave in self._productos:
+                self._coalescidas += 1
+                self._productos.move_to_end(clave)
+            self._productos[clave] = item
+            if sheet_name == SHEET_STOCK and self._stock is not None:
+                self._stock[item.id] = item
+            self._encoladas += 1
+            self._marcar_pendiente()
+
+    def encolar_filas(self, sheet_name: str, filas: List[list]):
+        """Encola filas nuevas para agregar al final de la hoja (columna 1 = id)."""
+        with self._cond:
+            self._agregados.extend((sheet_name, fila) for fila in filas)
+            self._encoladas += len(filas)
+            self._marcar_pendiente()
+
+    def _productos_sin_enviar(self, sheet_name: str) -> Dict[int, StockItem]:
+        """Productos en vuelo y pendientes de la hoja (lo pendiente es más nuevo). Llamar con _cond tomado."""
+        productos = {item_id: item for (hoja, item_id), item in self._productos_en_vuelo.items() if hoja == sheet_name}
+        productos.update((item_id, item) for (hoja, item_id), item in self._productos.items() if hoja == sheet_name)
+        return productos
+
+    def _stock_actual(self) -> Dict[int, StockItem]:
+        """
+        Stock para validar una venta: la copia de la cola, releída de la hoja si pasaron
+        `ttl_stock` segundos, con lo pendiente y lo que está en vuelo encima. Llamar con _venta_lock.
+        """
+        stock = self._stock
+        if stock is None or time.monotonic() - self._stock_leido > self.ttl_stock:
+            stock = {item.id: item for item in sheets.leer_stock(SHEET_STOCK, self.spreadsheet_id)}
+            with self._cond:
+                stock.update(self._productos_sin_enviar(SHEET_STOCK))
+                self._stock, self._stock_leido = stock, time.monotonic()
+        return stock
+
+    def invalidar_stock(self):
+        """Descarta la copia del stock (p. ej. tras crear o borrar productos): la próxima venta la relee."""
+        with self._venta_lock:
+            self._stock = None
+
+    def siguiente_id(self, sheet_name: str) -> int:
+        """Próximo id de la hoja contando los reservados por la cola que aún no llegaron."""
+        return max(sheets._indice(sheet_name, self.spreadsheet_id).max_id, self._max_ids.get(sheet_name, 0)) + 1
+
+    def _reservar_ids(self, sheet_name: str, cantidad: int) -> int:
+        """Reserva `cantidad` ids consecutivos y retorna el primero. Llamar con _venta_lock."""
+        primero = self.siguiente_id(sheet_name)
+        self._max_ids[sheet_name] = primero + cantidad - 1
+        return primero
+
+    def registrar_venta(self, venta: Venta, items: List[VentaItem]) -> int:
+        """
+        Versión write-behind de sheets.registrar_venta: valida el stock (ver _stock_actual),
+        numera la venta y sus items, y encola stock, cabecera e items juntos. Los errores
+        de validación se lanzan acá, antes de encolar nada. Retorna el id de la venta.
+        """
+        with self._venta_lock:
+            stock = self._stock_actual()
+            modificados = {}
+            for v_item in items:
+                s_item = modificados.get(v_item.producto_id) or stock.get(v_item.producto_id)
+                if not s_item:
+                    raise ValueError(f"Producto ID {v_item.producto_id} no encontrado en stock.")
+                if s_item.cantidad < v_item.cantidad:
+                    raise ValueError(f"Stock insuficiente para {s_item.nombre}. Stock: {s_item.cantidad}, Solicitado: {v_item.cantidad}")
+                modificados[s_item.id] = s_item.model_copy(update={"cantidad": s_item.cantidad - v_item.cantidad})
+
+            venta_id = self._reservar_ids(SHEET_VENTAS, 1)
+            primer_item = self._reservar_ids(SHEET_VENTAS_ITEMS, len(items)) if items else 0
+            venta = venta.model_copy(update={"id": venta_id})
+            items = [i.model_copy(update={"id": primer_item + n, "venta_id": venta_id}) for n, i in enumerate(items)]
+
+            with self._cond:
+                for s_item in modificados.values():
+                    self.encolar_producto(s_item, SHEET_STOCK)
+                self.encolar_filas(SHEET_VENTAS, [sheets._fila_venta(venta)])
+                self.encolar_filas(SHEET_VENTAS_ITEMS, [sheets._fila_venta_item(i) for i in items])
+        return venta_id
+
+    def pendientes(self) -> Dict[str, Any]:
+        """
+        Lo que todavía no está en la hoja (pendiente o en vuelo), con las mismas claves que
+        sheets.leer_todo: {"stock": {id: StockItem}, "ventas": [Venta], "ventas_items": [VentaItem]}.
+        """
+        with self._cond:
+            stock = self._productos_sin_enviar(SHEET_STOCK)
+            filas = self._agregados_en_vuelo + self._agregados
+        return {
+            "stock": stock,
+            "ventas": [sheets._venta_desde_registro(dict(zip(sheets.ENCABEZADOS[SHEET_VENTAS], f)))
+                       for hoja, f in filas if hoja == SHEET_VENTAS],
+            "ventas_items": [sheets._venta_item_desde_registro(dict(zip(sheets.ENCABEZADOS[SHEET_VENTAS_ITEMS], f)))
+                             for hoja, f in filas if hoja == SHEET_VENTAS_ITEMS],
+        }
+
+    # --- Envío --------------------------------------------------------------------
+
+    @property
+    def profundidad(self) -> int:
+        """Escrituras pendientes (filas de producto combinadas + filas nuevas)."""
+        with self._cond:
+            return len(self._productos) + len(self._agregados)
+
+    def _listo_para_enviar(self) -> bool:
+        if self._bloqueo is not None or not (self._productos or self._agregados):
+            return False
+        if self._forzar:
+            return True
+        if len(self._productos) + len(self._agregados) >= self.tamano_lote:
+            return True
+        return time.monotonic() - self._primera_pendiente >= self.intervalo
+
+    def _tomar_lote(self) -> Tuple[List[Tuple[Tuple[str, int], StockItem]], List[Tuple[str, list]]]:
+        productos = []
+        while self._productos and len(productos) < self.tamano_lote:
+            productos.append(self._productos.popitem(last=False))
+        agregados = self._agregados[:self.tamano_lote]
+        del self._agregados[:self.tamano_lote]
+        if not (self._productos or self._agregados):
+            self._primera_pendiente = None
+        self._en_vuelo = len(productos) + len(agregados)
+        self._productos_en_vuelo = dict(productos)
+        self._agregados_en_vuelo = list(agregados)
+        return productos, agregados
+
+    def _devolver_lote(self, productos, agregados):
+        """Reencola un lote fallido; una versión más nueva de un producto le gana a la del lote."""
+        for clave, item in reversed(productos):
+            if clave not in self._productos:
+                self._productos[clave] = item
+                self._productos.move_to_end(clave, last=False)
+        self._agregados[:0] = agregados
+        if self._productos or self._agregados:
+            self._primera_pendiente = self._primera_pendiente or time.monotonic()
+
+    def _enviar(self, productos, agregados) -> int:
+        """
+        Un batch_update por hoja de productos y un append_rows por hoja de filas nuevas.
+        Cada parte enviada se quita de las listas recibidas, así un reintento no repite
+        appends que ya llegaron.
+        """
+        descartadas = 0
+        por_hoja: Dict[str, List[StockItem]] = {}
+        for (hoja, _), item in productos:
+            por_hoja.setdefault(hoja, []).append(item)
+        for hoja, items in por_hoja.items():
+            faltantes = sheets.actualizar_productos(items, hoja, self.spreadsheet_id)
+            if faltantes:
+                logger.warning(f"Cola Sheets: productos {faltantes} no encontrados en {hoja}; se descartan.")
+                descartadas += len(faltantes)
+            productos[:] = [(clave, item) for clave, item in productos if clave[0] != hoja]
+
+        filas_por_hoja: Dict[str, List[list]] = {}
+        for hoja, fila in agregados:
+            filas_por_hoja.setdefault(hoja, []).append(fila)
+        # Headers before items, so a reader never sees items of a missing sale
+        for hoja in sorted(filas_por_hoja, key=lambda h: h != SHEET_VENTAS):
+            sheets.agregar_filas(hoja, filas_por_hoja[hoja], self.spreadsheet_id)
+            agregados[:] = [(h, fila) for h, fila in agregados if h != hoja]
+        return descartadas
+
+    def _procesar_lote(self):
+        with self._cond:
+            productos, agregados = self._tomar_lote()
+
+        inicio = time.perf_counter()
+        enviadas = len(productos) + len(agregados)
+        try:
+            descartadas = self._enviar(productos, agregados)
+        except Exception as e:
+            reintentar = _es_reintentable(e) or sheets._invalidar_por_error(e)
+            with self._cond:
+                self._en_vuelo = 0
+                self._productos_en_vuelo, self._agregados_en_vuelo = {}, []
+                self._ultimo_error = str(e)
+                self._escritas += enviadas - len(productos) - len(agregados)
+                # Only the parts that did not reach the sheet go back to the queue
+                self._devolver_lote(productos, agregados)
+                if reintentar:
+                    self._reintentos += 1
+                    self._intentos += 1
+                else:
+                    self._bloqueo = str(e)
+                    self._intentos = 0
+                self._cond.notify_all()
+            if reintentar:
+                espera = min(self.backoff_max, self.backoff_inicial * 2 ** (self._intentos - 1))
+                espera += random.uniform(0, espera / 2)
+                logger.warning(f"Cola Sheets: {e}; reintento en {espera:.1f}s (profundidad {self.profundidad})")
+                with self._cond:
+                    self._cond.wait_for(lambda: self._detener and not self._forzar, timeout=espera)
+            else:
+                logger.error(f"Cola Sheets: envío bloqueado por error no reintentable: {e} "
+                             f"({self.profundidad} escrituras retenidas hasta reanudar)")
+            return
+
+        latencia = time.perf_counter() - inicio
+        with self._cond:
+            self._en_vuelo = 0
+            self._productos_en_vuelo, self._agregados_en_vuelo = {}, []
+            self._intentos = 0
+            self._lotes += 1
+            self._escritas += enviadas - descartadas
+            self._descartadas += descartadas
+            if descartadas:
+                self._stock = None
+            self._latencias.append(latencia)
+            if not (self._productos or self._agregados):
+                self._forzar = False
+            self._cond.notify_all()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._listo_para_enviar():
+                    if self._detener:
+                        return
+                    espera = None
+                    if self._primera_pendiente is not None and self._bloqueo is None:
+                        espera = max(0.0, self.intervalo - (time.monotonic() - self._primera_pendiente))
+                    self._cond.wait(timeout=espera)
+            self._procesar_lote()
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener = False
+            self._hilo = threading.Thread(target=self._loop, name="sheets-write-behind", daemon=True)
+            self._hilo.start()
+
+    def reanudar(self):
+        """Vuelve a enviar tras un bloqueo (p. ej. una vez corregidos los permisos de la planilla)."""
+        with self._cond:
+            if self._bloqueo is not None:
+                logger.info(f"Cola Sheets: se reanuda el envío ({len(self._productos) + len(self._agregados)} pendientes)")
+            self._bloqueo = None
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Envía todo lo pendiente sin esperar el intervalo. True si la cola quedó vacía (False si está bloqueada)."""
+        with self._cond:
+            self._forzar = True
+            self._cond.notify_all()
+            vacia = self._cond.wait_for(
+                lambda: not (self._productos or self._agregados or self._en_vuelo)
+                or (self._bloqueo is not None and not self._en_vuelo),
+                timeout=timeout,
+            )
+            self._forzar = False
+            return vacia and not (self._productos or self._agregados)
+
+    def detener(self, flush: bool = True, timeout: Optional[float] = 30.0):
+        """Detiene el hilo de envío (por defecto, tras vaciar la cola)."""
+        if flush and self._hilo is not None and self._hilo.is_alive():
+            self.flush(timeout)
+        with self._cond:
+            self._detener = True
+            self._cond.notify_all()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+        with self._cond:
+            retenidas = list(self._productos.values()) + self._agregados
+        if retenidas:
+            # Last resort: the rows that never reached the sheet stay in the log to load them by hand
+            logger.error(f"Cola Sheets: {len(retenidas)} escrituras sin enviar al detener "
+                         f"({self._bloqueo or 'tiempo agotado'}): {retenidas}")
+
+    # --- Métricas -----------------------------------------------------------------
+
+    @property
+    def lotes(self) -> int:
+        """Lotes enviados con éxito (cambia cada vez que la hoja recibe un flush)."""
+        return self._lotes
+
+    def metricas(self) -> Dict[str, Any]:
+        """Profundidad de la cola, antigüedad de lo pendiente y latencia de los flush (ms)."""
+        with self._cond:
+            latencias = sorted(self._latencias)
+            antiguedad = time.monotonic() - self._primera_pendiente if self._primera_pendiente else 0.0
+            return {
+                "profundidad": len(self._productos) + len(self._agregados),
+                "en_vuelo": self._en_vuelo,
+                "antiguedad_s": round(antiguedad, 3),
+                "encoladas": self._encoladas,
+                "coalescidas": self._coalescidas,
+                "escritas": self._escritas,
+                "descartadas": self._descartadas,
+                "lotes": self._lotes,
+                "reintentos": self._reintentos,
+                "reintentando": self._intentos > 0,
+                "bloqueada": self._bloqueo,
+                "flush_ms_p50": round(latencias[len(latencias) // 2] * 1000, 1) if latencias else None,
+                "flush_ms_p95": round(latencias[int(len(latencias) * 0.95)] * 1000, 1) if latencias else None,
+                "flush_ms_max": round(latencias[-1] * 1000, 1) if latencias else None,
+                "ultimo_error": self._ultimo_error,
+            }
+
+_cola: Optional[ColaEscrituraSheets] = None
+_cola_lock = threading.Lock()
+
+def obtener_cola(spreadsheet_id: Optional[str] = None) -> ColaEscrituraSheets:
+    """Cola compartida por el proceso; al salir se vacía antes de terminar."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaEscrituraSheets(spreadsheet_id=spreadsheet_id)
+            atexit.register(_cola.detener)
+        return _cola
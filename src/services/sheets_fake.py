@@ -0,0 +1,348 @@
+"""
+Backend de Google Sheets en memoria, compatible con la parte de gspread que usa sheets.py.
+
+Sirve para tests y benchmarks sin red: cada método que en gspread es una llamada a la API
+cuenta como una llamada, suma una latencia configurable (simulada o real) y respeta cuotas
+por minuto de lectura y escritura (al excederlas lanza el mismo APIError 429 que Google).
+
+Uso:
+    servidor = ServidorSheetsFake(latencia=0.15, cuota_escritura=60)
+    servidor.crear_planilla("VENTAS VETA")
+    with usar_fake(servidor):
+        sheets.leer_stock()
+    servidor.llamadas        # Counter por método
+    servidor.tiempo_simulado # segundos de espera acumulados
+"""
+import contextlib
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional, Union
+import gspread
+from gspread.cell import Cell
+from gspread.utils import a1_range_to_grid_range, numericise_all, to_records
+
+class _RespuestaFake:
+    """Lo mínimo de requests.Response que necesita gspread.exceptions.APIError."""
+    def __init__(self, code: int, status: str, message: str):
+        self.status_code = code
+        self._error = {"code": code, "status": status, "message": message}
+        self.text = message
+
+    def json(self):
+        return {"error": self._error}
+
+def _api_error(code: int, status: str, message: str) -> gspread.exceptions.APIError:
+    return gspread.exceptions.APIError(_RespuestaFake(code, status, message))
+
+def _formatear(valor: Any) -> str:
+    """Valor tal como lo devuelve la API con FORMATTED_VALUE."""
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+def _interpretar(valor: Any, user_entered: bool) -> Any:
+    """USER_ENTERED: ' fuerza texto y los números escritos como texto pasan a número (como Sheets)."""
+    if not user_entered or not isinstance(valor, str):
+        return valor
+    if valor.startswith("'"):
+        return valor[1:]
+    return numericise_all([valor])[0]
+
+class ServidorSheetsFake:
+    """
+    Estado compartido: planillas, reloj, cuotas y contadores de llamadas.
+
+    latencia: segundos por llamada (número o función nombre_metodo -> segundos).
+    dormir: True duerme de verdad; False solo acumula tiempo_simulado (benchmarks rápidos).
+    cuota_lectura / cuota_escritura: llamadas por minuto (None = sin límite).
+    """
+
+    def __init__(
+        self,
+        latencia: Union[float, Callable[[str], float]] = 0.0,
+        dormir: bool = False,
+        cuota_lectura: Optional[int] = None,
+        cuota_escritura: Optional[int] = None,
+    ):
+        self.latencia = latencia
+        self.dormir = dormir
+        self.cuota_lectura = cuota_lectura
+        self.cuota_escritura = cuota_escritura
+        self.planillas: Dict[str, "PlanillaFake"] = {}
+        self._lock = threading.RLock()
+        self.reiniciar_contadores()
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.llamadas = Counter()
+            self.rechazadas = 0
+            self.tiempo_simulado = 0.0
+            self._ventanas = {"lectura": deque(), "escritura": deque()}
+
+    @property
+    def total_llamadas(self) -> int:
+        return sum(self.llamadas.values())
+
+    def _ahora(self) -> float:
+        return time.monotonic() if self.dormir else self.tiempo_simulado
+
+    def llamada(self, metodo: str, escritura: bool = False):
+        """Registra una llamada a la API: cuota, latencia y contador."""
+        with self._lock:
+            tipo = "escritura" if escritura else "lectura"
+            cuota = self.cuota_escritura if escritura else self.cuota_lectura
+            ventana = self._ventanas[tipo]
+            ahora = self._ahora()
+            while ventana and ahora - ventana[0] >= 60:
+                ventana.popleft()
+            if cuota is not None and len(ventana) >= cuota:
+                self.rechazadas += 1
+                raise _api_error(429, "RESOURCE_EXHAUSTED",
+                                 f"Quota exceeded for quota metric '{tipo}' (fake: {cuota}/min)")
+            ventana.append(ahora)
+            self.llamadas[metodo] += 1
+            espera = self.latencia(metodo) if callable(self.latencia) else self.latencia
+            if not self.dormir:
+                self.tiempo_simulado += espera
+        if self.dormir and espera:
+            time.sleep(espera)
+
+    def crear_planilla(self, nombre: str, key: Optional[str] = None) -> "PlanillaFake":
+        planilla = PlanillaFake(self, nombre, key or f"fake-{len(self.planillas) + 1}")
+        self.planillas[nombre] = planilla
+        return planilla
+
+    def cliente(self) -> "ClienteFake":
+        return ClienteFake(self)
+
+class ClienteFake:
+    """Equivalente a gspread.Client (open / open_by_key)."""
+
+    def __init__(self, servidor: ServidorSheetsFake):
+        self.servidor = servidor
+
+    def open(self, title: str) -> "PlanillaFake":
+        self.servidor.llamada("open")
+        if title not in self.servidor.planillas:
+            raise gspread.SpreadsheetNotFound(title)
+        return self.servidor.planillas[title]
+
+    def open_by_key(self, key: str) -> "PlanillaFake":
+        self.servidor.llamada("open_by_key")
+        for planilla in self.servidor.planillas.values():
+            if planilla.id == key:
+                return planilla
+        raise gspread.SpreadsheetNotFound(key)
+
+class PlanillaFake:
+    """Equivalente a gspread.Spreadsheet."""
+
+    def __init__(self, servidor: ServidorSheetsFake, title: str, key: str):
+        self.servidor = servidor
+        self.title = title
+        self.id = key
+        self._hojas: Dict[str, "HojaFake"] = {}
+
+    def worksheet(self, title: str) -> "HojaFake":
+        self.servidor.llamada("worksheet")
+        if title not in self._hojas:
+            raise gspread.WorksheetNotFound(title)
+        return self._hojas[title]
+
+    def worksheets(self) -> List["HojaFake"]:
+        self.servidor.llamada("worksheets")
+        return list(self._hojas.values())
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kwargs) -> "HojaFake":
+        self.servidor.llamada("add_worksheet", escritura=True)
+        hoja = HojaFake(self.servidor, title, rows, cols)
+        self._hojas[title] = hoja
+        return hoja
+
+    def del_worksheet(self, worksheet: "HojaFake"):
+        self.servidor.llamada("del_worksheet", escritura=True)
+        self._hojas.pop(worksheet.title, None)
+
+    def values_batch_get(self, ranges: List[str], params: Optional[dict] = None) -> dict:
+        """Varios rangos 'Hoja!A1:B2' en una sola llamada (spreadsheets.values.batchGet)."""
+        self.servidor.llamada("values_batch_get")
+        rangos = []
+        for rango in ranges:
+            titulo, _, a1 = rango.partition("!")
+            hoja = self._hojas.get(titulo.strip("'"))
+            if hoja is None:
+                raise _api_error(400, "INVALID_ARGUMENT", f"Unable to parse range: {rango}")
+            rangos.append({"range": rango, "majorDimension": "ROWS", "values": hoja._leer(a1 or None)})
+        return {"spreadsheetId": self.id, "valueRanges": rangos}
+
+    def cargar(self, title: str, filas: List[list]) -> "HojaFake":
+        """Crea (o reemplaza) una hoja con datos, sin contar llamadas. Para preparar escenarios."""
+        hoja = HojaFake(self.servidor, title, max(len(filas), 1000), max((len(f) for f in filas), default=10))
+        hoja._datos = [list(f) for f in filas]
+        self._hojas[title] = hoja
+        return hoja
+
+class HojaFake:
+    """Equivalente a gspread.Worksheet, con los datos en una lista de filas."""
+
+    def __init__(self, servidor: ServidorSheetsFake, title: str, rows: int, cols: int):
+        self.servidor = servidor
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self._datos: List[list] = []
+
+    # --- Helpers internos (no cuentan llamadas) ---
+
+    def _celda(self, fila: int, col: int) -> Any:
+        if fila <= len(self._datos) and col <= len(self._datos[fila - 1]):
+            return self._datos[fila - 1][col - 1]
+        return ""
+
+    def _escribir(self, fila: int, col: int, valor: Any):
+        while len(self._datos) < fila:
+            self._datos.append([])
+        datos_fila = self._datos[fila - 1]
+        while len(datos_fila) < col:
+            datos_fila.append("")
+        datos_fila[col - 1] = valor
+        self.row_count = max(self.row_count, fila)
+
+    def _leer(self, a1: Optional[str]) -> List[List[str]]:
+        """Valores formateados del rango (sin filas/columnas vacías al final, como la API)."""
+        if a1:
+            g = a1_range_to_grid_range(a1)
+            f0, f1 = g.get("startRowIndex", 0), g.get("endRowIndex", len(self._datos))
+            c0, c1 = g.get("startColumnIndex", 0), g.get("endColumnIndex", self.col_count)
+        else:
+            f0, f1, c0, c1 = 0, len(self._datos), 0, self.col_count
+        filas = []
+        for fila in self._datos[f0:f1]:
+            valores = [_formatear(v) for v in fila[c0:c1]]
+            while valores and valores[-1] == "":
+                valores.pop()
+            filas.append(valores)
+        while filas and not filas[-1]:
+            filas.pop()
+        return filas
+
+    # --- Lecturas ---
+
+    def get_all_values(self, **kwargs) -> List[List[str]]:
+        self.servidor.llamada("get_all_values")
+        filas = self._leer(None)
+        ancho = max((len(f) for f in filas), default=0)
+        return [f + [""] * (ancho - len(f)) for f in filas]
+
+    def get_values(self, range_name: Optional[str] = None, **kwargs) -> List[List[str]]:
+        self.servidor.llamada("get_values")
+        filas = self._leer(range_name)
+        ancho = max((len(f) for f in filas), default=0)
+        return [f + [""] * (ancho - len(f)) for f in filas]
+
+    def get_all_records(self, head: int = 1, **kwargs) -> List[Dict[str, Any]]:
+        self.servidor.llamada("get_all_records")
+        filas = self._leer(None)
+        if len(filas) < head:
+            return []
+        claves = filas[head - 1]
+        valores = [numericise_all(f + [""] * (len(claves) - len(f)))[:len(claves)] for f in filas[head:]]
+        return to_records(claves, valores)
+
+    def row_values(self, row: int, **kwargs) -> List[str]:
+        self.servidor.llamada("row_values")
+        if row > len(self._datos):
+            return []
+        valores = [_formatear(v) for v in self._datos[row - 1]]
+        while valores and valores[-1] == "":
+            valores.pop()
+        return valores
+
+    def col_values(self, col: int, **kwargs) -> List[str]:
+        self.servidor.llamada("col_values")
+        valores = [_formatear(self._celda(f, col)) for f in range(1, len(self._datos) + 1)]
+        while valores and valores[-1] == "":
+            valores.pop()
+        return valores
+
+    def find(self, query: str, in_row: Optional[int] = None, in_column: Optional[int] = None, **kwargs) -> Optional[Cell]:
+        self.servidor.llamada("find")
+        for f, fila in enumerate(self._datos, start=1):
+            if in_row is not None and f != in_row:
+                continue
+            for c, valor in enumerate(fila, start=1):
+                if in_column is not None and c != in_column:
+                    continue
+                if _formatear(valor) == str(query):
+                    return Cell(f, c, _formatear(valor))
+        return None
+
+    # --- Escrituras ---
+
+    def update_cell(self, row: int, col: int, value: Any) -> dict:
+        self.servidor.llamada("update_cell", escritura=True)
+        self._escribir(row, col, _interpretar(value, True))
+        return {"updatedCells": 1}
+
+    def _actualizar_rango(self, values: List[list], range_name: str, user_entered: bool) -> int:
+        g = a1_range_to_grid_range(range_name)
+        f0, c0 = g.get("startRowIndex", 0), g.get("startColumnIndex", 0)
+        celdas = 0
+        for i, fila in enumerate(values):
+            for j, valor in enumerate(fila):
+                self._escribir(f0 + i + 1, c0 + j + 1, _interpretar(valor, user_entered))
+                celdas += 1
+        return celdas
+
+    def update(self, values: List[list], range_name: Optional[str] = None, raw: bool = True,
+               value_input_option: Any = None, **kwargs) -> dict:
+        self.servidor.llamada("update", escritura=True)
+        user_entered = str(getattr(value_input_option, "value", value_input_option)) == "USER_ENTERED" or not raw
+        return {"updatedCells": self._actualizar_rango(values, range_name or "A1", user_entered)}
+
+    def batch_update(self, data: List[dict], raw: bool = True, value_input_option: Any = None, **kwargs) -> dict:
+        self.servidor.llamada("batch_update", escritura=True)
+        user_entered = str(getattr(value_input_option, "value", value_input_option)) == "USER_ENTERED" or not raw
+        celdas = sum(self._actualizar_rango(d["values"], d["range"], user_entered) for d in data)
+        return {"totalUpdatedCells": celdas}
+
+    def _agregar(self, filas: List[list], value_input_option: Any):
+        user_entered = str(getattr(value_input_option, "value", value_input_option)) == "USER_ENTERED"
+        # Like the API: append after the last non-empty row of the table
+        ultima = len(self._leer(None))
+        for i, fila in enumerate(filas):
+            for j, valor in enumerate(fila):
+                self._escribir(ultima + i + 1, j + 1, _interpretar(valor, user_entered))
+
+    def append_row(self, values: list, value_input_option: Any = "RAW", **kwargs) -> dict:
+        self.servidor.llamada("append_row", escritura=True)
+        self._agregar([values], value_input_option)
+        return {"updates": {"updatedRows": 1}}
+
+    def append_rows(self, values: List[list], value_input_option: Any = "RAW", **kwargs) -> dict:
+        self.servidor.llamada("append_rows", escritura=True)
+        self._agregar(values, value_input_option)
+        return {"updates": {"updatedRows": len(values)}}
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None) -> dict:
+        self.servidor.llamada("delete_rows", escritura=True)
+        end_index = end_index or start_index
+        del self._datos[start_index - 1:end_index]
+        self.row_count -= end_index - start_index + 1
+        return {}
+
+@contextlib.contextmanager
+def usar_fake(servidor: ServidorSheetsFake):
+    """Hace que sheets.py use el servidor fake en lugar de Google (y limpia la cache al entrar y salir)."""
+    from src.services import sheets
+    original = sheets._crear_cliente
+    sheets._crear_cliente = servidor.cliente
+    sheets.invalidar_cache(cliente=True)
+    try:
+        yield servidor
+    finally:
+        sheets._crear_cliente = original
+        sheets.invalidar_cache(cliente=True)
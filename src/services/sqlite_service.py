@@ -0,0 +1,427 @@
+"""
+SQLite Service Layer for Ventas Veta (backend embebido).
+
+Misma API núcleo que postgres_service (ver src/services/almacenamiento.py) sobre un archivo
+SQLite local en modo WAL: sin red, pensado para un solo local o desarrollo.
+
+CONFIGURACIÓN:
+--------------
+-   `STORAGE_BACKEND = "sqlite"` en `.streamlit/secrets.toml` o en el entorno.
+-   `DB_PATH_SQLITE` (opcional): ruta del archivo. Por defecto `ventas_veta.db` en el directorio de trabajo.
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
+from ..models import StockItem, Venta, VentaItem
+
+DB_PATH_DEFAULT = "ventas_veta.db"
+
+def _db_path() -> str:
+    if st is not None:
+        try:
+            if hasattr(st, "secrets") and "DB_PATH_SQLITE" in st.secrets:
+                return st.secrets["DB_PATH_SQLITE"]
+        except Exception:
+            pass
+    return os.getenv("DB_PATH_SQLITE", DB_PATH_DEFAULT)
+
+def get_connection():
+    """Abre el archivo SQLite en modo WAL (lectores no bloquean al escritor), con claves foráneas activas."""
+    conn = sqlite3.connect(_db_path(), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    # WAL + NORMAL: durable on commit except for an OS crash/power loss right after it
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def init_db():
+    """Initializes the database schema if it doesn't exist."""
+    conn = get_connection()
+    try:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS stock (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                codigo TEXT,
+                nombre TEXT NOT NULL,
+                categoria TEXT,
+                cantidad INTEGER DEFAULT 0,
+                precio_unitario REAL DEFAULT 0.0,
+                min_stock INTEGER DEFAULT 5,
+                marca TEXT NOT NULL DEFAULT 'VETA'
+            );
+
+            CREATE TABLE IF NOT EXISTS ventas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fecha TEXT NOT NULL,
+                cliente TEXT,
+                total_bruto REAL DEFAULT 0.0,
+                descuento_porcentaje REAL DEFAULT 0.0,
+                total_neto REAL DEFAULT 0.0,
+                estado TEXT DEFAULT 'confirmada',
+                estado_facturacion TEXT DEFAULT 'No Facturado',
+                marca TEXT NOT NULL DEFAULT 'VETA',
+                tipo_venta TEXT DEFAULT 'Venta Directa'
+            );
+
+            CREATE TABLE IF NOT EXISTS ventas_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                venta_id INTEGER NOT NULL REFERENCES ventas (id),
+                producto_id INTEGER NOT NULL REFERENCES stock (id),
+                cantidad INTEGER NOT NULL,
+                precio_unitario REAL NOT NULL,
+                subtotal REAL NOT NULL,
+                marca TEXT NOT NULL DEFAULT 'VETA'
+            );
+
+            CREATE TABLE IF NOT EXISTS clientes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                razon_social TEXT NOT NULL,
+                cuit_cuil TEXT,
+                fecha_creacion TEXT,
+                marca TEXT NOT NULL DEFAULT 'VETA'
+            );
+
+            CREATE TABLE IF NOT EXISTS concesionarios (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nombre_socio TEXT NOT NULL UNIQUE,
+                cuit_cuil TEXT,
+                contacto TEXT,
+                marca TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS concesion_stock (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                concesionario_id INTEGER NOT NULL REFERENCES concesionarios (id),
+                producto_id INTEGER NOT NULL,
+                marca TEXT NOT NULL,
+                cantidad_disponible REAL NOT NULL,
+                fecha_salida TEXT
+            );
+
+            -- Same access paths as the Postgres schema
+            CREATE INDEX IF NOT EXISTS idx_stock_critico ON stock (marca, categoria) WHERE cantidad <= min_stock;
+            CREATE INDEX IF NOT EXISTS idx_stock_codigo ON stock (marca, codigo);
+            CREATE INDEX IF NOT EXISTS idx_stock_nombre_prefijo ON stock (marca, lower(nombre));
+            CREATE INDEX IF NOT EXISTS idx_ventas_fecha_id ON ventas (fecha, id);
+            CREATE INDEX IF NOT EXISTS idx_ventas_marca_fecha_id ON ventas (marca, fecha, id);
+            CREATE INDEX IF NOT EXISTS idx_ventas_items_venta ON ventas_items (venta_id);
+            CREATE INDEX IF NOT EXISTS idx_clientes_razon_norm ON clientes (lower(trim(razon_social)));
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+
+def escapar_like(texto: str) -> str:
+    """Escapa los comodines de LIKE (%, _) tipeados por el usuario (usar con ESCAPE '\\')."""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# --- STOCK CRUD ---
+
+def _row_to_stock_item(row) -> StockItem:
+    return StockItem(
+        id=row['id'],
+        codigo=row['codigo'] if row['codigo'] else "",
+        nombre=row['nombre'],
+        categoria=row['categoria'] if row['categoria'] else "",
+        cantidad=row['cantidad'],
+        precio_unitario=float(row['precio_unitario']),
+        min_stock=row['min_stock'],
+        marca=row['marca']
+    )
+
+def leer_stock(marca: Optional[str] = None) -> List[StockItem]:
+    conn = get_connection()
+    try:
+        if marca:
+            rows = conn.execute("SELECT * FROM stock WHERE marca = ?", (marca,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM stock").fetchall()
+        return [_row_to_stock_item(row) for row in rows]
+    finally:
+        conn.close()
+
+def leer_productos_por_ids(ids: List[int]) -> List[StockItem]:
+    """Lee solo los productos indicados (ej. para nombrar un ranking sin cargar el catálogo)."""
+    ids = list(ids)
+    if not ids:
+        return []
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            f"SELECT * FROM stock WHERE id IN ({', '.join('?' * len(ids))})", ids
+        ).fetchall()
+        return [_row_to_stock_item(row) for row in rows]
+    finally:
+        conn.close()
+
+def leer_stock_critico(marca: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Productos en o bajo su stock mínimo (incluye agotados), resueltos con idx_stock_critico.
+    Mismo formato que postgres_service.leer_stock_critico.
+    """
+    filtro_marca = "AND marca = ?" if marca else ""
+    params = (marca,) if marca else ()
+
+    conn = get_connection()
+    try:
+        items = [_row_to_stock_item(row) for row in conn.execute(f"""
+            SELECT * FROM stock
+            WHERE cantidad <= min_stock {filtro_marca}
+            ORDER BY cantidad ASC, nombre ASC
+        """, params).fetchall()]
+
+        por_categoria = [dict(row) for row in conn.execute(f"""
+            SELECT COALESCE(categoria, '') AS categoria,
+                   COUNT(*) AS criticos,
+                   COUNT(*) FILTER (WHERE cantidad <= 0) AS agotados
+            FROM stock
+            WHERE cantidad <= min_stock {filtro_marca}
+            GROUP BY COALESCE(categoria, '')
+            ORDER BY criticos DESC, categoria ASC
+        """, params).fetchall()]
+
+        return {
+            "items": items,
+            "por_categoria": por_categoria,
+            "criticos": sum(c['criticos'] for c in por_categoria),
+            "agotados": sum(c['agotados'] for c in por_categoria),
+        }
+    finally:
+        conn.close()
+
+def _normalizar_codigo(codigo: str) -> str:
+    return codigo.zfill(2) if codigo.isdigit() else codigo
+
+def buscar_producto_por_codigo(marca: str, codigo: str) -> Optional[StockItem]:
+    """
+    Producto con ese código exacto (lectora de código de barras / tipeo en el POS).
+    Acepta el código sin el cero inicial ("2" encuentra "02").
+    """
+    codigo = codigo.strip()
+    if not codigo:
+        return None
+
+    conn = get_connection()
+    try:
+        row = conn.execute("""
+            SELECT * FROM stock
+            WHERE marca = ? AND codigo IN (?, ?)
+            ORDER BY codigo = ? DESC, id
+            LIMIT 1
+        """, (marca, codigo, _normalizar_codigo(codigo), codigo)).fetchone()
+    finally:
+        conn.close()
+    return _row_to_stock_item(row) if row else None
+
+def buscar_productos(marca: str, texto: str, limite: int = 20) -> List[StockItem]:
+    """
+    Mejores coincidencias de productos para un texto (con stock y precio), sin leer el catálogo.
+
+    Orden: código exacto, prefijo de código, prefijo del nombre y fragmento del nombre
+    (SQLite no tiene similitud por trigramas).
+    """
+    q = texto.strip().lower()
+    if not q:
+        return []
+    q_like = escapar_like(q)
+    params = {
+        "marca": marca, "limite": limite,
+        "codigo": texto.strip(), "codigo_norm": _normalizar_codigo(texto.strip()),
+        "codigo_prefijo": escapar_like(texto.strip()) + "%",
+        "prefijo": q_like + "%", "contiene": "%" + q_like + "%",
+    }
+
+    conn = get_connection()
+    try:
+        # LIKE in SQLite is case-insensitive for ASCII; codes are compared the same way as in Postgres
+        rows = conn.execute(r"""
+            SELECT * FROM stock
+            WHERE marca = :marca AND (
+                codigo IN (:codigo, :codigo_norm)
+                OR codigo LIKE :codigo_prefijo ESCAPE '\'
+                OR lower(nombre) LIKE :contiene ESCAPE '\'
+            )
+            ORDER BY codigo IN (:codigo, :codigo_norm) DESC,
+                     codigo LIKE :codigo_prefijo ESCAPE '\' DESC,
+                     lower(nombre) LIKE :prefijo ESCAPE '\' DESC,
+                     nombre
+            LIMIT :limite
+        """, params).fetchall()
+    finally:
+        conn.close()
+    return [_row_to_stock_item(row) for row in rows]
+
+def crear_producto(item: StockItem):
+    conn = get_connection()
+    try:
+        conn.execute("""
+            INSERT INTO stock (codigo, nombre, categoria, cantidad, precio_unitario, min_stock, marca)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (_normalizar_codigo(item.codigo), item.nombre, item.categoria, item.cantidad,
+              item.precio_unitario, item.min_stock, item.marca))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def actualizar_producto(item: StockItem):
+    conn = get_connection()
+    try:
+        cursor = conn.execute("""
+            UPDATE stock
+            SET codigo = ?, nombre = ?, categoria = ?, cantidad = ?, precio_unitario = ?, min_stock = ?, marca = ?
+            WHERE id = ?
+        """, (_normalizar_codigo(item.codigo), item.nombre, item.categoria, item.cantidad,
+              item.precio_unitario, item.min_stock, item.marca, item.id))
+
+        if cursor.rowcount == 0:
+            raise ValueError(f"Producto ID {item.id} no encontrado.")
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def eliminar_producto(item_id: int):
+    conn = get_connection()
+    try:
+        cursor = conn.execute("DELETE FROM stock WHERE id = ?", (item_id,))
+        if cursor.rowcount == 0:
+            raise ValueError(f"Producto ID {item_id} no encontrado.")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+# --- SALES CRUD ---
+
+def _row_to_venta(row) -> Venta:
+    try:
+        fecha_obj = datetime.fromisoformat(row['fecha'])
+    except ValueError:
+        fecha_obj = datetime.now()
+    return Venta(
+        id=row['id'],
+        fecha=fecha_obj,
+        cliente=row['cliente'],
+        total_bruto=float(row['total_bruto']),
+        descuento_porcentaje=float(row['descuento_porcentaje']),
+        total_neto=float(row['total_neto']),
+        estado=row['estado'],
+        estado_facturacion=row['estado_facturacion'] or "No Facturado",
+        marca=row['marca']
+    )
+
+def _row_to_venta_item(row) -> VentaItem:
+    return VentaItem(
+        id=row['id'],
+        venta_id=row['venta_id'],
+        producto_id=row['producto_id'],
+        cantidad=row['cantidad'],
+        precio_unitario=float(row['precio_unitario']),
+        subtotal=float(row['subtotal']),
+        marca=row['marca']
+    )
+
+def leer_ventas(marca: Optional[str] = None) -> List[Venta]:
+    conn = get_connection()
+    try:
+        if marca:
+            rows = conn.execute("SELECT * FROM ventas WHERE marca = ? ORDER BY id DESC", (marca,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM ventas ORDER BY id DESC").fetchall()
+        return [_row_to_venta(row) for row in rows]
+    finally:
+        conn.close()
+
+def leer_items_por_venta(venta_id: int) -> List[VentaItem]:
+    conn = get_connection()
+    try:
+        rows = conn.execute("SELECT * FROM ventas_items WHERE venta_id = ?", (venta_id,)).fetchall()
+        return [_row_to_venta_item(row) for row in rows]
+    finally:
+        conn.close()
+
+def leer_ventas_items(marca: Optional[str] = None) -> List[VentaItem]:
+    conn = get_connection()
+    try:
+        if marca:
+            rows = conn.execute("SELECT * FROM ventas_items WHERE marca = ?", (marca,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM ventas_items").fetchall()
+        return [_row_to_venta_item(row) for row in rows]
+    finally:
+        conn.close()
+
+def _next_id(tabla: str) -> int:
+    conn = get_connection()
+    try:
+        row = conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 AS siguiente FROM {tabla}").fetchone()
+        return row['siguiente']
+    finally:
+        conn.close()
+
+def get_next_venta_id() -> int:
+    # Estimation for the UI; the real id is assigned on INSERT
+    return _next_id("ventas")
+
+def get_next_venta_item_id() -> int:
+    return _next_id("ventas_items")
+
+def registrar_venta(venta: Venta, items: List[VentaItem]):
+    """
+    Registra la venta en una transacción: descuenta stock, inserta cabecera e items.
+    Retorna el id asignado a la venta.
+    """
+    conn = get_connection()
+    try:
+        # Take the write lock up front so the stock check and the update can't interleave
+        conn.execute("BEGIN IMMEDIATE")
+
+        # 1. Validation & Stock Update
+        for item in items:
+            res = conn.execute("SELECT cantidad, nombre FROM stock WHERE id = ?", (item.producto_id,)).fetchone()
+            if not res:
+                raise ValueError(f"Producto ID {item.producto_id} no existe.")
+
+            stock_actual, nombre_prod = res['cantidad'], res['nombre']
+            if stock_actual < item.cantidad:
+                raise ValueError(f"Stock insuficiente para {nombre_prod}. Hay {stock_actual}, pides {item.cantidad}.")
+
+            conn.execute("UPDATE stock SET cantidad = ? WHERE id = ?", (stock_actual - item.cantidad, item.producto_id))
+
+        # 2. Insert Header
+        cursor = conn.execute("""
+            INSERT INTO ventas (fecha, cliente, total_bruto, descuento_porcentaje, total_neto, estado, estado_facturacion, marca, tipo_venta)
+            VALUES (?, ?, ?, ?, ?, ?, 'No Facturado', ?, ?)
+        """, (venta.fecha.isoformat(), venta.cliente, venta.total_bruto, venta.descuento_porcentaje,
+              venta.total_neto, venta.estado, venta.marca, venta.tipo_venta))
+        venta_inserted_id = cursor.lastrowid
+
+        # 3. Insert Items
+        conn.executemany("""
+            INSERT INTO ventas_items (venta_id, producto_id, cantidad, precio_unitario, subtotal, marca)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(venta_inserted_id, i.producto_id, i.cantidad, i.precio_unitario, i.subtotal, venta.marca) for i in items])
+
+        conn.commit()
+        return venta_inserted_id
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
@@ -0,0 +1,147 @@
+import os
+from datetime import datetime
+import pytest
+from src.config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
+from src.models import StockItem, Venta, VentaItem
+from src.services import almacenamiento
+from src.services.almacenamiento import BackendAlmacenamiento, SheetsBackend, obtener_backend
+
+@pytest.fixture(params=["sqlite", "sheets", "postgres"])
+def backend(request, tmp_path, monkeypatch):
+    """Cada backend vacío. Postgres solo corre con TEST_DB_URL_POSTGRES (se vacían stock y ventas)."""
+    if request.param == "sqlite":
+        from src.services import sqlite_service
+        monkeypatch.setattr(sqlite_service, "st", None)
+        monkeypatch.setenv("DB_PATH_SQLITE", str(tmp_path / "ventas.db"))
+        sqlite_service.init_db()
+        yield sqlite_service
+    elif request.param == "sheets":
+        from src.services.sheets_fake import ServidorSheetsFake, usar_fake
+        planilla = ServidorSheetsFake().crear_planilla("VENTAS VETA")
+        planilla.cargar(SHEET_STOCK, [['id', 'codigo', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'min_stock']])
+        planilla.cargar(SHEET_VENTAS, [['id', 'fecha', 'cliente', 'total_bruto', 'descuento_porcentaje', 'total_neto', 'estado']])
+        planilla.cargar(SHEET_VENTAS_ITEMS, [['id', 'venta_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal']])
+        from src.services.sheets_cola import ColaEscrituraSheets
+        with usar_fake(planilla.servidor):
+            cola = ColaEscrituraSheets()
+            try:
+                yield SheetsBackend(cola=cola)
+            finally:
+                cola.detener()
+    else:
+        url = os.getenv("TEST_DB_URL_POSTGRES")
+        if not url:
+            pytest.skip("TEST_DB_URL_POSTGRES no configurada")
+        from src.services import postgres_service
+        monkeypatch.setattr(postgres_service, "st", None)
+        monkeypatch.setenv("DB_URL_POSTGRES", url)
+        postgres_service.init_db()
+        conn = postgres_service.get_connection()
+        try:
+            conn.cursor().execute("TRUNCATE ventas_items, ventas, stock RESTART IDENTITY CASCADE")
+            conn.commit()
+        finally:
+            conn.close()
+        yield postgres_service
+
+def _producto(codigo, nombre, cantidad=10, min_stock=2):
+    return StockItem(id=0, codigo=codigo, nombre=nombre, categoria="Cat", cantidad=cantidad,
+                     precio_unitario=100.0, min_stock=min_stock, marca="VETA")
+
+def _cargar(backend):
+    for p in (_producto("7", "Remera lisa"), _producto("71", "Buzo", cantidad=1),
+              _producto("A10", "Remera estampada", cantidad=0), _producto("20", "Pantalón")):
+        backend.crear_producto(p)
+    return {s.codigo: s for s in backend.leer_stock("VETA")}
+
+def _venta(lineas):
+    items = [VentaItem(id=0, venta_id=0, producto_id=p.id, cantidad=c, precio_unitario=p.precio_unitario,
+                       subtotal=p.precio_unitario * c, marca="VETA") for p, c in lineas]
+    total = sum(i.subtotal for i in items)
+    return Venta(id=0, fecha=datetime(2025, 3, 1, 10, 0), cliente="Cliente", total_bruto=total,
+                 descuento_porcentaje=0, total_neto=total, marca="VETA"), items
+
+def test_cumple_la_interfaz(backend):
+    assert isinstance(backend, BackendAlmacenamiento)
+
+def test_crud_productos(backend):
+    stock = _cargar(backend)
+    assert sorted(stock) == ["07", "20", "71", "A10"]
+
+    remera = stock["07"].model_copy(update={"cantidad": 3, "nombre": "Remera lisa negra"})
+    backend.actualizar_producto(remera)
+    backend.eliminar_producto(stock["20"].id)
+
+    stock = {s.codigo: s for s in backend.leer_stock("VETA")}
+    assert sorted(stock) == ["07", "71", "A10"]
+    assert (stock["07"].cantidad, stock["07"].nombre) == (3, "Remera lisa negra")
+    assert [p.codigo for p in backend.leer_productos_por_ids([stock["71"].id])] == ["71"]
+
+def test_busquedas(backend):
+    _cargar(backend)
+    assert backend.buscar_producto_por_codigo("VETA", "7").codigo == "07"
+    assert backend.buscar_producto_por_codigo("VETA", "99") is None
+    assert backend.buscar_producto_por_codigo("VENETO", "07") is None
+    # Exact code first, then code prefix, then name prefix
+    assert [p.codigo for p in backend.buscar_productos("VETA", "7")] == ["07", "71"]
+    assert [p.nombre for p in backend.buscar_productos("VETA", "rem")] == ["Remera estampada", "Remera lisa"]
+
+    critico = backend.leer_stock_critico("VETA")
+    assert [i.codigo for i in critico["items"]] == ["A10", "71"]
+    assert (critico["criticos"], critico["agotados"]) == (2, 1)
+    assert critico["por_categoria"] == [{"categoria": "Cat", "criticos": 2, "agotados": 1}]
+
+def test_registrar_venta(backend):
+    stock = _cargar(backend)
+    venta_id = backend.registrar_venta(*_venta([(stock["07"], 4), (stock["71"], 1)]))
+
+    stock = {s.codigo: s for s in backend.leer_stock("VETA")}
+    assert (stock["07"].cantidad, stock["71"].cantidad) == (6, 0)
+    ventas = backend.leer_ventas("VETA")
+    assert [v.id for v in ventas] == [venta_id]
+    assert ventas[0].total_neto == 500.0
+    items = backend.leer_items_por_venta(venta_id)
+    assert sorted((i.producto_id, i.cantidad) for i in items) == sorted([(stock["07"].id, 4), (stock["71"].id, 1)])
+    assert backend.get_next_venta_id() > venta_id
+
+def test_registrar_venta_sin_stock_no_escribe(backend):
+    stock = _cargar(backend)
+    with pytest.raises(ValueError, match="Stock insuficiente"):
+        backend.registrar_venta(*_venta([(stock["07"], 2), (stock["71"], 5)]))
+
+    stock = {s.codigo: s for s in backend.leer_stock("VETA")}
+    assert (stock["07"].cantidad, stock["71"].cantidad) == (10, 1)
+    assert backend.leer_ventas("VETA") == []
+    assert backend.leer_ventas_items("VETA") == []
+
+def test_backend_configurado(monkeypatch):
+    monkeypatch.setattr(almacenamiento, "st", None)
+    monkeypatch.delenv("STORAGE_BACKEND", raising=False)
+    assert almacenamiento.backend_configurado() == "postgres"
+    monkeypatch.setenv("STORAGE_BACKEND", "SQLite")
+    assert almacenamiento.backend_configurado() == "sqlite"
+    from src.services import sqlite_service
+    assert obtener_backend() is sqlite_service
+    monkeypatch.setenv("STORAGE_BACKEND", "excel")
+    with pytest.raises(ValueError):
+        almacenamiento.backend_configurado()
+
+def test_sheets_crear_producto_sin_leer_ids_no_escribe(monkeypatch):
+    """Si no se puede leer el mayor id (p. ej. un 429), crear_producto falla en vez de repetir el id 1."""
+    from src.services import sheets
+    from src.services.sheets_cola import ColaEscrituraSheets
+    from src.services.sheets_fake import ServidorSheetsFake, _api_error, usar_fake
+    planilla = ServidorSheetsFake().crear_planilla("VENTAS VETA")
+    planilla.cargar(SHEET_STOCK, [sheets.ENCABEZADOS[SHEET_STOCK], [1, "01", "Remera", "Cat", 5, 100.0, 2]])
+    with usar_fake(planilla.servidor):
+        cola = ColaEscrituraSheets(iniciar=False)
+        backend = SheetsBackend(cola=cola)
+        def cuota_agotada(*args, **kwargs):
+            raise _api_error(429, "RESOURCE_EXHAUSTED", "Quota exceeded")
+        monkeypatch.setattr(sheets, "_indice", cuota_agotada)
+        with pytest.raises(Exception, match="Quota exceeded"):
+            backend.crear_producto(_producto("7", "Buzo"))
+        monkeypatch.undo()
+        assert [p.id for p in sheets.leer_stock()] == [1]
+        backend.crear_producto(_producto("7", "Buzo"))
+        assert [p.id for p in sheets.leer_stock()] == [1, 2]
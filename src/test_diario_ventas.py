@@ -0,0 +1,169 @@
+import os
+import time
+from datetime import datetime
+import pytest
+from src.models import StockItem, Venta, VentaItem
+from src.services import diario_ventas
+from src.services.diario_ventas import CONFLICTO, PENDIENTE, SINCRONIZADA, SincronizadorVentas
+from src.services.postgres_service import VentaRechazadaError
+
+@pytest.fixture(autouse=True)
+def diario(tmp_path, monkeypatch):
+    monkeypatch.setattr(diario_ventas, "st", None)
+    monkeypatch.setenv("DB_PATH_DIARIO", str(tmp_path / "diario.db"))
+
+def _venta(cliente, producto_id=1, cantidad=1):
+    items = [VentaItem(id=0, venta_id=0, producto_id=producto_id, cantidad=cantidad, precio_unitario=100.0,
+                       subtotal=100.0 * cantidad, marca="VETA")]
+    return Venta(id=0, fecha=datetime(2025, 3, 1, 10, 0), cliente=cliente, total_bruto=100.0 * cantidad,
+                 descuento_porcentaje=0, total_neto=100.0 * cantidad, marca="VETA"), items
+
+class BaseFalsa:
+    """Destino en memoria: stock por producto, se puede 'cortar' la conexión."""
+
+    def __init__(self, stock):
+        self.stock = dict(stock)
+        self.ventas = {}
+        self.caida = False
+
+    def __call__(self, venta, items, clave):
+        if self.caida:
+            raise ConnectionError("sin conexión")
+        if clave in self.ventas:
+            return self.ventas[clave][0]
+        for i in items:
+            if self.stock.get(i.producto_id, 0) < i.cantidad:
+                raise VentaRechazadaError(f"Stock insuficiente para producto {i.producto_id}.")
+        for i in items:
+            self.stock[i.producto_id] -= i.cantidad
+        self.ventas[clave] = (len(self.ventas) + 1, venta.cliente)
+        return self.ventas[clave][0]
+
+def test_diario_solo_con_postgres(monkeypatch):
+    """La reproducción va a Postgres: con otro backend el diario no se usa aunque POS_OFFLINE lo pida."""
+    from src.services import almacenamiento
+    monkeypatch.setattr(almacenamiento, "st", None)
+    monkeypatch.delenv("STORAGE_BACKEND", raising=False)
+    monkeypatch.delenv("POS_OFFLINE", raising=False)
+    assert diario_ventas.diario_habilitado()
+    monkeypatch.setenv("POS_OFFLINE", "0")
+    assert not diario_ventas.diario_habilitado()
+    monkeypatch.setenv("POS_OFFLINE", "1")
+    for backend in ("sqlite", "sheets"):
+        monkeypatch.setenv("STORAGE_BACKEND", backend)
+        assert not diario_ventas.diario_habilitado()
+
+def test_sincroniza_en_orden_con_conflictos():
+    base = BaseFalsa({1: 3})
+    numeros = [diario_ventas.registrar_venta(*_venta(c, cantidad=2)) for c in ("A", "B")]
+    numeros.append(diario_ventas.registrar_venta(*_venta("C", cantidad=1)))
+    assert numeros == [1, 2, 3]
+    assert diario_ventas.estado()["pendientes"] == 3
+
+    sinc = SincronizadorVentas(destino=base, iniciar=False)
+    assert sinc.sincronizar() == 3
+    # B no alcanza (quedaban 1), C sí: el conflicto no frena a las siguientes
+    assert [c for _, c in sorted(base.ventas.values())] == ["A", "C"]
+    por_numero = {v["numero"]: v for v in diario_ventas.leer_ventas()}
+    assert [por_numero[n]["estado"] for n in numeros] == [SINCRONIZADA, CONFLICTO, SINCRONIZADA]
+    assert "Stock insuficiente" in por_numero[2]["error"]
+    assert diario_ventas.estado()["conflictos"] == 1
+
+    base.stock[1] = 5
+    diario_ventas.reintentar_conflicto(2)
+    assert sinc.sincronizar() == 1
+    estado = diario_ventas.estado()
+    assert (estado["pendientes"], estado["conflictos"], estado["atraso_s"]) == (0, 0, 0.0)
+    assert [c for _, c in sorted(base.ventas.values())] == ["A", "C", "B"]
+
+def test_error_transitorio_corta_la_pasada_y_no_duplica():
+    base = BaseFalsa({1: 10})
+    diario_ventas.registrar_venta(*_venta("A"))
+    diario_ventas.registrar_venta(*_venta("B"))
+    sinc = SincronizadorVentas(destino=base, iniciar=False)
+
+    base.caida = True
+    with pytest.raises(ConnectionError):
+        sinc.sincronizar()
+    assert [v["estado"] for v in diario_ventas.leer_ventas()] == [PENDIENTE, PENDIENTE]
+    assert diario_ventas.estado()["pendiente_desde"] is not None
+
+    # Registered upstream but the journal was not updated (crash in between): the replay is a no-op
+    base.caida = False
+    pendiente = diario_ventas.leer_ventas(PENDIENTE)[-1]
+    venta, items = _venta("A")
+    base(venta, items, pendiente["clave"])
+    assert sinc.sincronizar() == 2
+    assert len(base.ventas) == 2
+    assert base.stock[1] == 8
+
+def test_error_de_configuracion_no_es_conflicto():
+    """Un ValueError que no es de la venta (p. ej. falta DB_URL_POSTGRES) deja todo pendiente."""
+    def sin_configurar(venta, items, clave):
+        raise ValueError("DB_URL_POSTGRES is not set in secrets or environment.")
+    diario_ventas.registrar_venta(*_venta("A"))
+    with pytest.raises(ValueError, match="DB_URL_POSTGRES"):
+        SincronizadorVentas(destino=sin_configurar, iniciar=False).sincronizar()
+    assert [v["estado"] for v in diario_ventas.leer_ventas()] == [PENDIENTE]
+
+def test_fila_ilegible_pasa_a_conflicto():
+    """Una fila del diario que no se puede leer no frena a las que vienen detrás."""
+    base = BaseFalsa({1: 10})
+    diario_ventas.registrar_venta(*_venta("A"))
+    diario_ventas.registrar_venta(*_venta("B"))
+    conn = diario_ventas.get_connection()
+    try:
+        conn.execute("UPDATE diario_ventas SET venta = '{\"cliente\": ' WHERE numero = 1")
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert SincronizadorVentas(destino=base, iniciar=False).sincronizar() == 2
+    por_numero = {v["numero"]: v for v in diario_ventas.leer_ventas()}
+    assert (por_numero[1]["estado"], por_numero[2]["estado"]) == (CONFLICTO, SINCRONIZADA)
+    assert "ilegible" in por_numero[1]["error"]
+    assert [c for _, c in base.ventas.values()] == ["B"]
+
+def test_hilo_sincroniza_al_registrar(monkeypatch):
+    """Registrar una venta despierta al hilo sin esperar el intervalo."""
+    sinc = SincronizadorVentas(destino=BaseFalsa({1: 10}), intervalo=60)
+    monkeypatch.setattr(diario_ventas, "_sincronizador", sinc)
+    try:
+        diario_ventas.registrar_venta(*_venta("A"))
+        for _ in range(100):
+            if diario_ventas.estado()["pendientes"] == 0:
+                break
+            time.sleep(0.02)
+        assert diario_ventas.leer_ventas()[0]["estado"] == SINCRONIZADA
+        assert sinc.metricas()["sincronizadas"] == 1
+    finally:
+        sinc.detener()
+
+def test_idempotencia_en_postgres(monkeypatch):
+    url = os.getenv("TEST_DB_URL_POSTGRES")
+    if not url:
+        pytest.skip("TEST_DB_URL_POSTGRES no configurada")
+    from src.services import postgres_service
+    monkeypatch.setattr(postgres_service, "st", None)
+    monkeypatch.setenv("DB_URL_POSTGRES", url)
+    postgres_service.init_db()
+    conn = postgres_service.get_connection()
+    try:
+        conn.cursor().execute("TRUNCATE ventas_items, ventas, stock RESTART IDENTITY CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+    postgres_service.crear_producto(StockItem(id=0, codigo="01", nombre="Remera", categoria="Cat", cantidad=5,
+                                              precio_unitario=100.0, marca="VETA"))
+
+    diario_ventas.registrar_venta(*_venta("A", cantidad=2))
+    diario_ventas.registrar_venta(*_venta("B", cantidad=4))
+    clave = diario_ventas.leer_ventas()[-1]["clave"]
+    venta_id = postgres_service.registrar_venta(*_venta("A", cantidad=2), idempotency_key=clave)
+
+    assert SincronizadorVentas(iniciar=False).sincronizar() == 2
+    ventas = {v["numero"]: v for v in diario_ventas.leer_ventas()}
+    assert (ventas[1]["estado"], ventas[1]["venta_id"]) == (SINCRONIZADA, venta_id)
+    assert ventas[2]["estado"] == CONFLICTO
+    assert [v.cliente for v in postgres_service.leer_ventas("VETA")] == ["A"]
+    assert postgres_service.leer_stock("VETA")[0].cantidad == 3
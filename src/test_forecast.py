@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from src.services.forecast import calcular_pronostico
+
+def _dias(n, hasta="2025-06-30"):
+    return pd.date_range(end=hasta, periods=n, freq="D")
+
+def test_velocidad_y_cobertura_constantes():
+    """Venta constante de 2 u/día: velocidad 2 y cobertura = disponible / 2."""
+    dias = _dias(120)
+    matriz = np.full((1, len(dias)), 2.0)
+    res = calcular_pronostico(matriz, dias, np.array([100.0]))
+
+    assert np.isclose(res["venta_diaria"][0], 2.0)
+    assert np.isclose(res["dias_cobertura"][0], 50.0)
+    # Sin varianza no hay stock de seguridad: 2 * (30 + 60) - 100
+    assert res["reorden_sugerido"][0] == 80
+
+def test_producto_sin_ventas():
+    """Sin historia no se sugiere reposición y la cobertura es infinita."""
+    dias = _dias(60)
+    matriz = np.zeros((2, len(dias)))
+    res = calcular_pronostico(matriz, dias, np.array([10.0, 0.0]))
+
+    assert np.all(res["venta_diaria"] == 0)
+    assert np.all(np.isinf(res["dias_cobertura"]))
+    assert np.all(res["reorden_sugerido"] == 0)
+
+def test_estacionalidad_eleva_pronostico():
+    """Un producto que vende el triple en julio/agosto debe proyectar más en junio."""
+    dias = _dias(3 * 365)
+    base = np.ones(len(dias))
+    base[np.isin(dias.month, [7, 8])] = 3.0
+    matriz = np.vstack([base * 10, np.full(len(dias), 10.0)])
+    res = calcular_pronostico(matriz, dias, np.array([0.0, 0.0]))
+
+    assert res["factor_estacional"][0] > 1.2
+    assert np.isclose(res["factor_estacional"][1], 1.0)
+    assert res["venta_diaria"][0] > res["venta_diaria"][1] * 0.9
@@ -0,0 +1,96 @@
+import os
+import pytest
+from src.config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
+from src.services import sheets
+from src.services.mantenimiento_service import _filas_desde_sheets, importar_desde_sheets
+from src.services.sheets_fake import ServidorSheetsFake, usar_fake
+
+@pytest.fixture
+def servidor():
+    """Planilla histórica chica: 3 productos, 2 ventas con un item cada una (con filas vacías en el medio)."""
+    srv = ServidorSheetsFake()
+    planilla = srv.crear_planilla("VENTAS VETA")
+    planilla.cargar(SHEET_STOCK, [['id', 'codigo', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'min_stock'],
+                                  [1, "07", "Remera", "Cat", 10, 100.0, 2],
+                                  [],
+                                  [2, "A1", "Buzo", "", 3, 250.5, ""],
+                                  [3, "12", "Gorra", "Cat", 0, 50, 1]])
+    planilla.cargar(SHEET_VENTAS, [['id', 'fecha', 'cliente', 'total_bruto', 'descuento_porcentaje', 'total_neto', 'estado'],
+                                   [1, "2024-05-02 10:30:00", "Ana", 200.0, 0, 200.0, "confirmada"],
+                                   [2, "2024-05-03T11:00:00", "", 250.5, 10, 225.45, ""]])
+    planilla.cargar(SHEET_VENTAS_ITEMS, [['id', 'venta_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal'],
+                                         [1, 1, 1, 2, 100.0, 200.0],
+                                         [2, 2, 2, 1, 250.5, 250.5]])
+    with usar_fake(srv):
+        yield srv
+
+def test_bloques_con_numero_de_fila(servidor):
+    bloques = list(sheets.leer_registros_por_bloques(SHEET_STOCK, tamano_bloque=2))
+    assert [[n for n, _ in b] for b in bloques] == [[2], [4, 5]]
+    assert bloques[1][0][1] == {'id': 2, 'codigo': 'A1', 'nombre': 'Buzo', 'categoria': '', 'cantidad': 3,
+                                'precio_unitario': 250.5, 'min_stock': ''}
+
+def test_filas_desde_sheets(servidor):
+    registros = {tabla: [r for b in sheets.leer_registros_por_bloques(hoja) for r in b]
+                 for tabla, hoja in (("stock", SHEET_STOCK), ("ventas", SHEET_VENTAS), ("ventas_items", SHEET_VENTAS_ITEMS))}
+    assert list(_filas_desde_sheets("stock", registros["stock"], "VETA")) == [
+        (1, "07", "Remera", "Cat", 10, 100.0, 2, "VETA"),
+        (2, "A1", "Buzo", "", 3, 250.5, 5, "VETA"),
+        (3, "12", "Gorra", "Cat", 0, 50.0, 1, "VETA"),
+    ]
+    assert list(_filas_desde_sheets("ventas", registros["ventas"], "VETA")) == [
+        (1, "2024-05-02T10:30:00", "Ana", 200.0, 0.0, 200.0, "confirmada", "VETA"),
+        (2, "2024-05-03T11:00:00", "", 250.5, 10.0, 225.45, "confirmada", "VETA"),
+    ]
+    assert list(_filas_desde_sheets("ventas_items", registros["ventas_items"], "VETA")) == [
+        (1, 1, 1, 2, 100.0, 200.0, "VETA"),
+        (2, 2, 2, 1, 250.5, 250.5, "VETA"),
+    ]
+
+@pytest.mark.parametrize("tabla, registro, error", [
+    ("ventas", {'id': 9, 'fecha': "02/05/2024", 'total_neto': 1}, "fila 7: 'fecha' inválido"),
+    ("ventas", {'id': 9, 'fecha': ""}, "fila 7: 'fecha' vacío"),
+    ("stock", {'id': 9, 'codigo': "01", 'nombre': " "}, "fila 7: 'nombre' vacío"),
+    ("stock", {'id': 9, 'nombre': "Remera", 'cantidad': 2.5}, "fila 7: 'cantidad' inválido"),
+    ("ventas_items", {'id': 9, 'venta_id': 1, 'producto_id': "", 'cantidad': 1}, "fila 7: 'producto_id' vacío"),
+])
+def test_filas_desde_sheets_estricto(tabla, registro, error):
+    with pytest.raises(ValueError, match=error):
+        list(_filas_desde_sheets(tabla, [(7, registro)], "VETA"))
+
+def test_importar_desde_sheets(servidor, monkeypatch):
+    url = os.getenv("TEST_DB_URL_POSTGRES")
+    if not url:
+        pytest.skip("TEST_DB_URL_POSTGRES no configurada")
+    from src.services import postgres_service
+    monkeypatch.setattr(postgres_service, "st", None)
+    monkeypatch.setenv("DB_URL_POSTGRES", url)
+    postgres_service.init_db()
+    conn = postgres_service.get_connection()
+    try:
+        conn.cursor().execute("TRUNCATE ventas_items, ventas, stock RESTART IDENTITY CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert importar_desde_sheets("VETA", tamano_bloque=2) == {"stock": 3, "ventas": 2, "ventas_items": 2}
+    assert sorted(p.codigo for p in postgres_service.leer_stock("VETA")) == ["07", "12", "A1"]
+
+    # A bad row aborts the whole import, pointing at the sheet row
+    servidor.planillas["VENTAS VETA"].worksheet(SHEET_VENTAS).update_cell(3, 2, "ayer")
+    conn = postgres_service.get_connection()
+    try:
+        conn.cursor().execute("TRUNCATE ventas_items, ventas, stock RESTART IDENTITY CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+    with pytest.raises(ValueError, match="Hoja ventas, fila 3: 'fecha' inválido"):
+        importar_desde_sheets("VETA")
+    assert postgres_service.leer_stock("VETA") == []
+
+def test_migrar_sin_base_sale_con_error(monkeypatch, tmp_path):
+    import admin
+    from src.services import postgres_service
+    monkeypatch.setattr(postgres_service, "st", None)
+    monkeypatch.setenv("DB_URL_POSTGRES", f"postgresql://postgres:@/nada?host={tmp_path}")
+    assert admin.main(["migrar"]) == 1
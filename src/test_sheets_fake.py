@@ -0,0 +1,310 @@
+import time
+from datetime import datetime
+import gspread
+import pytest
+from src.config import SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS
+from src.models import StockItem, Venta, VentaItem
+from src.services import sheets
+from src.services.sheets_fake import ServidorSheetsFake, usar_fake
+
+@pytest.fixture
+def servidor():
+    """Planilla en memoria con 20 productos de 10 unidades y hojas de ventas vacías."""
+    srv = ServidorSheetsFake()
+    planilla = srv.crear_planilla("VENTAS VETA")
+    planilla.cargar(SHEET_STOCK, [['id', 'codigo', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'min_stock']]
+                    + [[i, f"{i:02d}", f"Producto {i}", "Cat", 10, 100.0, 2] for i in range(1, 21)])
+    planilla.cargar(SHEET_VENTAS, [['id', 'fecha', 'cliente', 'total_bruto', 'descuento_porcentaje', 'total_neto', 'estado']])
+    planilla.cargar(SHEET_VENTAS_ITEMS, [['id', 'venta_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal']])
+    with usar_fake(srv):
+        yield srv
+
+def _venta(venta_id, lineas, primer_item=1):
+    items = [VentaItem(id=primer_item + k, venta_id=venta_id, producto_id=k + 1, cantidad=2,
+                       precio_unitario=100.0, subtotal=200.0, marca="VETA") for k in range(lineas)]
+    venta = Venta(id=venta_id, fecha=datetime(2025, 3, 1, 10, 0), cliente="Cliente", total_bruto=200.0 * lineas,
+                  descuento_porcentaje=0, total_neto=200.0 * lineas, marca="VETA")
+    return venta, items
+
+def test_registrar_venta_llamadas_constantes(servidor):
+    """Una venta hace las mismas 4 llamadas (lectura, batch de stock y dos appends) sin importar el carrito."""
+    # Abre la planilla y las tres hojas (quedan cacheadas)
+    sheets.leer_stock()
+    sheets.leer_ventas()
+    sheets.leer_ventas_items()
+    for venta_id, lineas in ((1, 1), (2, 15)):
+        servidor.reiniciar_contadores()
+        sheets.registrar_venta(*_venta(venta_id, lineas, primer_item=venta_id * 100))
+        assert servidor.llamadas == {"get_all_records": 1, "batch_update": 1, "append_rows": 2}
+
+    stock = {s.id: s for s in sheets.leer_stock()}
+    assert stock[1].cantidad == 6
+    assert stock[15].cantidad == 8
+    assert stock[16].cantidad == 10
+    assert [v.id for v in sheets.leer_ventas()] == [1, 2]
+    assert len(sheets.leer_ventas_items()) == 16
+
+def test_indice_evita_find_y_relecturas(servidor):
+    """Actualizar/borrar usan el índice id -> fila; los próximos ids salen del máximo cacheado."""
+    assert sheets._get_next_id(SHEET_STOCK) == 21
+    servidor.reiniciar_contadores()
+
+    producto = next(s for s in sheets.leer_stock() if s.id == 5)
+    producto.cantidad = 99
+    sheets.actualizar_producto(producto)
+    sheets.eliminar_producto(3)
+    sheets.crear_producto(StockItem(id=21, codigo="X1", nombre="Nuevo", categoria="Cat", cantidad=1,
+                                    precio_unitario=1.0, marca="VETA"))
+    assert sheets._get_next_id(SHEET_STOCK) == 22
+    assert "find" not in servidor.llamadas
+    assert "col_values" not in servidor.llamadas
+
+    # Tras el borrado, las filas de abajo subieron y el índice lo refleja
+    producto = next(s for s in sheets.leer_stock() if s.id == 21)
+    producto.cantidad = 7
+    sheets.actualizar_producto(producto)
+    stock = {s.id: s for s in sheets.leer_stock()}
+    assert 3 not in stock
+    assert stock[5].cantidad == 99
+    assert stock[21].cantidad == 7
+    assert stock[4].cantidad == 10
+
+def test_indice_viejo_no_pisa_otra_fila(servidor):
+    """Si otro proceso movió las filas, la escritura se verifica contra la columna de ids y va a la fila correcta."""
+    stock = {s.id: s for s in sheets.leer_stock()}
+    # Another client deletes product 1: every row moves up and the cached index is now stale
+    servidor.planillas["VENTAS VETA"].worksheet(SHEET_STOCK).delete_rows(2)
+
+    sheets.actualizar_producto(stock[5].model_copy(update={"cantidad": 1}))
+    assert sheets.actualizar_productos([stock[7].model_copy(update={"cantidad": 2}), stock[1]]) == [1]
+    stock = {s.id: s for s in sheets.leer_stock()}
+    assert sorted(stock) == list(range(2, 21))
+    assert (stock[5].cantidad, stock[6].cantidad, stock[7].cantidad, stock[8].cantidad) == (1, 10, 2, 10)
+
+def test_cuota_por_minuto(servidor):
+    """Al exceder la cuota de escritura, el fake responde 429 como la API real."""
+    servidor.cuota_escritura = 2
+    servidor.reiniciar_contadores()
+    producto = sheets.leer_stock()[0]
+    sheets.actualizar_producto(producto)
+    sheets.actualizar_producto(producto)
+    with pytest.raises(gspread.exceptions.APIError) as exc:
+        sheets.actualizar_producto(producto)
+    assert exc.value.code == 429
+    assert servidor.rechazadas == 1
+
+def test_lectura_incremental_de_ventas(servidor, monkeypatch):
+    """leer_ventas pide solo desde la última fila conocida (más una muestra) y relee todo si la hoja cambió por detrás."""
+    hoja = servidor.planillas["VENTAS VETA"].worksheet(SHEET_VENTAS)
+    for venta_id in (1, 2, 3):
+        sheets.registrar_venta(*_venta(venta_id, 1, primer_item=venta_id * 10))
+    assert [v.id for v in sheets.leer_ventas()] == [1, 2, 3]
+
+    parseadas = []
+    parser = sheets._venta_desde_registro
+    monkeypatch.setattr(sheets, "_venta_desde_registro", lambda r: parseadas.append(r["id"]) or parser(r))
+
+    # Nothing new: one ranged read (new rows + sampled known rows), nothing parsed
+    servidor.reiniciar_contadores()
+    assert [v.id for v in sheets.leer_ventas()] == [1, 2, 3]
+    assert servidor.llamadas == {"values_batch_get": 1}
+    assert parseadas == []
+
+    # Appended rows: only those are parsed
+    sheets.registrar_venta(*_venta(4, 1, primer_item=40))
+    assert [v.id for v in sheets.leer_ventas()] == [1, 2, 3, 4]
+    assert parseadas == [4]
+
+    # A deleted row shifts the last known row: full re-read, unchanged rows are reused
+    hoja.delete_rows(3)
+    servidor.reiniciar_contadores()
+    assert [v.id for v in sheets.leer_ventas()] == [1, 3, 4]
+    assert servidor.llamadas == {"values_batch_get": 1, "get_values": 1}
+    assert parseadas == [4]
+
+    # An edit in the middle is caught by the sampled rows on the next read
+    hoja.update_cell(2, 3, "Otro cliente")
+    assert sheets.leer_ventas()[0].cliente == "Otro cliente"
+    assert parseadas == [4, 1]
+
+def test_muestra_rotativa_del_historial(servidor, monkeypatch):
+    """Con una ventana de 1 fila, cada lectura verifica la siguiente: una edición se ve al pasar por ella."""
+    monkeypatch.setattr(sheets, "HISTORIAL_MUESTRA", 1)
+    hoja = servidor.planillas["VENTAS VETA"].worksheet(SHEET_VENTAS)
+    for venta_id in (1, 2, 3, 4):
+        sheets.registrar_venta(*_venta(venta_id, 1, primer_item=venta_id * 10))
+    assert [v.id for v in sheets.leer_ventas()] == [1, 2, 3, 4]
+
+    # Sheet row 3 (sale 2): the first read samples row 2, the second one row 3
+    hoja.update_cell(3, 3, "Otro cliente")
+    vistos = [sheets.leer_ventas()[1].cliente for _ in range(3)]
+    assert vistos == ["Cliente", "Otro cliente", "Otro cliente"]
+
+    # The periodic full re-read still applies (SHEETS_HISTORIAL_TTL)
+    hoja.update_cell(2, 3, "Tercero")
+    monkeypatch.setattr(sheets, "HISTORIAL_TTL", -1)
+    assert sheets.leer_ventas()[0].cliente == "Tercero"
+
+def test_leer_todo_una_llamada(servidor):
+    """Las tres hojas llegan en un solo values_batch_get, con el mismo resultado que las lecturas por hoja."""
+    sheets.registrar_venta(*_venta(1, 3))
+    sheets.invalidar_cache()
+
+    servidor.reiniciar_contadores()
+    datos = sheets.leer_todo()
+    assert servidor.llamadas == {"open": 1, "values_batch_get": 1}
+    assert datos["stock"] == sheets.leer_stock()
+    assert datos["ventas"] == sheets.leer_ventas()
+    assert datos["ventas_items"] == sheets.leer_ventas_items()
+    assert sheets._get_next_id(SHEET_STOCK) == 21
+
+    # Later loads ask only for new sales rows; a sheet changed underneath is re-read alone
+    sheets.registrar_venta(*_venta(2, 2, primer_item=10))
+    servidor.planillas["VENTAS VETA"].worksheet(SHEET_VENTAS_ITEMS).delete_rows(2)
+    servidor.reiniciar_contadores()
+    datos = sheets.leer_todo()
+    assert servidor.llamadas == {"values_batch_get": 1, "get_values": 1}
+    assert [v.id for v in datos["ventas"]] == [1, 2]
+    assert [i.id for i in datos["ventas_items"]] == [2, 3, 10, 11]
+
+    # An edited item in the middle comes back with the sampled rows of the same call
+    servidor.planillas["VENTAS VETA"].worksheet(SHEET_VENTAS_ITEMS).update_cell(3, 4, 7)
+    servidor.reiniciar_contadores()
+    datos = sheets.leer_todo()
+    assert servidor.llamadas == {"values_batch_get": 1, "get_values": 1}
+    assert [i.cantidad for i in datos["ventas_items"] if i.id == 3] == [7]
+
+def test_leer_todo_crea_hojas_faltantes():
+    srv = ServidorSheetsFake()
+    srv.crear_planilla("VENTAS VETA")
+    with usar_fake(srv):
+        assert sheets.leer_todo() == {"stock": [], "ventas": [], "ventas_items": []}
+        assert {h.title for h in srv.planillas["VENTAS VETA"].worksheets()} == {SHEET_STOCK, SHEET_VENTAS, SHEET_VENTAS_ITEMS}
+
+def _hoja(servidor, nombre):
+    return servidor.planillas["VENTAS VETA"].worksheet(nombre).get_all_records()
+
+def test_cola_combina_y_numera(servidor):
+    """Ventas seguidas: ids propios sin repetir, una sola escritura por producto y un append por hoja."""
+    from src.services.sheets_cola import ColaEscrituraSheets
+    cola = ColaEscrituraSheets(intervalo=3600)
+    try:
+        # 5 sales of 2 units of products 1 and 2 use up their 10 units
+        ids = [cola.registrar_venta(*_venta(0, 2, primer_item=0)) for _ in range(5)]
+        assert ids == [1, 2, 3, 4, 5]
+        assert cola.siguiente_id(SHEET_VENTAS) == 6
+        assert [v.id for v in cola.pendientes()["ventas"]] == [1, 2, 3, 4, 5]
+        assert cola.metricas()["coalescidas"] == 8
+        with pytest.raises(ValueError, match="Stock insuficiente"):
+            cola.registrar_venta(*_venta(0, 1, primer_item=0))
+
+        servidor.reiniciar_contadores()
+        assert cola.flush(timeout=5)
+        assert servidor.llamadas["batch_update"] == 1
+        assert servidor.llamadas["append_rows"] == 2
+    finally:
+        cola.detener()
+
+    stock = {s.id: s for s in sheets.leer_stock()}
+    assert (stock[1].cantidad, stock[2].cantidad, stock[3].cantidad) == (0, 0, 10)
+    assert [r["id"] for r in _hoja(servidor, SHEET_VENTAS)] == [1, 2, 3, 4, 5]
+    items = _hoja(servidor, SHEET_VENTAS_ITEMS)
+    assert [r["id"] for r in items] == list(range(1, 11))
+    assert [r["venta_id"] for r in items] == [1, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+
+def test_cola_reintenta_429_sin_duplicar(servidor):
+    """Un 429 a mitad del lote reencola solo lo que no llegó; al volver la cuota no se repite nada."""
+    from src.services.sheets_cola import ColaEscrituraSheets
+    cola = ColaEscrituraSheets(intervalo=3600, backoff_inicial=0.01, backoff_max=0.01)
+    try:
+        cola.registrar_venta(*_venta(0, 2, primer_item=0))
+        servidor.reiniciar_contadores()
+        # batch_update and the VENTAS append go through, the VENTAS_ITEMS append gets a 429
+        servidor.cuota_escritura = 2
+        assert not cola.flush(timeout=0.3)
+        assert cola.metricas()["reintentos"] >= 1
+        assert cola.metricas()["profundidad"] == 2
+        assert len(_hoja(servidor, SHEET_VENTAS)) == 1
+        # Still visible to readers while it waits
+        assert len(cola.pendientes()["ventas_items"]) == 2
+
+        servidor.cuota_escritura = None
+        assert cola.flush(timeout=5)
+    finally:
+        cola.detener()
+    assert servidor.llamadas["batch_update"] == 1
+    assert len(_hoja(servidor, SHEET_VENTAS)) == 1
+    assert [r["id"] for r in _hoja(servidor, SHEET_VENTAS_ITEMS)] == [1, 2]
+    assert next(s for s in sheets.leer_stock() if s.id == 1).cantidad == 8
+
+def test_cola_venta_durante_flush():
+    """Una venta mientras el lote anterior está en vuelo parte del stock ya descontado."""
+    from src.services.sheets_cola import ColaEscrituraSheets
+    srv = ServidorSheetsFake(latencia=lambda metodo: 0.3 if metodo == "batch_update" else 0.0, dormir=True)
+    planilla = srv.crear_planilla("VENTAS VETA")
+    planilla.cargar(SHEET_STOCK, [sheets.ENCABEZADOS[SHEET_STOCK], [1, "01", "Producto 1", "Cat", 10, 100.0, 2]])
+    planilla.cargar(SHEET_VENTAS, [sheets.ENCABEZADOS[SHEET_VENTAS]])
+    planilla.cargar(SHEET_VENTAS_ITEMS, [sheets.ENCABEZADOS[SHEET_VENTAS_ITEMS]])
+    with usar_fake(srv):
+        # ttl_stock=0: every sale re-reads the sheet, so only the in-flight overlay keeps it right
+        cola = ColaEscrituraSheets(intervalo=0, ttl_stock=0)
+        try:
+            cola.registrar_venta(*_venta(0, 1, primer_item=0))
+            for _ in range(100):
+                if cola.metricas()["en_vuelo"]:
+                    break
+                time.sleep(0.01)
+            cola.registrar_venta(*_venta(0, 1, primer_item=0))
+            assert cola.flush(timeout=5)
+        finally:
+            cola.detener()
+        assert sheets.leer_stock()[0].cantidad == 6
+        assert [v.id for v in sheets.leer_ventas()] == [1, 2]
+
+def test_cola_detener_vacia(servidor):
+    """detener() envía lo pendiente antes de terminar el hilo."""
+    from src.services.sheets_cola import ColaEscrituraSheets
+    cola = ColaEscrituraSheets(intervalo=3600)
+    cola.registrar_venta(*_venta(0, 3, primer_item=0))
+    cola.encolar_producto(StockItem(id=20, codigo="20", nombre="Renombrado", categoria="Cat", cantidad=1,
+                                    precio_unitario=1.0, marca="VETA"))
+    assert len(_hoja(servidor, SHEET_VENTAS)) == 0
+    cola.detener()
+    assert not cola._hilo.is_alive()
+    assert cola.metricas()["profundidad"] == 0
+    assert len(_hoja(servidor, SHEET_VENTAS)) == 1
+    assert len(_hoja(servidor, SHEET_VENTAS_ITEMS)) == 3
+    assert next(s for s in sheets.leer_stock() if s.id == 20).nombre == "Renombrado"
+
+def test_cola_error_no_reintentable_retiene_y_bloquea(servidor, monkeypatch):
+    """Un 403 no tira las ventas ya confirmadas: quedan en la cola y el envío espera a reanudar()."""
+    from src.services.sheets_cola import ColaEscrituraSheets
+    from src.services.sheets_fake import _api_error
+    agregar_filas = sheets.agregar_filas
+    def sin_permiso(hoja, filas, spreadsheet_id=None):
+        if hoja == SHEET_VENTAS_ITEMS:
+            raise _api_error(403, "PERMISSION_DENIED", "The caller does not have permission")
+        return agregar_filas(hoja, filas, spreadsheet_id)
+    monkeypatch.setattr(sheets, "agregar_filas", sin_permiso)
+
+    cola = ColaEscrituraSheets(intervalo=3600)
+    try:
+        venta_id = cola.registrar_venta(*_venta(0, 2, primer_item=0))
+        assert not cola.flush(timeout=5)
+        m = cola.metricas()
+        assert "permission" in m["bloqueada"]
+        assert (m["profundidad"], m["descartadas"], m["reintentos"]) == (2, 0, 0)
+        assert [i.venta_id for i in cola.pendientes()["ventas_items"]] == [venta_id, venta_id]
+        # Sales keep counting on the retained stock writes
+        cola.registrar_venta(*_venta(0, 2, primer_item=0))
+        assert next(s for s in sheets.leer_stock() if s.id == 1).cantidad == 8
+
+        monkeypatch.setattr(sheets, "agregar_filas", agregar_filas)
+        cola.reanudar()
+        assert cola.flush(timeout=5)
+        assert cola.metricas()["bloqueada"] is None
+    finally:
+        cola.detener()
+    assert [r["id"] for r in _hoja(servidor, SHEET_VENTAS)] == [1, 2]
+    assert [r["venta_id"] for r in _hoja(servidor, SHEET_VENTAS_ITEMS)] == [1, 1, 2, 2]
+    assert next(s for s in sheets.leer_stock() if s.id == 1).cantidad == 6
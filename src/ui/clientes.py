@@ -1,11 +1,13 @@
 import streamlit as st
-import pandas as pd
 from typing import List
-from src.services.cliente_service import leer_clientes, crear_cliente, actualizar_cliente, eliminar_cliente
+from src.services.cliente_service import buscar_clientes, crear_cliente, actualizar_cliente, eliminar_cliente
 from src.models import Cliente
 
 from src.ui.state_manager import require_brand_selection
 
+# Clients rendered per search (the list is a search result, not the whole table)
+LIMITE_LISTA = 50
+
 def render_clientes_page():
     # --- BRAND SELECTION BARRIER ---
     marca = require_brand_selection()
@@ -69,17 +71,24 @@ def render_clientes_page():
                 st.form_submit_button("Guardar Cliente", on_click=submit_new_client)
             st.divider()
 
-    # --- 3. LIST & ACTIONS ---
+    # --- 3. SEARCH, LIST & ACTIONS ---
+    texto = st.text_input("🔍 Buscar", placeholder="Razón social o CUIT...", key="cli_busqueda")
     try:
-        clientes = leer_clientes(marca)
+        clientes = buscar_clientes(marca, texto, limite=LIMITE_LISTA + 1)
     except Exception as e:
         st.error(f"Error cargando clientes: {e}")
         clientes = []
 
     if not clientes:
-        st.info(f"No hay clientes registrados en {marca}.")
+        if texto.strip():
+            st.info(f"No hay clientes que coincidan con '{texto.strip()}'.")
+        else:
+            st.info(f"No hay clientes registrados en {marca}.")
         return
 
+    hay_mas = len(clientes) > LIMITE_LISTA
+    clientes = clientes[:LIMITE_LISTA]
+
     # Header
     h_cols = st.columns([0.5, 3, 2, 1])
     h_cols[0].markdown("**ID**")
@@ -125,6 +134,9 @@ def render_clientes_page():
                 st.warning(f"¿Borrar {cli.razon_social}?")
                 st.button("Sí, borrar", key=f"conf_del_c_{cli.id}", on_click=delete_handler_c, args=(cli.id,))
 
+    if hay_mas:
+        st.caption(f"Mostrando los primeros {LIMITE_LISTA} clientes. Refine la búsqueda para ver otros.")
+
 def delete_handler_c(id):
     eliminar_cliente(id)
     st.toast("Cliente eliminado")
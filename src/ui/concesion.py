@@ -4,9 +4,10 @@ from datetime import datetime
 from src.ui.state_manager import require_brand_selection
 from src.services.concesion_service import (
     get_concesionarios, crear_concesionario, registrar_salida_concesion, 
-    leer_stock_concesion, confirmar_venta_concesion, eliminar_concesionario, actualizar_concesionario
+    leer_stock_concesion, confirmar_venta_concesion, eliminar_concesionario, actualizar_concesionario,
+    analizar_sell_through
 )
-from src.services.postgres_service import leer_stock
+from src.services.almacenamiento import obtener_backend
 
 def delete_socio_handler(sid):
     try:
@@ -23,7 +24,7 @@ def render_concesion_page():
 
     st.title(f"🤝 Gestión de Concesión ({marca})")
     
-    tab1, tab2, tab3 = st.tabs(["Gestión de Socios", "Registro de Salida (Stock)", "Reporte de Ventas (Stock en Consignación)"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Gestión de Socios", "Registro de Salida (Stock)", "Reporte de Ventas (Stock en Consignación)", "Análisis de Sell-Through"])
 
     # --- TAB 1: SOCIOS ---
     with tab1:
@@ -146,7 +147,7 @@ def render_concesion_page():
                 st.session_state.concesion_cart = []
 
             # Load Main Stock for Selection
-            stock_main = leer_stock(marca)
+            stock_main = obtener_backend().leer_stock(marca)
             stock_map = {p.nombre: p for p in stock_main if p.cantidad > 0}
             
             c1, c2, c3 = st.columns([3, 1, 1])
@@ -274,3 +275,65 @@ def render_concesion_page():
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"Error en devolución: {e}")
+
+    # --- TAB 4: ANÁLISIS DE SELL-THROUGH ---
+    with tab4:
+        st.header("Sell-Through por Socio")
+
+        if not socios:
+            st.info("Sin socios.")
+        else:
+            c1, c2 = st.columns(2)
+            dias = c1.selectbox("Ventana de análisis (días)", [30, 60, 90, 180, 365], index=2, key="st_dias")
+            cobertura = c2.number_input("Cobertura del próximo envío (días)", min_value=7, value=30, step=7, key="st_cobertura")
+
+            try:
+                df_st = analizar_sell_through(marca, dias=dias, cobertura_dias=cobertura)
+            except Exception as e:
+                st.error(f"Error calculando sell-through: {e}")
+                df_st = pd.DataFrame()
+
+            if df_st.empty:
+                st.info("No hay mercadería enviada a socios de esta marca.")
+            else:
+                # Resumen por socio
+                por_socio = df_st.groupby('nombre_socio').agg(
+                    vendido=('vendido', 'sum'),
+                    disponible=('disponible', 'sum'),
+                    edad_max=('edad_dias', 'max'),
+                    envio_sugerido=('envio_sugerido', 'sum'),
+                )
+                por_socio['sell_through'] = por_socio['vendido'] / (por_socio['vendido'] + por_socio['disponible']).where(lambda x: x > 0)
+                st.dataframe(
+                    por_socio.reset_index(),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "nombre_socio": "Socio",
+                        "vendido": st.column_config.NumberColumn("Vendido", format="%d"),
+                        "disponible": st.column_config.NumberColumn("En Consignación", format="%d"),
+                        "edad_max": st.column_config.NumberColumn("Stock más antiguo (días)", format="%d"),
+                        "envio_sugerido": st.column_config.NumberColumn("Envío Sugerido", format="%d"),
+                        "sell_through": st.column_config.ProgressColumn("Sell-Through", min_value=0.0, max_value=1.0, format="percent"),
+                    }
+                )
+
+                sel_socio_st = st.selectbox("Detalle de:", ["Todos"] + list(por_socio.index), key="st_socio")
+                detalle = df_st if sel_socio_st == "Todos" else df_st[df_st['nombre_socio'] == sel_socio_st]
+                st.dataframe(
+                    detalle[['nombre_socio', 'producto_codigo', 'producto_nombre', 'vendido', 'disponible',
+                             'sell_through', 'venta_diaria', 'edad_dias', 'envio_sugerido']],
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "nombre_socio": "Socio",
+                        "producto_codigo": "Código",
+                        "producto_nombre": "Producto",
+                        "vendido": st.column_config.NumberColumn("Vendido", format="%d"),
+                        "disponible": st.column_config.NumberColumn("Disp.", format="%d"),
+                        "sell_through": st.column_config.ProgressColumn("Sell-Through", min_value=0.0, max_value=1.0, format="percent"),
+                        "venta_diaria": st.column_config.NumberColumn("Venta/día", format="%.2f"),
+                        "edad_dias": st.column_config.NumberColumn("Edad (días)", format="%d"),
+                        "envio_sugerido": st.column_config.NumberColumn("Envío Sugerido", format="%d"),
+                    }
+                )
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-from src.services.postgres_service import leer_ventas, leer_ventas_items, leer_stock
+from datetime import date, datetime
+from src.services.almacenamiento import backend_configurado, obtener_backend
 from src.services.reports import get_kpis, get_top_products, get_revenue_trend, get_top_clients
 from src.config import TIMEZONE
 
@@ -37,10 +37,11 @@ def render_dashboard_page():
 
     # --- LOAD DATA ---
     try:
-        ventas = leer_ventas(marca_arg)
+        ventas = obtener_backend().leer_ventas(marca_arg)
         # items = leer_ventas_items(marca_arg) # Optional if needed for deeper analytics
-        items_all = leer_ventas_items(marca_arg)
-        stock = leer_stock(marca_arg)
+        items_all = obtener_backend().leer_ventas_items(marca_arg)
+        # Only products at/under minimum come back (partial index), not the whole catalog
+        critico = obtener_backend().leer_stock_critico(marca_arg)
     except Exception as e:
         st.error(f"Error cargando datos: {e}")
         return
@@ -51,7 +52,7 @@ def render_dashboard_page():
     reference_date = datetime(sel_year, sel_month, 1)
     
     # KPIS
-    kpis = get_kpis(stock, ventas, reference_date)
+    kpis = get_kpis(None, ventas, reference_date, stock_critico=critico['criticos'])
     
     st.divider()
     
@@ -61,6 +62,30 @@ def render_dashboard_page():
     k2.metric(f"Ventas {sel_year}", f"${kpis['ytd_neto']:,.0f}")
     k3.metric("Transacciones (Mes)", kpis['total_transacciones'])
     k4.metric("Stock Crítico", kpis['stock_critico'], delta_color="inverse")
+
+    # --- LOW STOCK PANEL ---
+    if critico['items']:
+        with st.expander(f"⚠️ Stock Bajo ({critico['criticos']} productos, {critico['agotados']} agotados)"):
+            cat_df = pd.DataFrame(critico['por_categoria'])
+            cat_df['categoria'] = cat_df['categoria'].replace('', 'Sin categoría')
+            st.dataframe(
+                cat_df.rename(columns={"categoria": "Categoría", "criticos": "Críticos", "agotados": "Agotados"}),
+                use_container_width=True,
+                hide_index=True
+            )
+            st.dataframe(
+                pd.DataFrame([{
+                    "Estado": "🔴" if i.cantidad <= 0 else "🟠",
+                    "Marca": i.marca,
+                    "Código": i.codigo,
+                    "Producto": i.nombre,
+                    "Categoría": i.categoria,
+                    "Stock": i.cantidad,
+                    "Mínimo": i.min_stock
+                } for i in critico['items']]),
+                use_container_width=True,
+                hide_index=True
+            )
     
     st.divider()
 
@@ -83,8 +108,9 @@ def render_dashboard_page():
     with c2:
         st.subheader("🏆 Top Productos")
         if filtered_items:
-            # We need stock for names. Logic in get_top_products handles mapping.
-            top_prod = get_top_products(filtered_items, stock)
+            # Names only for products sold this month. Logic in get_top_products handles mapping.
+            stock_mes = obtener_backend().leer_productos_por_ids({i.producto_id for i in filtered_items})
+            top_prod = get_top_products(filtered_items, stock_mes)
             st.bar_chart(top_prod.set_index('nombre_producto'), color="#ff4b4b")
         else:
             st.caption("Sin datos para este mes.")
@@ -96,3 +122,65 @@ def render_dashboard_page():
         st.dataframe(top_clients.style.format({"total_neto": "${:,.0f}"}), use_container_width=True)
     else:
         st.info("No hay actividad de clientes este mes.")
+
+    if backend_configurado() == "postgres":
+        # ABC/RFM run their SQL on Postgres
+        render_segmentacion_section(marca_arg, sel_year, sel_month)
+
+def render_segmentacion_section(marca_arg, sel_year: int, sel_month: int):
+    """ABC de productos y RFM de clientes, acumulado del año hasta el mes seleccionado."""
+    from src.services.analytics_service import clasificar_productos_abc, segmentar_clientes_rfm
+
+    desde = date(sel_year, 1, 1)
+    hasta = date(sel_year + 1, 1, 1) if sel_month == 12 else date(sel_year, sel_month + 1, 1)
+
+    st.divider()
+    st.subheader("🔎 Segmentación (Acumulado del Año)")
+    tab_abc, tab_rfm = st.tabs(["Productos ABC", "Clientes RFM"])
+
+    with tab_abc:
+        try:
+            abc = clasificar_productos_abc(marca_arg, desde, hasta)
+        except Exception as e:
+            st.error(f"Error calculando ABC: {e}")
+            abc = pd.DataFrame()
+        if abc.empty:
+            st.caption("Sin productos.")
+        else:
+            resumen = abc.groupby('clase').agg(productos=('producto_id', 'count'), ingresos=('ingresos', 'sum'))
+            cols = st.columns(3)
+            for col, clase in zip(cols, ["A", "B", "C"]):
+                fila = resumen.loc[clase] if clase in resumen.index else None
+                col.metric(f"Clase {clase}", int(fila['productos']) if fila is not None else 0,
+                           f"${fila['ingresos']:,.0f}" if fila is not None else None, delta_color="off")
+            st.dataframe(
+                abc[['clase', 'codigo', 'nombre', 'marca', 'unidades', 'ingresos', 'participacion', 'acumulado']],
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "ingresos": st.column_config.NumberColumn(format="$%.0f"),
+                    "participacion": st.column_config.NumberColumn(format="percent"),
+                    "acumulado": st.column_config.ProgressColumn(min_value=0.0, max_value=1.0, format="%.2f"),
+                }
+            )
+
+    with tab_rfm:
+        try:
+            rfm = segmentar_clientes_rfm(marca_arg, desde, hasta)
+        except Exception as e:
+            st.error(f"Error calculando RFM: {e}")
+            rfm = pd.DataFrame()
+        if rfm.empty:
+            st.caption("Sin clientes con compras en el período.")
+        else:
+            segmentos = rfm.groupby('segmento').agg(clientes=('cliente', 'count'), monto=('monto', 'sum'))
+            st.dataframe(segmentos.sort_values('monto', ascending=False).style.format({"monto": "${:,.0f}"}),
+                         use_container_width=True)
+            sel_seg = st.selectbox("Segmento", ["Todos"] + sorted(rfm['segmento'].unique()), key="dash_rfm_segmento")
+            vista = rfm if sel_seg == "Todos" else rfm[rfm['segmento'] == sel_seg]
+            st.dataframe(
+                vista,
+                use_container_width=True,
+                hide_index=True,
+                column_config={"monto": st.column_config.NumberColumn(format="$%.0f")}
+            )
@@ -0,0 +1,55 @@
+import streamlit as st
+
+# Sidebar status drawn on every page: no page modules here, and each service is imported only when used
+
+@st.cache_data(ttl=3, show_spinner=False)
+def _metricas_diario() -> dict:
+    # Short cache: the sidebar is drawn on every rerun, the journal is queried at most every few seconds
+    from src.services import diario_ventas
+    return diario_ventas.obtener_sincronizador().metricas()
+
+def render_estado_sincronizacion_sidebar():
+    """Ventas del diario local pendientes de sincronizar, conflictos y atraso."""
+    try:
+        m = _metricas_diario()
+    except Exception as e:
+        st.sidebar.caption(f"⚠️ Diario local no disponible: {e}")
+        return
+    if m['conflictos']:
+        st.sidebar.error(f"⛔ {m['conflictos']} venta(s) en conflicto (ver Ventas)")
+    if m['pendientes']:
+        texto = f"⏳ {m['pendientes']} venta(s) sin sincronizar · atraso {m['atraso_s']:.0f}s"
+        if m['reintentando']:
+            st.sidebar.warning(f"{texto}\n\nSin conexión con la base: {m['ultimo_error']}")
+        else:
+            st.sidebar.info(texto)
+    else:
+        st.sidebar.caption("✅ Ventas sincronizadas")
+
+def render_estado_cola_sidebar():
+    """Escrituras a Google Sheets que siguen en la cola write-behind y latencia de los flush."""
+    from src.services.almacenamiento import obtener_backend
+    try:
+        m = obtener_backend("sheets").cola.metricas()
+    except Exception as e:
+        st.sidebar.caption(f"⚠️ Cola de Sheets no disponible: {e}")
+        return
+    if m['bloqueada']:
+        st.sidebar.error(f"⛔ Envío a Google Sheets detenido: {m['bloqueada']}\n\n"
+                         f"{m['profundidad'] + m['en_vuelo']} escritura(s) retenida(s); no se perdió nada.")
+        if st.sidebar.button("🔁 Reintentar envío", key="cola_sheets_reanudar"):
+            obtener_backend("sheets").cola.reanudar()
+            st.rerun()
+        return
+    latencia = f" · flush {m['flush_ms_p50']:.0f} ms (máx {m['flush_ms_max']:.0f})" if m['flush_ms_p50'] is not None else ""
+    pendientes = m['profundidad'] + m['en_vuelo']
+    if pendientes:
+        texto = f"⏳ {pendientes} escritura(s) en cola · {m['antiguedad_s']:.0f}s{latencia}"
+        if m['reintentando']:
+            st.sidebar.warning(f"{texto}\n\nReintentando: {m['ultimo_error']}")
+        else:
+            st.sidebar.info(texto)
+    else:
+        st.sidebar.caption(f"✅ Google Sheets al día{latencia}")
+    if m['descartadas']:
+        st.sidebar.error(f"⛔ {m['descartadas']} escritura(s) de productos ya borrados descartada(s)")
@@ -1,13 +1,13 @@
-from src.services.concesion_service import get_concesionarios
 import streamlit as st
 import pandas as pd
 from src.services.postgres_service import (
-    leer_ventas, leer_items_por_venta, actualizar_estado_facturacion, leer_stock,
-    eliminar_venta, actualizar_cantidad_item_venta, actualizar_descuento_venta
+    actualizar_estado_facturacion, actualizar_estados_facturacion,
+    eliminar_venta, guardar_edicion_venta
+)
+from src.services.facturacion_service import (
+    resumen_facturacion_mensual, leer_ventas_facturacion, leer_detalle_iva, actualizar_estado_facturacion_filtro,
+    recalcular_totales_mes
 )
-from src.services.cliente_service import leer_clientes
-from src.config import IVA_RATE
-from src.models import Venta
 
 from datetime import datetime
 
@@ -37,48 +37,69 @@ def render_facturacion_page():
     # Arg for service
     marca_arg = None if sel_marca_label == "Ambas Marcas" else sel_marca_label
 
+    # --- LISTING FILTERS & PAGINATION ---
+    col_list = st.columns([1, 2, 1])
+    estado_opciones = ["Todos", "No Facturado", "Facturado"]
+    sel_estado = col_list[0].selectbox("Estado", estado_opciones, index=0)
+    texto_cliente = col_list[1].text_input("Cliente / CUIT", placeholder="Buscar...")
+    page_size = col_list[2].selectbox("Por página", [25, 50, 100], index=0)
+    estado_arg = None if sel_estado == "Todos" else sel_estado
+
+    # Keyset cursors: stack of 'despues_de' for each visited page (None = first page).
+    # Any filter change starts again from the first page.
+    filtros_sig = (sel_year, sel_month, marca_arg, estado_arg, texto_cliente.strip(), page_size)
+    if st.session_state.get('fact_filtros_sig') != filtros_sig:
+        st.session_state.fact_filtros_sig = filtros_sig
+        st.session_state.fact_cursores = [None]
+    cursores = st.session_state.fact_cursores
+
     try:
-        # Load Data
-        ventas_raw = leer_ventas(marca=marca_arg)
-        # Filter by Date
-        ventas = [v for v in ventas_raw if v.fecha.year == sel_year and v.fecha.month == sel_month]
-        
-        # Load Clientes
-        clientes = leer_clientes(marca=None)
-        
-        # Load Concesionarios (Handle Both Brands if needed)
-        concesionarios = []
-        if marca_arg:
-            concesionarios = get_concesionarios(marca_arg)
-        else:
-            concesionarios = get_concesionarios("VETA") + get_concesionarios("VENETO")
-
-        stock_items = leer_stock(marca=None)
-        
-        # Maps
-        client_cuit_map = {c.razon_social: c.cuit_cuil for c in clientes}
-        client_cuit_map_norm = {c.razon_social.strip().lower(): c.cuit_cuil for c in clientes}
-        
-        # Concesionario Map
-        conc_cuit_map = {c.nombre_socio: c.cuit_cuil for c in concesionarios}
-        conc_cuit_map_norm = {c.nombre_socio.strip().lower(): c.cuit_cuil for c in concesionarios}
-        
-        product_map = {p.id: p for p in stock_items}
-        
+        # Load Data (month filter, IVA, CUIT and totals are computed in SQL; only this page is fetched)
+        ventas, siguiente = leer_ventas_facturacion(
+            sel_year, sel_month, marca=marca_arg, estado=estado_arg, texto=texto_cliente,
+            limite=page_size, despues_de=cursores[-1]
+        )
+        resumen = resumen_facturacion_mensual(sel_year, sel_month, marca=marca_arg)
+        detalle_iva = leer_detalle_iva([v['id'] for v in ventas])
     except Exception as e:
         st.error(f"Error cargando datos: {e}")
         return
 
-    if not ventas:
+    if not ventas and len(cursores) == 1:
         st.info("No hay ventas registradas.")
         return
     
     # Kpi Summary
-    total_pendientes = len([v for v in ventas if v.estado_facturacion == "No Facturado"])
-    st.metric("Ventas Pendientes de Facturar (Global)", total_pendientes)
+    total = resumen['total']
+    total_pendientes = sum(r['ventas'] for r in resumen['por_estado'] if r['estado_facturacion'] == "No Facturado")
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Ventas Pendientes de Facturar (Global)", total_pendientes)
+    k2.metric("Neto (S/IVA)", f"${total['neto_sin_iva']:,.2f}")
+    k3.metric("IVA", f"${total['iva']:,.2f}")
+    k4.metric("Total Final", f"${total['final']:,.2f}")
+
+    with st.expander("📑 Resumen del Mes"):
+        montos_fmt = {k: "${:,.2f}" for k in ("bruto", "descuento", "neto_sin_iva", "iva", "final")}
+        labels = {"ventas": "Ventas", "bruto": "Bruto", "descuento": "Descuento",
+                  "neto_sin_iva": "Neto (S/IVA)", "iva": "IVA", "final": "Final"}
+        for titulo, key, col in (("Por Marca", "por_marca", "marca"),
+                                 ("Por Estado", "por_estado", "estado_facturacion"),
+                                 ("Por Tipo de Venta", "por_tipo", "tipo_venta")):
+            st.markdown(f"**{titulo}**")
+            df_res = pd.DataFrame(resumen[key]).set_index(col)
+            st.dataframe(df_res.style.format(montos_fmt).relabel_index(list(labels.values()), axis=1),
+                         use_container_width=True)
+
+    render_recalculo_totales(sel_year, sel_month, marca_arg)
     
     st.divider()
 
+    # --- MULTI-SELECT MODE (month close): all changes go out in one statement ---
+    if st.toggle("☑️ Selección múltiple", key="fact_multi", help="Marcar varias ventas y guardar todo junto"):
+        render_seleccion_multiple(ventas, sel_year, sel_month, marca_arg, estado_arg, texto_cliente)
+        render_paginacion(cursores, siguiente, len(ventas))
+        return
+
     # --- TABLE HEADER ---
     # Layout: Check | ID | Marca | Fecha | Cliente | CUIT | Neto | Final | Estado | Acciones
     c_layout = [0.4, 0.5, 0.8, 0.8, 1.5, 1.0, 1.0, 1.0, 1.0, 0.8]
@@ -95,6 +116,8 @@ def render_facturacion_page():
     h_cols[9].markdown("**Editar**")
     st.divider()
 
+    render_paginacion(cursores, siguiente, len(ventas))
+
     # Init Edit State
     if 'editing_factura_id' not in st.session_state:
         st.session_state.editing_factura_id = None
@@ -102,54 +125,46 @@ def render_facturacion_page():
     # Iterate Sales
     for venta in ventas:
         # EDIT MODE RENDER
-        if st.session_state.editing_factura_id == venta.id:
+        if st.session_state.editing_factura_id == venta['id']:
             with st.container():
-                st.markdown(f"#### ✏️ Editando Venta #{venta.id}")
-                st.info("Modifica los valores y guarda los cambios. 'Cancelar' para salir.")
+                st.markdown(f"#### ✏️ Editando Venta #{venta['id']}")
+                st.info("Modifica cantidades y descuento y guarda todo junto. 'Cerrar' para salir sin guardar.")
                 
                 # Discount
-                c_disc, c_save_disc = st.columns([2, 1])
-                new_disc = c_disc.number_input("Descuento %", value=float(venta.descuento_porcentaje), step=1.0, key=f"ed_disc_{venta.id}")
+                c_disc, _ = st.columns([2, 1])
+                new_disc = c_disc.number_input("Descuento %", value=float(venta['descuento_porcentaje']), step=1.0, key=f"ed_disc_{venta['id']}")
                 
-                # Items
-                items = leer_items_por_venta(venta.id)
+                # Items (only edited in the widgets; nothing is written until "Guardar todo")
+                items = detalle_iva.get(venta['id'], [])
                 if items:
                     st.markdown("##### Items")
                     for it in items:
-                        prod = product_map.get(it.producto_id)
-                        p_name = prod.nombre if prod else f"ID {it.producto_id}"
-                        
                         ci1, ci2, ci3 = st.columns([3, 1, 1])
-                        ci1.write(f"**{p_name}**")
-                        ci2.number_input("Cant", value=int(it.cantidad), min_value=1, step=1, key=f"ed_qty_{it.id}")
-                        
-                        # Apply Item Update Button per row or global? 
-                        # To keep it simple based on previous backend, let's auto-save or per-row. 
-                        # User wants "modificar". Let's use a "Guardar Todo" approach? 
-                        # Backend `actualizar_cantidad` is atomic. 
-                        # Let's Stick to per-item save for safety/simplicity with existing backend, 
-                        # OR simple Save Button that calls item updates.
-                        # For now -> Per row save is safest with current `sqlite_service`.
-                        
-                        if ci3.button("💾", key=f"save_it_{it.id}"):
-                            q_val = st.session_state[f"ed_qty_{it.id}"]
-                            actualizar_cantidad_item_venta(venta.id, it.id, q_val)
-                            st.toast("Item actualizado")
-                            # Don't rerun immediately to allow other edits? Or rerun to reflect totals?
-                            # Rerun needed for totals.
-                            st.rerun()
+                        ci1.write(f"**{it['producto']}**")
+                        ci2.number_input("Cant", value=int(it['cantidad']), min_value=1, step=1, key=f"ed_qty_{it['id']}")
+                        ci3.caption(f"Unit. ${it['unit_final']:,.2f}")
 
                 st.divider()
                 
                 # Footer Actions
                 fb1, fb2, fb3 = st.columns([1,1,1])
-                if fb1.button("💾 Guardar Descuento", key=f"save_d_{venta.id}"):
-                    actualizar_descuento_venta(venta.id, new_disc)
-                    st.success("Descuento guardado.")
-                    st.session_state.editing_factura_id = None
-                    st.rerun()
+                if fb1.button("💾 Guardar todo", key=f"save_all_{venta['id']}", type="primary"):
+                    cantidades = {
+                        it['id']: st.session_state[f"ed_qty_{it['id']}"]
+                        for it in items
+                        if st.session_state[f"ed_qty_{it['id']}"] != int(it['cantidad'])
+                    }
+                    descuento = new_disc if new_disc != float(venta['descuento_porcentaje']) else None
+                    try:
+                        # Quantities, stock and discount are validated and applied in one transaction
+                        guardar_edicion_venta(venta['id'], cantidades, descuento)
+                        st.toast(f"Venta #{venta['id']} actualizada")
+                        st.session_state.editing_factura_id = None
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"No se guardó ningún cambio: {e}")
                     
-                if fb2.button("❌ Cerrar Edición", key=f"close_{venta.id}"):
+                if fb2.button("❌ Cerrar Edición", key=f"close_{venta['id']}"):
                     st.session_state.editing_factura_id = None
                     st.rerun()
 
@@ -157,36 +172,27 @@ def render_facturacion_page():
 
         else:
             # NORMAL VIEW
-            final_con_iva = venta.total_neto
-            monto_neto_sin_iva = final_con_iva / (1 + IVA_RATE)
+            final_con_iva = venta['total_neto']
+            monto_neto_sin_iva = venta['neto_sin_iva']
             
-            # Get CUIT Logic
-            c_key = venta.cliente
-            cuit_val = client_cuit_map.get(c_key)
-            if not cuit_val:
-                cuit_val = client_cuit_map_norm.get(c_key.strip().lower(), "")
-            if not cuit_val and " (Concesión)" in c_key:
-                clean_name = c_key.replace(" (Concesión)", "").strip()
-                cuit_val = conc_cuit_map.get(clean_name)
-                if not cuit_val:
-                    cuit_val = conc_cuit_map_norm.get(clean_name.lower(), "")
+            cuit_val = venta['cuit_cuil']
                 
             with st.container():
                 cols = st.columns(c_layout)
                 
                 # Checkbox
-                is_facturado = (venta.estado_facturacion == "Facturado")
-                def toggle_state(vid=venta.id, current=is_facturado):
+                is_facturado = (venta['estado_facturacion'] == "Facturado")
+                def toggle_state(vid=venta['id'], current=is_facturado):
                     new_val = "No Facturado" if current else "Facturado"
                     actualizar_estado_facturacion(vid, new_val)
 
-                new_check = cols[0].checkbox("", value=is_facturado, key=f"chk_fac_{venta.id}", on_change=toggle_state)
+                new_check = cols[0].checkbox("", value=is_facturado, key=f"chk_fac_{venta['id']}", on_change=toggle_state)
                 
-                cols[1].write(f"#{venta.id}")
-                marca_color = "blue" if venta.marca == "VETA" else "orange"
-                cols[2].markdown(f":{marca_color}[**{venta.marca}**]")
-                cols[3].write(venta.fecha.strftime("%d/%m/%Y"))
-                cols[4].write(f"**{venta.cliente}**")
+                cols[1].write(f"#{venta['id']}")
+                marca_color = "blue" if venta['marca'] == "VETA" else "orange"
+                cols[2].markdown(f":{marca_color}[**{venta['marca']}**]")
+                cols[3].write(venta['fecha'].strftime("%d/%m/%Y"))
+                cols[4].write(f"**{venta['cliente']}**")
                 cols[5].write(cuit_val if cuit_val else "-")
                 cols[6].write(f"${monto_neto_sin_iva:,.2f}")
                 cols[7].write(f"**${final_con_iva:,.2f}**")
@@ -197,42 +203,173 @@ def render_facturacion_page():
                 
                 # ACTIONS
                 ac1, ac2 = cols[9].columns([1, 1])
-                ac1.button("✏️", key=f"edt_btn_{venta.id}", help="Modificar Venta", on_click=lambda id=venta.id: setattr(st.session_state, 'editing_factura_id', id))
+                ac1.button("✏️", key=f"edt_btn_{venta['id']}", help="Modificar Venta", on_click=lambda id=venta['id']: setattr(st.session_state, 'editing_factura_id', id))
                 
-                if ac2.button("🗑️", key=f"del_btn_{venta.id}", help="Eliminar Venta"):
+                if ac2.button("🗑️", key=f"del_btn_{venta['id']}", help="Eliminar Venta"):
                     st.warning("¿Borrar?")
-                    st.button("✅", key=f"conf_del_v_{venta.id}", on_click=eliminar_venta_handler, args=(venta.id,), help="Confirmar Eliminación")
+                    st.button("✅", key=f"conf_del_v_{venta['id']}", on_click=eliminar_venta_handler, args=(venta['id'],), help="Confirmar Eliminación")
 
-                # Drill Down (Read Only)
-                with st.expander(f"Ver Detalle #{venta.id}"):
-                    items = leer_items_por_venta(venta.id)
+                # Drill Down (Read Only, precomputed by leer_detalle_iva)
+                with st.expander(f"Ver Detalle #{venta['id']}"):
+                    items = detalle_iva.get(venta['id'], [])
                     if items:
-                        detail_data = []
-                        for it in items:
-                            discount_multiplier = 1 - (venta.descuento_porcentaje / 100)
-                            real_unit_price_final = it.precio_unitario * discount_multiplier
-                            unit_neto = real_unit_price_final / (1 + IVA_RATE)
-                            subtotal_final = real_unit_price_final * it.cantidad
-                            subtotal_neto = subtotal_final / (1 + IVA_RATE)
-                            
-                            prod = product_map.get(it.producto_id)
-                            p_code = prod.codigo if prod else "-"
-                            p_name = prod.nombre if prod else f"ID {it.producto_id}"
-                            
-                            detail_data.append({
-                                "Código": p_code,
-                                "Producto": p_name,
-                                "Cant": it.cantidad,
-                                "Unit. Neto (S/IVA)": f"${unit_neto:,.2f}",
-                                "Unit. Final (C/IVA)": f"${real_unit_price_final:,.2f}",
-                                "Subt. Neto": f"${subtotal_neto:,.2f}",
-                                "Subt. Final": f"${subtotal_final:,.2f}"
-                            })
-                        st.dataframe(pd.DataFrame(detail_data), use_container_width=True)
+                        detail_df = pd.DataFrame(items)[
+                            ["codigo", "producto", "cantidad", "unit_neto", "unit_final", "subtotal_neto", "subtotal_final"]
+                        ]
+                        st.dataframe(
+                            detail_df,
+                            use_container_width=True,
+                            hide_index=True,
+                            column_config={
+                                "codigo": "Código",
+                                "producto": "Producto",
+                                "cantidad": "Cant",
+                                "unit_neto": st.column_config.NumberColumn("Unit. Neto (S/IVA)", format="$%.2f"),
+                                "unit_final": st.column_config.NumberColumn("Unit. Final (C/IVA)", format="$%.2f"),
+                                "subtotal_neto": st.column_config.NumberColumn("Subt. Neto", format="$%.2f"),
+                                "subtotal_final": st.column_config.NumberColumn("Subt. Final", format="$%.2f"),
+                            }
+                        )
                     else:
                         st.warning("Sin items.")
             st.divider()
 
+    render_paginacion(cursores, siguiente, len(ventas), key_suffix="bottom")
+
+def render_seleccion_multiple(ventas, sel_year, sel_month, marca_arg, estado_arg, texto_cliente):
+    """Editable grid of the current page; the diff is submitted once via actualizar_estados_facturacion."""
+    if 'fact_multi_msg' in st.session_state:
+        st.success(st.session_state.pop('fact_multi_msg'))
+
+    df = pd.DataFrame([{
+        "facturado": v['estado_facturacion'] == "Facturado",
+        "id": v['id'],
+        "marca": v['marca'],
+        "fecha": v['fecha'].strftime("%d/%m/%Y"),
+        "cliente": v['cliente'],
+        "cuit": v['cuit_cuil'] or "-",
+        "neto": v['neto_sin_iva'],
+        "final": v['total_neto'],
+    } for v in ventas])
+
+    with st.form("fact_multi_form"):
+        editado = st.data_editor(
+            df,
+            key="fact_multi_editor",
+            use_container_width=True,
+            hide_index=True,
+            disabled=[c for c in df.columns if c != "facturado"],
+            column_config={
+                "facturado": st.column_config.CheckboxColumn("Facturado"),
+                "id": "ID", "marca": "Marca", "fecha": "Fecha", "cliente": "Cliente", "cuit": "CUIT/CUIL",
+                "neto": st.column_config.NumberColumn("Valor Neto", format="$%.2f"),
+                "final": st.column_config.NumberColumn("Valor Final", format="$%.2f"),
+            }
+        )
+        if st.form_submit_button("💾 Guardar cambios", type="primary"):
+            cambiados = editado[editado['facturado'] != df['facturado']]
+            cambios = {int(r.id): ("Facturado" if r.facturado else "No Facturado") for r in cambiados.itertuples()}
+            if not cambios:
+                st.info("No hay cambios para guardar.")
+            else:
+                try:
+                    n = actualizar_estados_facturacion(cambios)
+                    st.session_state.fact_multi_msg = f"{n} ventas actualizadas."
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error guardando cambios: {e}")
+
+    # Whole-filter action: every sale of the month matching the filters, not only this page
+    with st.expander("⚡ Marcar todas las ventas del filtro"):
+        st.caption("Aplica a todas las ventas del mes que cumplan Marca/Estado/Cliente, más el CUIT indicado.")
+        fc1, fc2, fc3 = st.columns([2, 1, 1])
+        cuit_filtro = fc1.text_input("CUIT (opcional)", key="fact_multi_cuit")
+        nuevo_estado = fc2.selectbox("Nuevo estado", ["Facturado", "No Facturado"], key="fact_multi_estado")
+        filtro = dict(marca=marca_arg, cuit=cuit_filtro or None, estado_actual=estado_arg, texto=texto_cliente or None)
+        firma = (nuevo_estado, sel_year, sel_month, tuple(sorted(filtro.items())))
+
+        # Two steps: "Aplicar" only counts; the UPDATE runs on "Confirmar" with the same filter
+        if fc3.button("Aplicar", key="fact_multi_aplicar", type="primary", use_container_width=True):
+            try:
+                n = actualizar_estado_facturacion_filtro(nuevo_estado, sel_year, sel_month, dry_run=True, **filtro)
+                st.session_state.fact_multi_confirmar = {'firma': firma, 'n': n}
+            except Exception as e:
+                st.error(f"Error contando ventas: {e}")
+
+        pendiente = st.session_state.get('fact_multi_confirmar')
+        if pendiente and pendiente['firma'] != firma:
+            # Any filter changed after counting: the count no longer applies
+            st.session_state.pop('fact_multi_confirmar')
+            pendiente = None
+        if pendiente:
+            if pendiente['n'] == 0:
+                st.info(f"No hay ventas para marcar como {nuevo_estado} con este filtro.")
+            else:
+                st.warning(f"Se marcarán **{pendiente['n']}** ventas de {sel_month:02d}/{sel_year} como **{nuevo_estado}**.")
+                cc1, cc2, _ = st.columns([1, 1, 2])
+                if cc1.button("Confirmar", key="fact_multi_confirmar_si", type="primary", use_container_width=True):
+                    st.session_state.pop('fact_multi_confirmar')
+                    try:
+                        n = actualizar_estado_facturacion_filtro(nuevo_estado, sel_year, sel_month, **filtro)
+                        st.session_state.fact_multi_msg = f"{n} ventas marcadas como {nuevo_estado}."
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error aplicando cambio masivo: {e}")
+                if cc2.button("Cancelar", key="fact_multi_confirmar_no", use_container_width=True):
+                    st.session_state.pop('fact_multi_confirmar')
+                    st.rerun()
+
+def render_recalculo_totales(sel_year, sel_month, marca_arg):
+    """Check/repair of the month's totals against their items (one statement either way)."""
+    with st.expander("🛠️ Recalcular Totales del Mes"):
+        st.caption("Compara Total Bruto/Neto de cada venta con la suma de sus items. 'Revisar' no modifica nada.")
+        rc1, rc2, _ = st.columns([1, 1, 2])
+        revisar = rc1.button("🔍 Revisar", key="fact_recalc_dry", use_container_width=True)
+        aplicar = rc2.button("🛠️ Corregir", key="fact_recalc_apply", use_container_width=True)
+
+        if revisar or aplicar:
+            try:
+                res = recalcular_totales_mes(sel_year, sel_month, marca=marca_arg, dry_run=revisar)
+            except Exception as e:
+                st.error(f"Error recalculando totales: {e}")
+                return
+            if aplicar:
+                from src.services.analytics_service import limpiar_cache_analytics
+                limpiar_cache_analytics()
+                st.success(f"{res['cambiadas']} ventas corregidas.")
+            elif not res['diferencias']:
+                st.success("Todos los totales coinciden con sus items.")
+            else:
+                st.warning(f"{len(res['diferencias'])} ventas con diferencias.")
+
+            if res['diferencias']:
+                st.dataframe(
+                    res['diferencias'],
+                    use_container_width=True,
+                    hide_index=True,
+                    column_order=["id", "fecha", "cliente", "marca", "bruto_anterior", "bruto_calc", "neto_anterior", "neto_calc"],
+                    column_config={
+                        "id": "ID", "fecha": "Fecha", "cliente": "Cliente", "marca": "Marca",
+                        "bruto_anterior": st.column_config.NumberColumn("Bruto guardado", format="$%.2f"),
+                        "bruto_calc": st.column_config.NumberColumn("Bruto según items", format="$%.2f"),
+                        "neto_anterior": st.column_config.NumberColumn("Neto guardado", format="$%.2f"),
+                        "neto_calc": st.column_config.NumberColumn("Neto según items", format="$%.2f"),
+                    }
+                )
+
 def eliminar_venta_handler(vid):
     eliminar_venta(vid)
     st.toast("Venta eliminada correctament.")
+
+def render_paginacion(cursores, siguiente, n_filas, key_suffix="top"):
+    """Prev/Next over the keyset cursor stack kept in session_state."""
+    def ir_siguiente():
+        st.session_state.fact_cursores.append(siguiente)
+
+    def ir_anterior():
+        st.session_state.fact_cursores.pop()
+
+    p1, p2, p3 = st.columns([1, 2, 1])
+    p1.button("⬅️ Anterior", key=f"fact_prev_{key_suffix}", disabled=len(cursores) <= 1, on_click=ir_anterior)
+    p2.caption(f"Página {len(cursores)} · {n_filas} ventas")
+    p3.button("Siguiente ➡️", key=f"fact_next_{key_suffix}", disabled=siguiente is None, on_click=ir_siguiente)
@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
 from typing import List, Optional
-from src.services.postgres_service import leer_stock, crear_producto, actualizar_producto, eliminar_producto
+from src.services.postgres_service import (
+    leer_stock_pagina, crear_producto, actualizar_productos_bulk, eliminar_producto, ConflictoEdicionError
+)
 from src.models import StockItem
 
 from src.ui.state_manager import require_brand_selection
@@ -15,9 +17,6 @@ def render_products_page():
     st.title(f"📦 Gestión de Productos ({marca})")
 
     # --- STATE MANAGEMENT ---
-    # To handle "Edit Mode" for a specific item
-    if 'editing_product_id' not in st.session_state:
-        st.session_state.editing_product_id = None
     if 'show_create_form' not in st.session_state:
         st.session_state.show_create_form = False
 
@@ -58,6 +57,7 @@ def render_products_page():
                                 marca=marca
                             )
                             crear_producto(item)
+                            st.session_state.pop('products_pagina', None)
                             st.success(f"Producto creado en {marca}!")
                             st.session_state.show_create_form = False
                             st.rerun()
@@ -65,102 +65,171 @@ def render_products_page():
                         st.error(f"Error: {e}")
             st.divider()
 
-    # --- 3. PRODUCTS LIST & ACTIONS ---
-    
-    # Load Data
-    try:
-        items = leer_stock(marca)
-    except Exception as e:
-        st.error(f"Error cargando datos: {e}")
-        items = []
-
-    if not items:
-        st.info(f"No hay productos registrados en {marca}.")
+    # --- 3. PRODUCTS GRID ---
+    if 'products_msg' in st.session_state:
+        st.success(st.session_state.pop('products_msg'))
+
+    col_f1, col_f2, col_f3 = st.columns([2, 1, 1])
+    solo_criticos = col_f1.toggle("⚠️ Solo stock crítico", key="products_solo_criticos")
+    page_size = col_f2.selectbox("Por página", [50, 100, 200], index=0, key="products_page_size")
+    if col_f3.button("🔄 Recargar", use_container_width=True):
+        st.session_state.pop('products_pagina', None)
+
+    # Keyset cursors by id (None = first page); any filter change starts from the first page
+    filtros_sig = (marca, solo_criticos, page_size)
+    if st.session_state.get('products_filtros_sig') != filtros_sig:
+        st.session_state.products_filtros_sig = filtros_sig
+        st.session_state.products_cursores = [None]
+    cursores = st.session_state.products_cursores
+
+    # The loaded page is kept as the "original" version: the save compares against it,
+    # so changes made elsewhere in the meantime are detected instead of overwritten.
+    pagina_sig = filtros_sig + (cursores[-1],)
+    pagina = st.session_state.get('products_pagina')
+    if pagina is None or pagina['sig'] != pagina_sig:
+        try:
+            items, siguiente = leer_stock_pagina(marca, limite=page_size, despues_de_id=cursores[-1], solo_criticos=solo_criticos)
+        except Exception as e:
+            st.error(f"Error cargando datos: {e}")
+            return
+        pagina = {'sig': pagina_sig, 'items': items, 'siguiente': siguiente}
+        st.session_state.products_pagina = pagina
+    items, siguiente = pagina['items'], pagina['siguiente']
+
+    if not items and len(cursores) == 1:
+        if solo_criticos:
+            st.success(f"No hay productos con stock crítico en {marca}.")
+        else:
+            st.info(f"No hay productos registrados en {marca}.")
         return
 
-    # Table Header
-    # Using columns to create a "Grid" layout
-    # Layout: ID | Cod | Nombre | Cantidad (Badge) | Precio | Acciones
-    header_cols = st.columns([0.5, 0.5, 2, 1, 1, 1])
-    header_cols[0].markdown("**ID**")
-    header_cols[1].markdown("**Cód**")
-    header_cols[2].markdown("**Producto**")
-    header_cols[3].markdown("**Stock**")
-    header_cols[4].markdown("**Precio**")
-    header_cols[5].markdown("**Acciones**")
+    render_paginacion_productos(cursores, siguiente, len(items))
+
+    df = pd.DataFrame([{
+        "estado": "🟢" if i.cantidad > i.min_stock else "🔴" if i.cantidad == 0 else "🟠",
+        "id": i.id,
+        "codigo": i.codigo,
+        "nombre": i.nombre,
+        "categoria": i.categoria or "",
+        "cantidad": i.cantidad,
+        "precio_unitario": i.precio_unitario,
+        "min_stock": i.min_stock,
+    } for i in items])
+
+    with st.form("products_grid_form"):
+        editado = st.data_editor(
+            df,
+            key=f"products_editor_{len(cursores)}",
+            use_container_width=True,
+            hide_index=True,
+            num_rows="fixed",
+            disabled=["estado", "id"],
+            column_config={
+                "estado": st.column_config.TextColumn("", width="small"),
+                "id": "ID",
+                "codigo": "Cód",
+                "nombre": st.column_config.TextColumn("Producto", required=True),
+                "categoria": "Categoría",
+                "cantidad": st.column_config.NumberColumn("Stock", min_value=0, step=1, required=True),
+                "precio_unitario": st.column_config.NumberColumn("Precio", min_value=0.0, format="$%.0f", required=True),
+                "min_stock": st.column_config.NumberColumn("Min. Stock", min_value=0, step=1, required=True),
+            }
+        )
+        if st.form_submit_button("💾 Guardar cambios", type="primary"):
+            editados = [
+                StockItem(
+                    id=int(r.id),
+                    codigo=str(r.codigo or ""),
+                    nombre=str(r.nombre or ""),
+                    categoria=str(r.categoria or ""),
+                    cantidad=int(r.cantidad),
+                    precio_unitario=float(r.precio_unitario),
+                    min_stock=int(r.min_stock),
+                    marca=marca
+                )
+                for r in editado.itertuples()
+            ]
+            try:
+                n = actualizar_productos_bulk(items, editados)
+                if n == 0:
+                    st.info("No hay cambios para guardar.")
+                else:
+                    st.session_state.products_msg = f"{n} productos actualizados."
+                    st.session_state.pop('products_pagina', None)
+                    st.rerun()
+            except ConflictoEdicionError as e:
+                st.session_state.pop('products_pagina', None)
+                st.error(f"{e} No se guardó ningún cambio.")
+            except Exception as e:
+                st.error(f"Error guardando cambios: {e}")
+
+    with st.expander("🗑️ Eliminar producto"):
+        opciones = {f"{i.codigo} - {i.nombre} (ID {i.id})": i.id for i in items}
+        sel = st.selectbox("Producto", list(opciones.keys()), key="products_del_sel")
+        if st.button("Sí, borrar", key="products_del_confirm", type="primary"):
+            delete_handler(opciones[sel])
+            st.rerun()
+
+    render_paginacion_productos(cursores, siguiente, len(items), key_suffix="bottom")
+
+    render_reposicion_section(marca)
+
+def render_reposicion_section(marca: str):
+    """Días de cobertura y reposición sugerida (cálculo bajo demanda)."""
     st.divider()
+    with st.expander("📈 Reposición Sugerida"):
+        c1, c2, c3 = st.columns([1, 1, 1])
+        lead_time = c1.number_input("Demora proveedor (días)", min_value=1, value=30, step=1, key="repo_lead_time")
+        cobertura = c2.number_input("Cobertura objetivo (días)", min_value=1, value=60, step=5, key="repo_cobertura")
 
-    for item in items:
-        # Check if we are editing THIS item
-        if st.session_state.editing_product_id == item.id:
-            # --- EDIT MODE ROW ---
-            with st.container():
-                with st.form(f"edit_form_{item.id}"):
-                    ce1, ce2, ce3, ce4, ce5 = st.columns([1, 2, 1, 1, 1])
-                    e_cod = ce1.text_input("Cod", value=item.codigo)
-                    e_nom = ce2.text_input("Nombre", value=item.nombre)
-                    e_cant = ce3.number_input("Cant", value=item.cantidad)
-                    e_price = ce4.number_input("Precio", value=item.precio_unitario)
-                    e_min = ce5.number_input("Min", value=item.min_stock)
-                    
-                    col_save, col_cancel = st.columns([1, 1])
-                    if col_save.form_submit_button("💾 Guardar"):
-                        updated = StockItem(
-                            id=item.id,
-                            codigo=e_cod,
-                            nombre=e_nom,
-                            categoria=item.categoria, 
-                            cantidad=e_cant,
-                            precio_unitario=e_price,
-                            min_stock=e_min,
-                            marca=item.marca # Preserve original marca
-                        )
-                        actualizar_producto(updated)
-                        st.session_state.editing_product_id = None
-                        st.rerun()
-                    
-                    if col_cancel.form_submit_button("❌ Cancelar"):
-                        st.session_state.editing_product_id = None
-                        st.rerun()
-            st.divider()
-        
-        else:
-            # --- VIEW MODE ROW ---
-            # Define Status Color
-            status_color = "🟢" if item.cantidad > item.min_stock else "🔴" if item.cantidad == 0 else "🟠"
-            
-            row = st.columns([0.5, 0.5, 2, 1, 1, 1])
-            row[0].write(f"{item.id}")
-            row[1].write(f"{item.codigo}")
-            # Nombre + Category hint
-            row[2].write(f"{item.nombre}") 
-            
-            # Stock with Indicator
-            row[3].write(f"{status_color} {item.cantidad}")
-            
-            # Price
-            row[4].write(f"${item.precio_unitario:,.0f}")
-            
-            # Actions
-            actions_col = row[5]
-            c_edit, c_del = actions_col.columns(2)
-            
-            # Edit Button
-            if c_edit.button("✏️", key=f"btn_edit_{item.id}", help="Editar"):
-                st.session_state.editing_product_id = item.id
-                st.rerun()
-                
-            # Delete Button
-            # Delete usually needs confirmation. 
-            # Simple way: Click delete -> Sets a "Confirm state" for this ID?
-            # Or use a popover if streamlit version supports it?
-            # Assuming standard buttons for now.
-            if c_del.button("🗑️", key=f"btn_del_{item.id}", help="Eliminar"):
-                st.warning(f"¿Borrar {item.nombre}?")
-                st.button("Sí, borrar", key=f"confirm_del_{item.id}", on_click=delete_handler, args=(item.id,))
-                
-    st.caption(f"Total de productos: {len(items)}")
+        if c3.button("Calcular", key="repo_calcular", use_container_width=True):
+            from src.services.forecast import pronosticar_reposicion
+            try:
+                with st.spinner("Calculando pronóstico..."):
+                    # Kept together with its brand: switching brands must not show the other one's result
+                    st.session_state.repo_resultado = {
+                        'marca': marca,
+                        'df': pronosticar_reposicion(marca, lead_time_dias=lead_time, cobertura_objetivo_dias=cobertura),
+                    }
+            except Exception as e:
+                st.error(f"Error calculando reposición: {e}")
+
+        resultado = st.session_state.get('repo_resultado')
+        df = resultado['df'] if resultado and resultado['marca'] == marca else None
+        if df is not None and not df.empty:
+            solo_reponer = st.checkbox("Solo productos a reponer", value=True, key="repo_solo_reponer")
+            if solo_reponer:
+                df = df[df['reorden_sugerido'] > 0]
+            st.dataframe(
+                df[['codigo', 'nombre', 'stock', 'consignado', 'venta_diaria', 'factor_estacional', 'dias_cobertura', 'reorden_sugerido']],
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "codigo": "Código",
+                    "nombre": "Producto",
+                    "stock": "Depósito",
+                    "consignado": "Consignado",
+                    "venta_diaria": st.column_config.NumberColumn("Venta/día", format="%.2f"),
+                    "factor_estacional": st.column_config.NumberColumn("Estacionalidad", format="x%.2f"),
+                    "dias_cobertura": st.column_config.NumberColumn("Días cobertura", format="%d"),
+                    "reorden_sugerido": st.column_config.NumberColumn("Pedir", format="%d"),
+                }
+            )
+
+def render_paginacion_productos(cursores, siguiente, n_filas, key_suffix="top"):
+    """Prev/Next over the keyset cursor stack kept in session_state."""
+    def ir_siguiente():
+        st.session_state.products_cursores.append(siguiente)
+
+    def ir_anterior():
+        st.session_state.products_cursores.pop()
+
+    p1, p2, p3 = st.columns([1, 2, 1])
+    p1.button("⬅️ Anterior", key=f"products_prev_{key_suffix}", disabled=len(cursores) <= 1, on_click=ir_anterior)
+    p2.caption(f"Página {len(cursores)} · {n_filas} productos")
+    p3.button("Siguiente ➡️", key=f"products_next_{key_suffix}", disabled=siguiente is None, on_click=ir_siguiente)
 
 def delete_handler(id):
     eliminar_producto(id)
+    st.session_state.pop('products_pagina', None)
     st.toast("Producto eliminado")
@@ -2,19 +2,25 @@ import streamlit as st
 import pandas as pd
 from typing import List
 from src.models import StockItem
-from src.services.postgres_service import leer_stock, crear_producto, actualizar_producto, eliminar_producto
+from src.services.almacenamiento import obtener_backend
+from src.ui.state_manager import require_brand_selection
 
-def get_stock_data():
+def get_stock_data(marca: str):
     """Cache-helper o llamada directa para obtener datos."""
     try:
-        data = leer_stock()
+        data = obtener_backend().leer_stock(marca)
         return data
     except Exception as e:
-        st.error(f"Error leyendo Stock de Google Sheets: {e}")
+        st.error(f"Error leyendo Stock: {e}")
         return []
 
 def render_stock_page():
-    st.title("Gestión de Stock")
+    """Catálogo sobre el backend de almacenamiento (la página Productos cuando no hay Postgres)."""
+    marca = require_brand_selection()
+    if not marca:
+        return
+
+    st.title(f"Gestión de Stock ({marca})")
     
     # ---------------------------------------------------------
     # 1. READ & VISUALIZE
@@ -26,7 +32,7 @@ def render_stock_page():
         st.cache_data.clear()
         st.rerun()
 
-    items: List[StockItem] = get_stock_data()
+    items: List[StockItem] = get_stock_data(marca)
     
     if not items:
         st.info("No hay ítems en el stock o no se pudo conectar.")
@@ -67,7 +73,7 @@ def render_stock_page():
         df_display = df[cols].copy()
 
         # Aplicamos estilo visual condicional usando pandas Styler
-        styler = df_display.style.applymap(
+        styler = df_display.style.map(
             lambda x: "color: red; font-weight: bold" if x == "BAJO STOCK" else "color: green; font-weight: bold",
             subset=["ESTADO"]
         )
@@ -89,9 +95,7 @@ def render_stock_page():
     st.subheader("Agregar Nuevo Producto")
     with st.expander("📝 Formulario de Alta"):
         with st.form("new_product_form"):
-            c1, c2 = st.columns(2)
-            new_id = c1.number_input("ID (Único)", min_value=1, step=1)
-            new_codigo = c2.text_input("Código SKU")
+            new_codigo = st.text_input("Código SKU")
             new_nombre = st.text_input("Nombre / Modelo")
             new_categoria = st.text_input("Categoría")
             c3, c4 = st.columns(2)
@@ -101,24 +105,22 @@ def render_stock_page():
             
             submitted = st.form_submit_button("Guardar Producto")
             if submitted:
-                # Validar ID unico (simple check local, idealmente en backend)
-                existing_ids = [i.id for i in items]
-                if new_id in existing_ids:
-                    st.error(f"El ID {new_id} ya existe.")
-                elif not new_nombre or not new_codigo:
+                if not new_nombre or not new_codigo:
                     st.error("Nombre y Código son obligatorios.")
                 else:
+                    # The backend assigns the id
                     new_item = StockItem(
-                        id=new_id,
+                        id=0,
                         codigo=new_codigo,
                         nombre=new_nombre,
                         categoria=new_categoria,
                         cantidad=new_cantidad,
                         precio_unitario=new_precio,
-                        min_stock=5
+                        min_stock=5,
+                        marca=marca
                     )
                     try:
-                        crear_producto(new_item)
+                        obtener_backend().crear_producto(new_item)
                         st.success("Producto creado exitosamente!")
                         st.rerun()
                     except Exception as e:
@@ -167,11 +169,12 @@ def render_stock_page():
                             categoria=selected_item.categoria,
                             cantidad=edit_cantidad,
                             precio_unitario=edit_precio,
-                            min_stock=selected_item.min_stock
+                            min_stock=selected_item.min_stock,
+                            marca=selected_item.marca
                         )
                         
                         try:
-                            actualizar_producto(updated_item)
+                            obtener_backend().actualizar_producto(updated_item)
                             st.success("Producto actualizado correctamente.")
                             st.rerun()
                         except Exception as e:
@@ -182,7 +185,7 @@ def render_stock_page():
                 st.write("Esta acción no se puede deshacer.")
                 if st.button("ELIMINAR DEFINITIVAMENTE", type="primary"):
                     try:
-                        eliminar_producto(selected_item.id)
+                        obtener_backend().eliminar_producto(selected_item.id)
                         st.success(f"Producto {selected_item.id} eliminado.")
                         st.rerun()
                     except Exception as e:
@@ -1,17 +1,60 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 from typing import List, Dict
-from src.services.postgres_service import leer_stock, registrar_venta
+from src.services.almacenamiento import backend_configurado, obtener_backend
+from src.services import diario_ventas
 from src.models import StockItem, Venta, VentaItem
 from src.config import TZ_AR
 
 def init_venta_state():
     if "cart" not in st.session_state:
         st.session_state.cart = [] # List of dicts or VentaItems
+    if "cart_total_bruto" not in st.session_state:
+        # Running total, updated on every add/clear instead of re-summing the cart
+        st.session_state.cart_total_bruto = sum(c["subtotal"] for c in st.session_state.cart)
     if "client_name" not in st.session_state:
         st.session_state.client_name = ""
 
+def agregar_al_carrito(item: StockItem, cantidad: int):
+    """Agrega una línea al carrito con precio y stock actuales del producto."""
+    subtotal = cantidad * item.precio_unitario
+    st.session_state.cart.append({
+        "producto_id": item.id,
+        "nombre": item.nombre, # modelo_placa
+        "cantidad": cantidad,
+        "precio_unitario": item.precio_unitario,
+        "subtotal": subtotal,
+        "stock_actual": item.cantidad, # for reference
+        "aviso": "⚠️" if cantidad > item.cantidad else ""
+    })
+    st.session_state.cart_total_bruto += subtotal
+
+def limpiar_carrito():
+    st.session_state.cart = []
+    st.session_state.cart_total_bruto = 0.0
+
+def agregar_por_codigo(marca: str):
+    """Callback del campo de escaneo: busca el código exacto y agrega 1 unidad."""
+    codigo = st.session_state.pos_scan.strip()
+    if not codigo:
+        return
+    try:
+        item = obtener_backend().buscar_producto_por_codigo(marca, codigo)
+    except Exception as e:
+        st.session_state.pos_scan_msg = ("error", f"Error buscando código: {e}")
+        return
+
+    if item is None:
+        st.session_state.pos_scan_msg = ("error", f"No existe el código '{codigo}' en {marca}.")
+    else:
+        agregar_al_carrito(item, 1)
+        if item.cantidad < 1:
+            st.session_state.pos_scan_msg = ("warning", f"⚠️ {item.nombre} agregado sin stock disponible ({item.cantidad}).")
+        else:
+            st.session_state.pos_scan_msg = ("success", f"{item.nombre} agregado.")
+    # Clear the field so the next scan starts empty
+    st.session_state.pos_scan = ""
+
 from src.ui.state_manager import require_brand_selection
 
 def render_ventas_page():
@@ -23,31 +66,48 @@ def render_ventas_page():
     init_venta_state()
     st.title(f"Nueva Venta 🛒 ({marca})")
 
-    from src.services.cliente_service import leer_clientes, crear_cliente
+    if 'pos_venta_msg' in st.session_state:
+        st.success(st.session_state.pop('pos_venta_msg'))
+
+    if diario_ventas.diario_habilitado():
+        render_conflictos_diario()
+
+    # Each block is a fragment: interacting with one reruns only that block,
+    # so adding a product never re-queries clients.
+    render_cliente_section(marca)
+    st.divider()
+    render_productos_carrito_section(marca)
+
+# ---------------------------------------------------------
+# 1. CLIENTE INFO (Search + Selector + Quick Add)
+# ---------------------------------------------------------
+@st.fragment
+def render_cliente_section(marca: str):
+    if backend_configurado() != "postgres":
+        # The client registry lives in Postgres only: with other backends the name is typed as-is
+        st.session_state.client_name = st.text_input(
+            "Cliente", placeholder="Nombre del cliente...", key="sb_client_libre"
+        ).strip()
+        return
+
+    from src.services.cliente_service import buscar_clientes, crear_cliente
     from src.models import Cliente
-    
-    # --- STEP 2: LOAD DATA & CONTEXT (Now Main Step) ---
 
-    # ---------------------------------------------------------
-    # 1. CLIENTE INFO (Selector + Quick Add)
-    # ---------------------------------------------------------
-    
-    # Refresh logic helper
-    if 'sales_force_refresh_clients' not in st.session_state:
-        st.session_state.sales_force_refresh_clients = False
+    # Layout: Search | Selector | Add Button (Small)
+    c_busq, c_sel, c_add = st.columns([2, 2, 1])
 
-    # Load Clients
+    # Only the top matches of the typed text are fetched (indexed search), never the whole table
+    texto_cliente = c_busq.text_input("Buscar cliente", placeholder="Nombre o CUIT...", key="sb_client_query")
     try:
-        clientes_list = leer_clientes(marca)
+        clientes_list = buscar_clientes(marca, texto_cliente, limite=20)
     except:
         clientes_list = []
         
-    client_options = {c.razon_social: c for c in clientes_list}
-    client_names = list(client_options.keys())
+    client_names = [c.razon_social for c in clientes_list]
+    # Keep the current selection available even when it is not among the matches
+    if st.session_state.client_name and st.session_state.client_name not in client_names:
+        client_names.insert(0, st.session_state.client_name)
 
-    # Layout: Selector (Large) | Add Button (Small)
-    c_sel, c_add = st.columns([3, 1])
-    
     # We use session state to hold the selected value if we want to auto-select new one
     # If adding new, we set index to the new one.
     
@@ -55,7 +115,7 @@ def render_ventas_page():
     selected_name = c_sel.selectbox(
         "Cliente", 
         options=client_names, 
-        index=client_names.index(st.session_state.client_name) if st.session_state.client_name in client_names else 0,
+        index=client_names.index(st.session_state.client_name) if st.session_state.client_name in client_names else None,
         placeholder="Seleccione un cliente...",
         key="sb_client_selector"
     )
@@ -84,79 +144,86 @@ def render_ventas_page():
                         st.success(f"Creado: {q_razon}")
                         st.session_state.client_name = q_razon # Auto select
                         st.session_state.show_quick_client_form = False
-                        st.rerun()
+                        st.rerun(scope="fragment")
                     except Exception as e:
                         st.error(f"{e}")
                 else:
                     st.error("Falta Razón Social")
-    st.divider()
 
-    # ---------------------------------------------------------
-    # 2. SELECCION DE PRODUCTOS
-    # ---------------------------------------------------------
+# ---------------------------------------------------------
+# 2. SELECCION DE PRODUCTOS + 3. CARRITO & TOTALES
+# ---------------------------------------------------------
+@st.fragment
+def render_productos_carrito_section(marca: str):
+    # Picker and cart share a fragment: an add has to redraw the cart, and a fragment
+    # can only rerun itself. The search result is kept so an add doesn't re-query it.
     st.subheader("Agregar Productos")
     
-    # Load Stock
-    try:
-        stock_items = leer_stock(marca)
-    except Exception as e:
-        stock_items = []
-        st.error(f"Error cargando stock: {e}")
+    # Scan / Enter: a barcode reader types the code + Enter, which adds one unit right away
+    st.text_input(
+        "Código / Escanear",
+        key="pos_scan",
+        placeholder="Escanee o escriba el código y presione Enter",
+        on_change=agregar_por_codigo,
+        args=(marca,)
+    )
+    if 'pos_scan_msg' in st.session_state:
+        dtype, msg = st.session_state.pop('pos_scan_msg')
+        if dtype == 'error': st.error(msg)
+        elif dtype == 'warning': st.warning(msg)
+        else: st.success(msg)
 
-    if stock_items:
-        # Prepare options: "Nombre (Stock: X)"
-        # Map label -> item object
-        item_map = {f"{i.nombre} (Stock: {i.cantidad})": i for i in stock_items}
-        
-        c1, c2, c3 = st.columns([3, 1, 1])
-        
-        selected_label = c1.selectbox("Seleccionar Producto", options=list(item_map.keys()))
+    # Search: only the top matches are fetched (indexed search), never the whole catalog
+    c1, c2, c3, c4 = st.columns([2, 3, 1, 1])
+    texto_producto = c1.text_input("Buscar producto", placeholder="Código o nombre...", key="pos_prod_query")
+
+    busqueda = (marca, texto_producto.strip())
+    cache = st.session_state.get('pos_prod_resultados')
+    if cache is not None and cache[0] == busqueda:
+        stock_items = cache[1]
+    else:
+        try:
+            stock_items = obtener_backend().buscar_productos(marca, texto_producto, limite=20) if texto_producto.strip() else []
+            st.session_state.pos_prod_resultados = (busqueda, stock_items)
+        except Exception as e:
+            stock_items = []
+            st.error(f"Error buscando productos: {e}")
+
+    # Prepare options: "Cod · Nombre (Stock: X) $Precio"
+    # Map label -> item object
+    item_map = {f"{i.codigo} · {i.nombre} (Stock: {i.cantidad}) ${i.precio_unitario:,.0f}": i for i in stock_items}
+
+    selected_label = c2.selectbox(
+        "Seleccionar Producto",
+        options=list(item_map.keys()),
+        placeholder="Escriba para buscar..." if not texto_producto.strip() else "Sin coincidencias",
+    )
+
+    # Determine max logic (if strict limit needed, but requirement said negative allowed, just warning)
+    qty_input = c3.number_input("Cantidad", min_value=1, value=1, step=1)
+
+    # Add Button
+    if c4.button("Agregar +", disabled=selected_label is None):
         selected_item: StockItem = item_map[selected_label]
-        
-        # Determine max logic (if strict limit needed, but requirement said negative allowed, just warning)
-        qty_input = c2.number_input("Cantidad", min_value=1, value=1, step=1)
-        
-        # Add Button
-        if c3.button("Agregar +"):
-            # Check if warning needed
-            if qty_input > selected_item.cantidad:
-                st.warning(f"⚠️ Cantidad solicitada ({qty_input}) supera stock actual ({selected_item.cantidad}).")
-            
-            # Create Cart Item
-            subtotal = qty_input * selected_item.precio_unitario
-            cart_item = {
-                "producto_id": selected_item.id,
-                "nombre": selected_item.nombre, # modelo_placa
-                "cantidad": qty_input,
-                "precio_unitario": selected_item.precio_unitario,
-                "subtotal": subtotal,
-                "stock_actual": selected_item.cantidad # for reference
-            }
-            st.session_state.cart.append(cart_item)
-            st.success(f"{selected_item.nombre} agregado.")
+        # Check if warning needed
+        if qty_input > selected_item.cantidad:
+            st.warning(f"⚠️ Cantidad solicitada ({qty_input}) supera stock actual ({selected_item.cantidad}).")
+
+        agregar_al_carrito(selected_item, qty_input)
+        st.success(f"{selected_item.nombre} agregado.")
 
-    # ---------------------------------------------------------
-    # 3. CARRITO & TOTALES
-    # ---------------------------------------------------------
     st.divider()
     st.subheader("Detalle de Venta")
     
     if st.session_state.cart:
-        # Display Cart
-        cart_df = pd.DataFrame(st.session_state.cart)
-        # Rename cols for display
-        display_df = cart_df[["nombre", "cantidad", "precio_unitario", "subtotal", "stock_actual"]]
-        
-        # Highlight logic if stock issue
-        def highlight_stock_warning(row):
-            if row['cantidad'] > row['stock_actual']:
-                return ['background-color: #ffeeba'] * len(row)
-            return [''] * len(row)
-            
+        # Display Cart straight from the list of lines (no DataFrame/Styler rebuild);
+        # lines over the current stock carry a ⚠️ flag set when they were added
         st.dataframe(
-            display_df.style.apply(highlight_stock_warning, axis=1),
+            st.session_state.cart,
             use_container_width=True,
-             column_config={
+            column_order=["aviso", "nombre", "cantidad", "precio_unitario", "subtotal", "stock_actual"],
+            column_config={
+                "aviso": st.column_config.TextColumn("", width="small", help="Cantidad mayor al stock actual"),
                 "precio_unitario": st.column_config.NumberColumn(format="$%.2f"),
                 "subtotal": st.column_config.NumberColumn(format="$%.2f")
             }
@@ -164,11 +231,11 @@ def render_ventas_page():
         
         # Remove Item?
         if st.button("Limpiar Carrito"):
-            st.session_state.cart = []
-            st.rerun()
+            limpiar_carrito()
+            st.rerun(scope="fragment")
             
         # Financials
-        total_bruto = sum(item["subtotal"] for item in st.session_state.cart)
+        total_bruto = st.session_state.cart_total_bruto
         
         c_fin1, c_fin2, c_fin3 = st.columns(3)
         c_fin1.metric("Total Bruto", f"${total_bruto:,.2f}")
@@ -214,17 +281,47 @@ def render_ventas_page():
                     items_objs.append(item_obj)
                 
                 try:
-                    with st.spinner("Procesando transacción..."):
-                        new_id = registrar_venta(venta_obj, items_objs)
-                    
-                    st.success(f"Venta #{new_id} registrada correctamente!")
+                    if diario_ventas.diario_habilitado():
+                        # Local journal: confirmed at disk speed, synced to the database in the background
+                        diario_ventas.obtener_sincronizador()
+                        numero = diario_ventas.registrar_venta(venta_obj, items_objs)
+                        msg = f"Venta provisoria P-{numero} guardada. Se registra en la base en segundo plano."
+                    else:
+                        with st.spinner("Procesando transacción..."):
+                            new_id = obtener_backend().registrar_venta(venta_obj, items_objs)
+                        msg = f"Venta #{new_id} registrada correctamente!"
                     
-                    # Reset State
-                    st.session_state.cart = []
+                    # Reset State (full rerun so the client block is cleared too)
+                    limpiar_carrito()
                     st.session_state.client_name = ""
-                    # st.experimental_rerun() # Optional
+                    st.session_state.pop('sb_client_libre', None)
+                    st.session_state.pop('pos_prod_resultados', None)
+                    st.session_state.pos_venta_msg = msg
+                    st.rerun()
                     
                 except Exception as e:
                     st.error(f"Error procesando venta: {e}")
     else:
         st.info("El carrito está vacío.")
+
+# ---------------------------------------------------------
+# DIARIO LOCAL (offline-first)
+# ---------------------------------------------------------
+def render_conflictos_diario():
+    """Ventas del diario que la base rechazó (p. ej. stock insuficiente): reintentar o descartar."""
+    conflictos = diario_ventas.leer_ventas(diario_ventas.CONFLICTO)
+    if not conflictos:
+        return
+    with st.expander(f"⛔ {len(conflictos)} venta(s) provisoria(s) en conflicto", expanded=True):
+        for c in conflictos:
+            col_info, col_reintentar, col_descartar = st.columns([6, 1, 1])
+            col_info.markdown(
+                f"**P-{c['numero']}** · {c['cliente']} · ${c['total_neto']:,.2f} · {c['items']} item(s)  \n"
+                f":red[{c['error']}]"
+            )
+            if col_reintentar.button("🔁", key=f"diario_reintentar_{c['numero']}", help="Reintentar (después de reponer stock)"):
+                diario_ventas.reintentar_conflicto(c['numero'])
+                st.rerun()
+            if col_descartar.button("🗑️", key=f"diario_descartar_{c['numero']}", help="Descartar la venta"):
+                diario_ventas.descartar_conflicto(c['numero'])
+                st.rerun()